@@ -0,0 +1,20 @@
+#!/usr/bin/python3
+
+# Stream H.264 over RTP. On the receiving machine, copy stream.sdp across and run:
+# ffplay -protocol_whitelist file,udp,rtp -fflags nobuffer -flags low_delay stream.sdp
+
+import time
+
+from picamera2_contrib import Picamera2
+from picamera2_contrib.encoders import H264Encoder
+from picamera2_contrib.outputs import RtpOutput
+
+picam2 = Picamera2()
+video_config = picam2.create_video_configuration({"size": (1280, 720)})
+picam2.configure(video_config)
+encoder = H264Encoder(1000000)
+
+output = RtpOutput("REMOTEIP", 5004, sdp_file="stream.sdp", max_bitrate=10000000)
+picam2.start_recording(encoder, output)
+time.sleep(20)
+picam2.stop_recording()
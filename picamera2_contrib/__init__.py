@@ -3,16 +3,23 @@ from concurrent.futures import TimeoutError
 
 import libcamera
 
+from .aio import AsyncioPreview, AsyncPicamera2
+from .callback_executor import CallbackExecutor
 from .configuration import CameraConfiguration, StreamConfiguration
 from .controls import Controls
-from .converters import YUV420_to_RGB
+from .converters import YUV420_to_RGB, YUV_to_RGB, YUVConverter
 from .job import CancelledError
 from .metadata import Metadata
+from .metadata_recorder import MetadataRecorder
 from .picamera2 import Picamera2, Preview
 from .platform import Platform, get_platform
+from .prepared_configuration import PreparedConfiguration
 from .remote import Pool, Process, RemoteMappedArray, RemoteRequest
-from .request import CompletedRequest, MappedArray
+from .request import CompletedRequest, LazyMetadata, MappedArray
+from .save_pipeline import SavePipeline
 from .sensor_format import SensorFormat
+from .subscription import BackpressurePolicy, Subscription
+from .tracing import FrameTracer
 
 if os.environ.get("XDG_SESSION_TYPE", None) == "wayland":
     # The code here works through the X wayland layer, but not otherwise.
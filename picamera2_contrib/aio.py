@@ -0,0 +1,310 @@
+"""Asyncio front-end for Picamera2"""
+
+import asyncio
+import concurrent.futures
+import contextlib
+from logging import getLogger
+
+_log = getLogger(__name__)
+
+
+class AsyncioPreview:
+    """
+    An event loop driver for Picamera2 that runs inside an asyncio event loop.
+
+    Rather than dedicating a thread to waiting on the camera, as the NullPreview does, the
+    camera's notification pipe is registered as a reader with the running asyncio loop, so
+    that process_requests gets called directly from the loop. Like the NullPreview, nothing
+    is actually displayed.
+    """
+
+    def __init__(self, x=None, y=None, width=None, height=None, transform=None):
+        """Initialise asyncio preview
+
+        The parameters are accepted only so that this is a drop-in replacement for the
+        other preview classes, and are otherwise ignored.
+        """
+        self.size = (width, height)
+        self.picam2 = None
+        self._loop = None
+
+    def start(self, picam2):
+        """Start the asyncio preview
+
+        This must be called from the thread that is running the asyncio event loop.
+
+        :param picam2: Picamera2 object
+        :type picam2: Picamera2
+        """
+        self._loop = asyncio.get_running_loop()
+        self.picam2 = picam2
+        picam2.attach_preview(self)
+        self._loop.add_reader(picam2.notifyme_r, self.handle_requests)
+
+    def handle_requests(self):
+        """Handle requests, called by the asyncio loop when the camera has signalled us."""
+        picam2 = self.picam2
+        if picam2 is None:
+            return
+        picam2.notifymeread.read()
+        try:
+            picam2.process_requests(self)
+        except Exception as e:
+            _log.exception("Exception during process_requests()", exc_info=e)
+            raise
+
+    def render_request(self, completed_request):
+        """Draw the camera image. For the AsyncioPreview, there is nothing to do."""
+        pass
+
+    def set_overlay(self, overlay):
+        """Sets overlay
+
+        :param overlay: Overlay
+        """
+        # This only exists so as to have the same interface as other preview windows.
+
+    def set_title_function(self, function):
+        pass
+
+    def stop(self):
+        """Stop preview"""
+        if self._loop is not None:
+            # remove_reader is not thread safe, so hand it to the loop if we're elsewhere.
+            try:
+                running = asyncio.get_running_loop() is self._loop
+            except RuntimeError:
+                running = False
+            if running:
+                self._loop.remove_reader(self.picam2.notifyme_r)
+            elif not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._loop.remove_reader, self.picam2.notifyme_r)
+            self._loop = None
+        self.picam2.detach_preview()
+        self.picam2 = None
+
+
+class AsyncPicamera2:
+    """
+    Asyncio front-end for a Picamera2 object, normally obtained through Picamera2.aio.
+
+    Each capture method dispatches the same job as the corresponding Picamera2 method, but
+    rather than blocking a thread in Job.get_result, it returns an awaitable that completes
+    when the camera event loop has finished the job. Many coroutines can therefore wait on
+    the camera concurrently without needing a thread each.
+
+    The camera event loop may be either the usual NullPreview (or any other preview) thread,
+    or the asyncio loop itself, which is what happens if the camera is started using the
+    start method here.
+
+    For example:
+
+    async def main():
+        picam2 = Picamera2()
+        picam2.aio.start(picam2.create_preview_configuration())
+        array = await picam2.aio.capture_array("main")
+        async for request in picam2.aio.requests("main"):
+            ...
+        await picam2.aio.stop()
+    """
+
+    def __init__(self, picam2):
+        """Create an asyncio front-end for the given Picamera2 object."""
+        self.picam2 = picam2
+
+    def start(self, config=None, show_preview=None):
+        """Start the camera, driving it from the running asyncio event loop.
+
+        This must be called from within a coroutine running on the asyncio loop. If another
+        event loop (such as a preview window) is already running, that one continues to be used.
+
+        config - if not None this is used to configure the camera.
+
+        show_preview - normally None, meaning the asyncio loop runs the camera, but any value
+            accepted by Picamera2.start can be given to run a different event loop.
+        """
+        if show_preview is None and not self.picam2._event_loop_running:
+            show_preview = AsyncioPreview()
+        self.picam2.start(config=config, show_preview=show_preview)
+
+    async def stop(self):
+        """Stop the camera.
+
+        Unlike Picamera2.stop, this will not block the asyncio loop (which could otherwise
+        deadlock when that loop is also running the camera).
+        """
+        picam2 = self.picam2
+        if not picam2.started:
+            return
+        if picam2._preview is not None and picam2._event_loop_running:
+            await self._wait(picam2.dispatch_functions([picam2.stop_], wait=False, immediate=True))
+        else:
+            picam2.stop_()
+
+    async def close(self):
+        """Stop the camera, detach any asyncio driven event loop and close the camera."""
+        await self.stop()
+        self.picam2.close()
+
+    async def _wait(self, job, release_result=False):
+        # Wait for the job without blocking the loop. If we get cancelled, the job still runs to
+        # completion in the camera event loop, so any request it returns must be handed back.
+        future = asyncio.wrap_future(job.future)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if release_result:
+                def release(f):
+                    if not f.cancelled() and f.exception() is None:
+                        f.result().release()
+                future.add_done_callback(release)
+            raise
+
+    async def _wait_saved(self, job):
+        # With a SavePipeline, capturing to a file gives a Future for the metadata, which we wait for too.
+        result = await self._wait(job)
+        if not isinstance(result, concurrent.futures.Future):
+            return result
+        try:
+            return await asyncio.wrap_future(result)
+        except asyncio.CancelledError:
+            if result.cancelled():
+                raise RuntimeError("The save pipeline dropped the image")
+            raise
+
+    async def wait(self, job):
+        """Wait for a job obtained from one of the Picamera2 methods (called with wait=False)."""
+        return await self._wait(job)
+
+    async def capture_file(self, file_output, name="main", format=None, exif_data=None):
+        """Capture an image to a file in the current camera mode, returning its metadata.
+
+        With a SavePipeline, this waits for the image to be saved, and raises a RuntimeError if it was dropped.
+        """
+        return await self._wait_saved(self.picam2.capture_file(file_output, name, format=format, wait=False,
+                                                               exif_data=exif_data))
+
+    async def capture_request(self, flush=None):
+        """Fetch the next completed request. The caller must release it when finished."""
+        return await self._wait(self.picam2.capture_request(wait=False, flush=flush), release_result=True)
+
+    async def capture_sync_request(self):
+        """Return the first request when the camera system has reached sychronisation point."""
+        return await self._wait(self.picam2.capture_sync_request(wait=False), release_result=True)
+
+    @contextlib.asynccontextmanager
+    async def captured_request(self, flush=None):
+        """Capture a completed request using an async context manager which guarantees its release."""
+        request = await self.capture_request(flush=flush)
+        try:
+            yield request
+        finally:
+            request.release()
+
+    async def capture_metadata(self):
+        """Fetch the metadata from the next camera frame."""
+        return await self._wait(self.picam2.capture_metadata(wait=False))
+
+    async def capture_buffer(self, name="main"):
+        """Make a 1d numpy array from the next frame in the named stream."""
+        return await self._wait(self.picam2.capture_buffer(name, wait=False))
+
+    async def capture_buffers(self, names=["main"]):
+        """Make a 1d numpy array from the next frame for each of the named streams."""
+        return await self._wait(self.picam2.capture_buffers(names, wait=False))
+
+    async def capture_array(self, name="main"):
+        """Make a 2d image from the next frame in the named stream."""
+        return await self._wait(self.picam2.capture_array(name, wait=False))
+
+    async def capture_arrays(self, names=["main"]):
+        """Make 2d image arrays from the next frames in the named streams."""
+        return await self._wait(self.picam2.capture_arrays(names, wait=False))
+
+    async def capture_burst(self, num_frames, names=["main"], out=None):
+        """Capture num_frames consecutive frames from the named streams into contiguous arrays."""
+        return await self._wait(self.picam2.capture_burst(num_frames, names, out=out, wait=False))
+
+    async def capture_image(self, name="main"):
+        """Make a PIL image from the next frame in the named stream."""
+        return await self._wait(self.picam2.capture_image(name, wait=False))
+
+    async def drop_frames(self, num_frames):
+        """Drop num_frames frames from the camera."""
+        return await self._wait(self.picam2.drop_frames(num_frames, wait=False))
+
+    async def switch_mode(self, camera_config):
+        """Switch the camera into another mode given by the camera_config."""
+        return await self._wait(self.picam2.switch_mode(camera_config, wait=False))
+
+    async def switch_mode_and_drop_frames(self, camera_config, num_frames):
+        """Switch the camera into the mode given by camera_config and drop the first num_frames frames."""
+        return await self._wait(self.picam2.switch_mode_and_drop_frames(camera_config, num_frames, wait=False))
+
+    async def switch_mode_and_capture_file(self, camera_config, file_output, name="main", format=None,
+                                           exif_data=None, delay=0):
+        """Switch the camera into a new (capture) mode, capture an image to file and switch back."""
+        return await self._wait_saved(self.picam2.switch_mode_and_capture_file(camera_config, file_output, name,
+                                                                               format=format, wait=False,
+                                                                               exif_data=exif_data, delay=delay))
+
+    async def switch_mode_and_capture_request(self, camera_config, delay=0):
+        """Switch the camera into a new (capture) mode, capture a request and switch back."""
+        return await self._wait(self.picam2.switch_mode_and_capture_request(camera_config, wait=False, delay=delay),
+                                release_result=True)
+
+    async def switch_mode_capture_request_and_stop(self, camera_config):
+        """Switch the camera into a new (capture) mode, capture a request and then stop the camera."""
+        return await self._wait(self.picam2.switch_mode_capture_request_and_stop(camera_config, wait=False),
+                                release_result=True)
+
+    async def switch_mode_and_capture_buffer(self, camera_config, name="main", delay=0):
+        """Switch the camera into a new (capture) mode, capture the first buffer and switch back."""
+        return await self._wait(self.picam2.switch_mode_and_capture_buffer(camera_config, name, wait=False,
+                                                                           delay=delay))
+
+    async def switch_mode_and_capture_buffers(self, camera_config, names=["main"], delay=0):
+        """Switch the camera into a new (capture) mode, capture the first buffers and switch back."""
+        return await self._wait(self.picam2.switch_mode_and_capture_buffers(camera_config, names, wait=False,
+                                                                            delay=delay))
+
+    async def switch_mode_and_capture_array(self, camera_config, name="main", delay=0):
+        """Switch the camera into a new (capture) mode, capture the image array and switch back."""
+        return await self._wait(self.picam2.switch_mode_and_capture_array(camera_config, name, wait=False,
+                                                                          delay=delay))
+
+    async def switch_mode_and_capture_arrays(self, camera_config, names=["main"], delay=0):
+        """Switch the camera into a new (capture) mode, capture the image arrays and switch back."""
+        return await self._wait(self.picam2.switch_mode_and_capture_arrays(camera_config, names, wait=False,
+                                                                           delay=delay))
+
+    async def switch_mode_and_capture_image(self, camera_config, name="main", delay=0):
+        """Switch the camera into a new (capture) mode, capture the image and switch back."""
+        return await self._wait(self.picam2.switch_mode_and_capture_image(camera_config, name, wait=False,
+                                                                          delay=delay))
+
+    async def autofocus_cycle(self):
+        """Run an autofocus cycle, returning True if it focuses successfully."""
+        return await self._wait(self.picam2.autofocus_cycle(wait=False))
+
+    async def requests(self, name="main", flush=None):
+        """Iterate asynchronously over completed requests that contain the named stream.
+
+        Each request is released automatically when the loop moves on to the next one (or exits),
+        so the caller must acquire it explicitly if it is to be kept for longer. Requests from
+        camera modes which do not have the named stream (for example, during a mode switch) are
+        skipped.
+
+        For example:
+
+        async for request in picam2.aio.requests("main"):
+            array = request.make_array("main")
+        """
+        while True:
+            request = await self.capture_request(flush=flush)
+            try:
+                if request.config.get(name) is None:
+                    continue
+                yield request
+            finally:
+                request.release()
@@ -0,0 +1,112 @@
+"""Run pre_callback and post_callback functions away from the camera event loop"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from logging import getLogger
+
+_log = getLogger(__name__)
+
+
+class CallbackExecutor:
+    """
+    A bounded worker pool for running the Picamera2 pre_callback and post_callback.
+
+    Normally these callbacks run synchronously in the camera event loop, so a slow one delays job
+    execution, encoding and the return of buffers to the camera for every stream. Assigning one of
+    these to Picamera2.callback_executor makes the callbacks run in the worker pool instead. The event
+    loop waits for them only until the deadline, after which any frame whose callback has not finished
+    skips it (and its post_callback, if it was the pre_callback that was late) and carries straight on
+    to the application and the encoders. Neither wait holds the Picamera2 lock, so applications taking
+    requests are never held up by them either. The callback keeps its own reference to the request, so a
+    late callback that is still running never sees its buffer returned to the camera underneath it.
+
+    For any one request, the post_callback always runs after the pre_callback has finished. Callbacks
+    for different requests may run in parallel, so use num_threads=1 if they are not thread safe.
+
+    Parameters:
+    num_threads - the number of worker threads.
+    deadline - the time in seconds that the event loop will wait for the callbacks for each batch of
+        requests. None means wait indefinitely.
+    max_pending - the greatest number of callbacks that may be queued or running at once. Frames arriving
+        when this many are outstanding skip their callback immediately. Defaults to twice num_threads.
+    """
+
+    def __init__(self, num_threads=2, deadline=0.02, max_pending=None):
+        """Create a callback executor."""
+        if num_threads < 1:
+            raise RuntimeError("num_threads must be at least 1")
+        self._pool = ThreadPoolExecutor(num_threads, thread_name_prefix="picamera2-callback")
+        self.deadline = deadline
+        self.max_pending = 2 * num_threads if max_pending is None else max_pending
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.callbacks_run = 0
+        self.frames_missed = 0
+
+    @property
+    def pending(self):
+        """The number of callbacks currently queued or running."""
+        return self._pending
+
+    def _call(self, callback, request):
+        try:
+            callback(request)
+        finally:
+            self._done(request)
+
+    def _done(self, request):
+        request.release()
+        with self._lock:
+            self._pending -= 1
+
+    def run(self, callback, requests, skip=()):
+        """Run the callback on each of the requests in the pool, waiting no longer than the deadline.
+
+        Requests listed in skip are passed over. Return the set of requests whose callback missed the
+        deadline.
+        """
+        start_time = time.monotonic()
+        futures = []
+        missed = set()
+        for req in requests:
+            if req in skip:
+                continue
+            with self._lock:
+                full = self._pending >= self.max_pending
+                if not full:
+                    self._pending += 1
+            if full:
+                missed.add(req)
+                continue
+            # The callback holds its own "use" of the request until it has finished.
+            req.acquire()
+            futures.append((req, self._pool.submit(self._call, callback, req)))
+
+        for req, future in futures:
+            timeout = None
+            if self.deadline is not None:
+                timeout = max(0, start_time + self.deadline - time.monotonic())
+            try:
+                future.result(timeout=timeout)
+                self.callbacks_run += 1
+            except FutureTimeoutError:
+                if future.cancel():
+                    # It never started, so _call won't be tidying up after it.
+                    self._done(req)
+                missed.add(req)
+            except Exception as e:
+                _log.exception("Exception in callback", exc_info=e)
+                self.callbacks_run += 1
+
+        self.frames_missed += len(missed)
+        return missed
+
+    def stats(self):
+        """Return a dictionary of this executor's counters."""
+        return {"callbacks_run": self.callbacks_run, "frames_missed": self.frames_missed, "pending": self._pending}
+
+    def shutdown(self, wait=True):
+        """Shut down the worker pool."""
+        self._pool.shutdown(wait=wait)
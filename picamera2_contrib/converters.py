@@ -31,3 +31,150 @@ def YUV420_to_RGB(YUV_in, size, matrix=YUV2RGB_JPEG, rb_swap=True, final_width=0
         RGB = RGB[:, :final_width, :]
 
     return RGB
+
+
+# Offsets of the luma sample within each 4-byte group, and of the U and V samples, for the packed 4:2:2 formats.
+_PACKED_422_OFFSETS = {"YUYV": (0, 1, 3), "YVYU": (0, 3, 1), "UYVY": (1, 0, 2), "VYUY": (1, 2, 0)}
+
+_FRACTION_BITS = 16
+
+
+class YUVConverter:
+    """
+    Converts YUV images to interleaved RGB at full or half resolution, using fixed-point arithmetic.
+
+    The conversion matrix is turned into lookup tables of scaled integer contributions when the converter
+    is created, so converting a frame needs only table lookups, integer additions and a shift, with the
+    chroma contributions being computed at chroma resolution and broadcast across the luma samples. The
+    working buffers are kept between frames, so a converter should be made once for a given stream and
+    then called for every frame. Converters are not thread safe.
+
+    The supported formats are YUV420, YVU420, NV12, NV21 and the packed 4:2:2 formats YUYV, YVYU, UYVY
+    and VYUY. The input may be the stream's buffer as a 1d array (as returned by capture_buffer) or the
+    2d array returned by capture_array.
+
+    Parameters:
+    format - the YUV format of the input.
+    size - the (width, height) of the image in pixels, excluding any padding.
+    stride - the number of bytes per row of the luma plane (or of the packed image). Defaults to no padding.
+    matrix - the YUV to RGB matrix, such as YUV2RGB_JPEG, YUV2RGB_SMPTE170M or YUV2RGB_REC709, applied
+        to (Y, U - 128, V - 128) exactly as YUV420_to_RGB does.
+    rb_swap - swap the red and blue channels, so that the output is in the same byte order as the
+        "RGB888" format (which is what YUV420_to_RGB also does by default).
+    half - produce a half resolution image, by taking every other luma sample in each direction.
+    """
+
+    def __init__(self, format, size, stride=None, matrix=YUV2RGB_JPEG, rb_swap=True, half=False):
+        """Create a YUV to RGB converter."""
+        w, h = size
+        if w % 2 or h % 2:
+            raise RuntimeError("YUV image dimensions must be even")
+        self.packed = format in _PACKED_422_OFFSETS
+        if not self.packed and format not in ("YUV420", "YVU420", "NV12", "NV21"):
+            raise RuntimeError(f"Format {format} not supported for YUV to RGB conversion")
+        if stride is None:
+            stride = 2 * w if self.packed else w
+        if stride < (2 * w if self.packed else w):
+            raise RuntimeError("stride is smaller than the image width")
+        self.format = format
+        self.size = (w, h)
+        self.stride = stride
+        self.half = half
+        self.output_shape = (h // 2, w // 2, 3) if half else (h, w, 3)
+
+        if rb_swap:
+            matrix = np.asarray(matrix)[:, [2, 1, 0]]
+        # tables[c][k][x] is the contribution of input k (Y, U or V) having value x to output channel c,
+        # scaled by 2^_FRACTION_BITS. The rounding term goes into the Y table.
+        scale = 1 << _FRACTION_BITS
+        values = np.arange(256, dtype=np.float64)
+        offsets = (0.0, 128.0, 128.0)
+        self._tables = [[None if matrix[k][c] == 0 else
+                         np.round(matrix[k][c] * (values - offsets[k]) * scale).astype(np.int32)
+                         for k in range(3)] for c in range(3)]
+        for c in range(3):
+            y_table = self._tables[c][0]
+            if y_table is None:
+                y_table = np.zeros(256, dtype=np.int32)
+            self._tables[c][0] = y_table + (scale >> 1)
+        # The usual matrices share a luma coefficient across all three channels.
+        self._shared_luma = all(np.array_equal(self._tables[c][0], self._tables[0][0]) for c in range(3))
+
+        out_h, out_w = self.output_shape[:2]
+        chroma_h = out_h if self.packed or half else out_h // 2
+        chroma_w = out_w if half else out_w // 2
+        self._factors = (out_h // chroma_h, out_w // chroma_w)
+        self._luma = np.empty((out_h, out_w), dtype=np.int32)
+        self._acc = np.empty((out_h, out_w), dtype=np.int32)
+        self._chroma = np.empty((chroma_h, chroma_w), dtype=np.int32)
+        self._chroma2 = np.empty((chroma_h, chroma_w), dtype=np.int32)
+
+    def _planes(self, buffer):
+        # Return views of the Y, U and V samples, subsampled as necessary for the output.
+        w, h = self.size
+        stride = self.stride
+        buffer = np.asarray(buffer).reshape(-1)
+        if self.packed:
+            y_offset, u_offset, v_offset = _PACKED_422_OFFSETS[self.format]
+            image = buffer[:stride * h].reshape(h, stride)[:, :2 * w].reshape(h, w // 2, 4)
+            if self.half:
+                return image[0::2, :, y_offset], image[0::2, :, u_offset], image[0::2, :, v_offset]
+            luma = image[:, :, [y_offset, y_offset + 2]].reshape(h, w)
+            return luma, image[:, :, u_offset], image[:, :, v_offset]
+
+        luma = buffer[:stride * h].reshape(h, stride)[:, :w]
+        chroma = buffer[stride * h:]
+        if self.format in ("NV12", "NV21"):
+            uv = chroma[:stride * (h // 2)].reshape(h // 2, stride)[:, :w].reshape(h // 2, w // 2, 2)
+            u, v = uv[:, :, 0], uv[:, :, 1]
+            if self.format == "NV21":
+                u, v = v, u
+        else:
+            plane_size = (stride // 2) * (h // 2)
+            u = chroma[:plane_size].reshape(h // 2, stride // 2)[:, :w // 2]
+            v = chroma[plane_size:2 * plane_size].reshape(h // 2, stride // 2)[:, :w // 2]
+            if self.format == "YVU420":
+                u, v = v, u
+        if self.half:
+            luma = luma[0::2, 0::2]
+        return luma, u, v
+
+    def __call__(self, buffer, out=None):
+        """Convert a YUV image, returning the RGB image. This is written into out, if it is given."""
+        if out is None:
+            out = np.empty(self.output_shape, dtype=np.uint8)
+        elif out.shape != self.output_shape or out.dtype != np.uint8:
+            raise RuntimeError(f"Output array must be uint8 with shape {self.output_shape}")
+        luma, u, v = self._planes(buffer)
+        fy, fx = self._factors
+        chroma_h, chroma_w = self._chroma.shape
+        acc = self._acc.reshape(chroma_h, fy, chroma_w, fx)
+        for c in range(3):
+            y_table, u_table, v_table = self._tables[c]
+            if c == 0 or not self._shared_luma:
+                np.take(y_table, luma, out=self._luma, mode="clip")
+            chroma = None
+            if u_table is not None:
+                chroma = np.take(u_table, u, out=self._chroma, mode="clip")
+            if v_table is not None:
+                if chroma is None:
+                    chroma = np.take(v_table, v, out=self._chroma, mode="clip")
+                else:
+                    chroma += np.take(v_table, v, out=self._chroma2, mode="clip")
+            if chroma is None:
+                np.copyto(self._acc, self._luma)
+            else:
+                np.add(self._luma.reshape(chroma_h, fy, chroma_w, fx), chroma[:, None, :, None], out=acc)
+            np.right_shift(self._acc, _FRACTION_BITS, out=self._acc)
+            np.clip(self._acc, 0, 255, out=self._acc)
+            out[:, :, c] = self._acc
+        return out
+
+
+def YUV_to_RGB(buffer, format, size, stride=None, matrix=YUV2RGB_JPEG, rb_swap=True, half=False, out=None):
+    """Convert a YUV image of any supported format to an interleaved RGB image at full or half resolution.
+
+    This is a convenience wrapper that creates a YUVConverter each time. To convert many frames, create
+    a YUVConverter once and call it for each frame instead.
+    """
+    return YUVConverter(format, size, stride=stride, matrix=matrix, rb_swap=rb_swap, half=half)(buffer, out=out)
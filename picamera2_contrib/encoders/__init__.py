@@ -10,6 +10,7 @@ from .jpeg_encoder import JpegEncoder
 from .libav_h264_encoder import LibavH264Encoder
 from .libav_mjpeg_encoder import LibavMjpegEncoder
 from .multi_encoder import MultiEncoder
+from .multi_rendition_encoder import MultiRenditionEncoder, Rendition
 
 _hw_encoder_available = get_platform() == Platform.VC4
 
@@ -9,7 +9,6 @@ try:
 except ModuleNotFoundError:  # pragma: no cover
     # PyAV is an optional dependency. Only audio encoding paths require it.
     av = None  # type: ignore
-from libcamera import controls
 
 import picamera2_contrib.formats as formats
 
@@ -81,6 +80,8 @@ class Encoder:
         self.sync_enable = False
         self.sync = threading.Event()
         self._first_audio_time = None
+        # The Picamera2 FrameTracer (if any) that was in use when we last encoded a frame.
+        self._tracer = None
 
     @property
     def running(self):
@@ -249,14 +250,17 @@ class Encoder:
         :param request: Request
         :type request: request
         """
+        self._tracer = request.picam2.tracer
+        if self._tracer is not None:
+            self._tracer.mark_request(request, "encode")
+
         if self.audio:
             self._audio_start.set()  # Signal the audio encode thread to start.
 
         # If "sync" has been requested, we must wait for the image metadata to say that we
         # don't need to wait any more. While waiting, we simply don't encode any frames.
         if self.sync_enable:
-            metadata = request.get_metadata()
-            if metadata.get('SyncReady', False):
+            if request.metadata.get('SyncReady', False):
                 self.sync_enable = False
                 self.sync.set()
             else:
@@ -346,16 +350,25 @@ class Encoder:
         :param keyframe: Whether frame is a keyframe or not, defaults to True
         :type keyframe: bool, optional
         """
-        with self._output_lock:
-            for out in self._output:
-                out.outputframe(frame, keyframe, timestamp, packet, audio)
+        tracer = self._tracer
+        if tracer is None or audio or timestamp is None or self.firsttimestamp is None:
+            with self._output_lock:
+                for out in self._output:
+                    out.outputframe(frame, keyframe, timestamp, packet, audio)
+        else:
+            key = self.firsttimestamp + timestamp
+            tracer.mark(key, "encoded")
+            with self._output_lock:
+                for out in self._output:
+                    out.outputframe(frame, keyframe, timestamp, packet, audio)
+            tracer.mark(key, "output_end")
 
     def _setup(self, quality):
         pass
 
     def _timestamp(self, request):
         # The sensor timestamp is the most accurate one, so we'll fetch that.
-        ts = int(request.request.metadata[controls.SensorTimestamp] / 1000)  # ns to us
+        ts = int(request.metadata["SensorTimestamp"] / 1000)  # ns to us
         if self.firsttimestamp is None:
             self.firsttimestamp = ts
             timestamp_us = 0
@@ -5,6 +5,7 @@ import simplejpeg
 from picamera2_contrib.encoders import Quality
 from picamera2_contrib.encoders.multi_encoder import MultiEncoder
 from picamera2_contrib.request import MappedArray
+from picamera2_contrib.subscription import BackpressurePolicy
 
 
 class JpegEncoder(MultiEncoder):
@@ -15,7 +16,8 @@ class JpegEncoder(MultiEncoder):
                     "BGR888": "RGB",
                     "RGB888": "BGR"}
 
-    def __init__(self, num_threads=4, q=None, colour_space=None, colour_subsampling='420'):
+    def __init__(self, num_threads=4, q=None, colour_space=None, colour_subsampling='420', max_in_flight=None,
+                 drop_policy=BackpressurePolicy.DROP_NEWEST, copy_frames=False):
         """Initialises Jpeg encoder
 
         :param num_threads: Number of threads to use, defaults to 4
@@ -27,8 +29,15 @@ class JpegEncoder(MultiEncoder):
         :param colour_subsampling: Colour subsampling, allows choice of YUV420, YUV422 or YUV444
             outputs. Defaults to '420'.
         :type colour_subsampling: str, optional
+        :param max_in_flight: Most frames waiting or being encoded, defaults to None (no limit)
+        :type max_in_flight: int, optional
+        :param drop_policy: Policy when max_in_flight is reached, defaults to BackpressurePolicy.DROP_NEWEST
+        :type drop_policy: BackpressurePolicy, optional
+        :param copy_frames: Whether to copy frames so that camera buffers are released at once, defaults to False
+        :type copy_frames: bool, optional
         """
-        super().__init__(num_threads=num_threads)
+        super().__init__(num_threads=num_threads, max_in_flight=max_in_flight, drop_policy=drop_policy,
+                         copy_frames=copy_frames)
         self.q = q
         self.colour_space = colour_space
         self.colour_subsampling = colour_subsampling
@@ -43,19 +52,31 @@ class JpegEncoder(MultiEncoder):
         :return: Jpeg image
         :rtype: bytes
         """
-        fmt = request.config[name]["format"]
         with MappedArray(request, name) as m:
-            if fmt == "YUV420":
-                width, height = request.config[name]['size']
-                Y = m.array[:height, :width]
-                reshaped = m.array.reshape((m.array.shape[0] * 2, m.array.strides[0] // 2))
-                U = reshaped[2 * height: 2 * height + height // 2, :width // 2]
-                V = reshaped[2 * height + height // 2:, :width // 2]
-                return simplejpeg.encode_jpeg_yuv_planes(Y, U, V, self.q)
-            if self.colour_space is None:
-                self.colour_space = self.FORMAT_TABLE[request.config[name]["format"]]
-            return simplejpeg.encode_jpeg(m.array, quality=self.q, colorspace=self.colour_space,
-                                          colorsubsampling=self.colour_subsampling)
+            return self.encode_array_func(m.array, request.config[name])
+
+    def encode_array_func(self, array, config):
+        """Performs encoding of an image array
+
+        :param array: Image, as MappedArray gives it
+        :type array: numpy.ndarray
+        :param config: Stream configuration
+        :type config: dict
+        :return: Jpeg image
+        :rtype: bytes
+        """
+        fmt = config["format"]
+        if fmt == "YUV420":
+            width, height = config['size']
+            Y = array[:height, :width]
+            reshaped = array.reshape((array.shape[0] * 2, array.strides[0] // 2))
+            U = reshaped[2 * height: 2 * height + height // 2, :width // 2]
+            V = reshaped[2 * height + height // 2:, :width // 2]
+            return simplejpeg.encode_jpeg_yuv_planes(Y, U, V, self.q)
+        if self.colour_space is None:
+            self.colour_space = self.FORMAT_TABLE[fmt]
+        return simplejpeg.encode_jpeg(array, quality=self.q, colorspace=self.colour_space,
+                                      colorsubsampling=self.colour_subsampling)
 
     def _setup(self, quality):
         # If an explicit quality was specified, use it, otherwise try to preserve any q value
@@ -0,0 +1,116 @@
+"""Make PyAV video frames from camera buffers, without copying them where possible"""
+
+import threading
+import weakref
+
+import av
+import numpy as np
+
+from ..request import MappedArray
+
+# Camera buffers are only wrapped directly when their rows and planes start on this alignment.
+_ALIGNMENT = 32
+
+
+class LibavFrameMaker:
+    """Turns the images in completed requests into PyAV VideoFrames for the libav encoders.
+
+    YUV420 images whose stride and base address are suitably aligned are wrapped as they are, so that
+    the codec reads the camera buffer directly. The request is then held until libav has let go of the
+    frame (which, for frame-threaded codecs, can be some frames later) and released at that moment,
+    with the buffer kept mapped for CPU access (so synchronised, for dma-buf buffers) until then.
+    Other YUV420 images, and any that arrive while max_held requests are already held, are copied into
+    one of a small pool of reusable frames instead, so the request needn't be held at all. The limit stops
+    a frame-threaded codec from keeping so many camera buffers that the camera runs out. RGB images are
+    wrapped as they are too, but PyAV converts them to the codec's format before the codec sees them.
+
+    Parameters:
+    av_format - the PyAV pixel format of the camera images.
+    width, height - the image size.
+    zero_copy - set to False to copy every YUV420 image, for example for comparison.
+    max_held - the most requests that may be held for libav at once, or None for no limit.
+    pool_size - the number of frames in the pool, best made larger than the number of frames the codec
+    keeps hold of.
+
+    The counters frames_wrapped and frames_copied record which path each frame took.
+    """
+
+    def __init__(self, av_format, width, height, zero_copy=True, max_held=None, pool_size=2):
+        """Create a frame maker for images of the given format and size."""
+        self.av_format = av_format
+        self.width = width
+        self.height = height
+        self.zero_copy = zero_copy
+        self.max_held = max_held
+        self._held = 0
+        self._held_lock = threading.Lock()
+        self._pool = [av.VideoFrame(width, height, "yuv420p") for _ in range(pool_size)] \
+            if av_format == "yuv420p" else []
+        self._next = 0
+        self.frames_wrapped = 0
+        self.frames_copied = 0
+
+    @property
+    def held(self):
+        """The number of requests currently held until libav has finished with them."""
+        return self._held
+
+    def _can_wrap(self, array):
+        stride = array.strides[0]
+        return self.zero_copy and (self.max_held is None or self._held < self.max_held) and \
+            array.strides[1] == 1 and stride % _ALIGNMENT == 0 and array.ctypes.data % _ALIGNMENT == 0 and \
+            self.height % 2 == 0 and array.shape[0] >= self.height * 3 // 2
+
+    def _release(self, request, mapped, counted):
+        # Called from whichever thread libav drops its last reference to the frame in. Only now has
+        # libav finished reading the camera buffer, so only now do we end CPU access to it.
+        mapped.__exit__(None, None, None)
+        if counted:
+            with self._held_lock:
+                self._held -= 1
+        request.release()
+
+    def _copy_to_pool(self, array):
+        frame = self._pool[self._next]
+        self._next = (self._next + 1) % len(self._pool)
+        # If the codec still has hold of this frame, libav gives it fresh buffers rather than let us
+        # overwrite the ones in use.
+        frame.make_writable()
+        width, height = self.width, self.height
+        reshaped = array.reshape((array.shape[0] * 2, array.strides[0] // 2))
+        planes = (array[:height, :width],
+                  reshaped[2 * height: 2 * height + height // 2, :width // 2],
+                  reshaped[2 * height + height // 2: 3 * height, :width // 2])
+        for plane, source in zip(frame.planes, planes):
+            destination = np.frombuffer(plane, dtype=np.uint8).reshape((plane.height, plane.line_size))
+            destination[:, :plane.width] = source
+        self.frames_copied += 1
+        return frame
+
+    def make_frame(self, request, stream):
+        """Return a VideoFrame holding the named stream's image from the request."""
+        mapped = MappedArray(request, stream)
+        array = mapped.__enter__().array
+        yuv = self.av_format == "yuv420p"
+        if yuv and not self._can_wrap(array):
+            try:
+                return self._copy_to_pool(array)
+            finally:
+                mapped.__exit__(None, None, None)
+        # A wrapped frame needs its own view of the buffer, which nothing but the frame refers to.
+        view = array[:self.height * 3 // 2] if yuv else array.view()
+        del array
+        try:
+            frame = av.VideoFrame.from_numpy_buffer(view, format=self.av_format, width=self.width)
+        except Exception:
+            mapped.__exit__(None, None, None)
+            raise
+        request.acquire()
+        if yuv:
+            with self._held_lock:
+                self._held += 1
+            self.frames_wrapped += 1
+        # PyAV keeps the view alive for as long as libav holds any reference to the frame's buffer, which
+        # for RGB images is until the frame has been converted for the codec.
+        weakref.finalize(view, self._release, request, mapped, yuv)
+        return frame
@@ -1,6 +1,5 @@
 """This is a base class for a multi-threaded software encoder."""
 
-import collections
 import time
 from fractions import Fraction
 from math import sqrt
@@ -9,12 +8,18 @@ import av
 
 import picamera2_contrib.platform as Platform
 from picamera2_contrib.encoders.encoder import Encoder, Quality
-
-from ..request import MappedArray
+from picamera2_contrib.encoders.libav_frames import LibavFrameMaker
 
 
 class LibavH264Encoder(Encoder):
-    """Encoder class that uses libx264 for h.264 encoding."""
+    """Encoder class that uses libx264 for h.264 encoding.
+
+    YUV420 frames are passed to libav without being copied where possible (see LibavFrameMaker),
+    holding at most max_held_requests camera buffers for it. Set zero_copy to False to copy every frame.
+
+    Setting enable_roi before starting allows set_roi to give regions of the image (such as detected
+    faces or number plates) a different quality from the rest of it.
+    """
 
     def __init__(self, bitrate=None, repeat=True, iperiod=30, framerate=30, qp=None, profile=None):
         """Initialise"""
@@ -31,8 +36,13 @@ class LibavH264Encoder(Encoder):
         self.threads = 0  # means "you choose"
         self._lasttimestamp = None
         self._use_hw = False
-        self._request_release_delay = 1
-        self._request_release_queue = None
+        self.zero_copy = True
+        self.max_held_requests = 2
+        self._frame_maker = None
+        self.enable_roi = False
+        self._roi = ()
+        self._roi_graph = None
+        self._roi_graph_regions = None
         self._key_frames_requested = 0
         self._key_frames_generated = 0
 
@@ -119,6 +129,13 @@ class LibavH264Encoder(Encoder):
 
         self._stream.codec_context.time_base = Fraction(1, 1000000)
         self._stream.codec_context.options["tune"] = "zerolatency"
+        if self.enable_roi:
+            if self._use_hw:
+                raise RuntimeError("Regions of interest are not supported by the hardware encoder")
+            # libx264 ignores regions of interest without adaptive quantisation, which "ultrafast" turns off.
+            self._stream.codec_context.options["x264-params"] = "aq-mode=1"
+        self._roi_graph = None
+        self._roi_graph_regions = None
 
         FORMAT_TABLE = {"YUV420": "yuv420p",
                         "BGR888": "rgb24",
@@ -127,7 +144,8 @@ class LibavH264Encoder(Encoder):
                         "XRGB8888": "bgra"}
         self._av_input_format = FORMAT_TABLE[self._format]
 
-        self._request_release_queue = collections.deque()
+        self._frame_maker = LibavFrameMaker(self._av_input_format, self.width, self.height,
+                                            zero_copy=self.zero_copy, max_held=self.max_held_requests)
 
     def _stop(self):
         if not self.drop_final_frames:
@@ -142,25 +160,86 @@ class LibavH264Encoder(Encoder):
                         time.sleep(delay_us / 1000000)
                 self._lasttimestamp = (time.monotonic_ns(), packet.pts)
                 self.outputframe(bytes(packet), packet.is_keyframe, timestamp=packet.pts, packet=packet)
-        while self._request_release_queue:
-            self._request_release_queue.popleft().release()
+        # Closing the container frees any frames libav still holds, which releases their requests.
         self._container.close()
 
+    def stats(self):
+        """Return a dictionary of how many frames were passed to libav without and with copying."""
+        maker = self._frame_maker
+        return {"frames_wrapped": maker.frames_wrapped if maker else 0,
+                "frames_copied": maker.frames_copied if maker else 0}
+
+    def set_roi(self, regions, qp_offset=-10, background_qp_offset=0):
+        """Set the regions of interest to encode at a different quality, from the next frame onwards.
+
+        Each region is an (x, y, width, height) rectangle in the pixel coordinates of the stream being
+        encoded, as returned by IMX500.convert_inference_coords, optionally followed by its own QP offset.
+        Negative QP offsets give better quality, and each step of 6 roughly halves or doubles the bits
+        spent. Where regions overlap, the earlier one wins. The rest of the image is encoded with
+        background_qp_offset, so a positive value saves bandwidth when the regions are all that matter.
+        Calling this from a pre_callback or post_callback applies the regions to that request's frame.
+        Pass no regions and no background offset to go back to encoding the whole image evenly. Regions
+        of interest have little effect if a fixed qp has been set.
+
+        :param regions: Rectangles, each optionally with its own QP offset
+        :type regions: List[tuple]
+        :param qp_offset: QP offset for regions that don't have their own, defaults to -10
+        :type qp_offset: int, optional
+        :param background_qp_offset: QP offset for the rest of the image, defaults to 0
+        :type background_qp_offset: int, optional
+        """
+        if not self.enable_roi:
+            raise RuntimeError("enable_roi must be set before the encoder is started")
+        roi = []
+        for region in regions or ():
+            x, y, width, height, *offset = region
+            roi.append((int(x), int(y), int(width), int(height), int(offset[0] if offset else qp_offset)))
+        if background_qp_offset:
+            roi.append((0, 0, 1 << 30, 1 << 30, int(background_qp_offset)))
+        # Replacing the tuple in one go means the encode thread never sees it half made.
+        self._roi = tuple(roi)
+
+    def _apply_roi(self, frame):
+        # Attach the regions of interest to the frame as side data (which is what libx264 reads) using
+        # libav's "addroi" filter. The filter graph is only rebuilt when the regions change.
+        roi = self._roi
+        if not roi:
+            return frame
+        if roi != self._roi_graph_regions:
+            graph = av.filter.Graph()
+            last = graph.add_buffer(width=self.width, height=self.height, format=self._av_input_format,
+                                    time_base=Fraction(1, 1000000))
+            for x, y, width, height, qp_offset in roi:
+                # Clip to the image, and drop any regions that end up empty.
+                x0, y0 = min(max(x, 0), self.width), min(max(y, 0), self.height)
+                x1, y1 = min(max(x + width, 0), self.width), min(max(y + height, 0), self.height)
+                if x1 <= x0 or y1 <= y0:
+                    continue
+                # libx264 multiplies the offset by its QP range of 51.
+                qoffset = Fraction(max(-51, min(qp_offset, 51)), 51)
+                addroi = graph.add("addroi", f"x={x0}:y={y0}:w={x1 - x0}:h={y1 - y0}:qoffset={qoffset}")
+                last.link_to(addroi)
+                last = addroi
+            sink = graph.add("buffersink")
+            last.link_to(sink)
+            graph.configure()
+            self._roi_graph = graph
+            self._roi_graph_regions = roi
+        self._roi_graph.push(frame)
+        return self._roi_graph.pull()
+
     def _encode(self, stream, request):
-        request.acquire()
-        self._request_release_queue.append(request)
         timestamp_us = self._timestamp(request)
-        with MappedArray(request, stream) as m:
-            frame = av.VideoFrame.from_numpy_buffer(m.array, format=self._av_input_format, width=self.width)
-            frame.pts = timestamp_us
-            if self._key_frames_requested > self._key_frames_generated:
-                self._key_frames_generated += 1
-                frame.pict_type = "I"
-            for packet in self._stream.encode(frame):
-                self._lasttimestamp = (time.monotonic_ns(), packet.pts)
-                self.outputframe(bytes(packet), packet.is_keyframe, timestamp=packet.pts, packet=packet)
-        while len(self._request_release_queue) > self._request_release_delay:
-            self._request_release_queue.popleft().release()
+        frame = self._frame_maker.make_frame(request, stream)
+        frame.pts = timestamp_us
+        if self.enable_roi:
+            frame = self._apply_roi(frame)
+        if self._key_frames_requested > self._key_frames_generated:
+            self._key_frames_generated += 1
+            frame.pict_type = "I"
+        for packet in self._stream.encode(frame):
+            self._lasttimestamp = (time.monotonic_ns(), packet.pts)
+            self.outputframe(bytes(packet), packet.is_keyframe, timestamp=packet.pts, packet=packet)
 
     def force_key_frame(self):
         """Force a key frame to be encoded in the video stream as soon as possible."""
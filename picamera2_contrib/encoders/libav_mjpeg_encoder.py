@@ -1,17 +1,20 @@
 """This is a base class for a multi-threaded software encoder."""
 
-import collections
 from fractions import Fraction
 
 import av
 
 from picamera2_contrib.encoders.encoder import Encoder, Quality
-
-from ..request import MappedArray
+from picamera2_contrib.encoders.libav_frames import LibavFrameMaker
 
 
 class LibavMjpegEncoder(Encoder):
-    """Encoder class that uses libx264 for h.264 encoding."""
+    """Encoder class that uses libav for MJPEG encoding.
+
+    YUV420 frames are passed to libav without being copied where possible (see LibavFrameMaker). The
+    codec's frame threads keep hold of several frames at once, so at most max_held_requests camera buffers
+    are held for it, and further frames are copied. Set zero_copy to False to copy every frame.
+    """
 
     def __init__(self, bitrate=None, repeat=True, iperiod=30, framerate=30, qp=None):
         """Initialise"""
@@ -22,8 +25,10 @@ class LibavMjpegEncoder(Encoder):
         self.iperiod = iperiod
         self.framerate = framerate
         self.qp = qp
-        self._request_release_delay = 1
-        self._request_release_queue = None
+        self.threads = 8
+        self.zero_copy = True
+        self.max_held_requests = 2
+        self._frame_maker = None
 
     def _setup(self, quality):
         # If an explicit quality was specified, use it, otherwise try to preserve any bitrate/qp
@@ -42,7 +47,7 @@ class LibavMjpegEncoder(Encoder):
         self._container = av.open("/dev/null", "w", format="null")
         self._stream = self._container.add_stream(self._codec, rate=self.framerate)
 
-        self._stream.codec_context.thread_count = 8
+        self._stream.codec_context.thread_count = self.threads
         self._stream.codec_context.thread_type = av.codec.context.ThreadType.FRAME  # noqa
 
         self._stream.width = self.width
@@ -80,21 +85,26 @@ class LibavMjpegEncoder(Encoder):
                         "XRGB8888": "bgra"}
         self._av_input_format = FORMAT_TABLE[self._format]
 
-        self._request_release_queue = collections.deque()
+        # The pool is big enough that a frame the codec still holds is rarely reused.
+        self._frame_maker = LibavFrameMaker(self._av_input_format, self.width, self.height,
+                                            zero_copy=self.zero_copy, max_held=self.max_held_requests,
+                                            pool_size=self.threads + 2)
 
     def _stop(self):
         for packet in self._stream.encode():
             self.outputframe(bytes(packet), packet.is_keyframe, timestamp=packet.pts, packet=packet)
-        while self._request_release_queue:
-            self._request_release_queue.popleft().release()
+        # Closing the container frees any frames libav still holds, which releases their requests.
         self._container.close()
 
+    def stats(self):
+        """Return a dictionary of how many frames were passed to libav without and with copying."""
+        maker = self._frame_maker
+        return {"frames_wrapped": maker.frames_wrapped if maker else 0,
+                "frames_copied": maker.frames_copied if maker else 0}
+
     def _encode(self, stream, request):
         timestamp_us = self._timestamp(request)
-        with MappedArray(request, stream) as m:
-            frame = av.VideoFrame.from_numpy_buffer(m.array, format=self._av_input_format, width=self.width)
-            frame.pts = timestamp_us
-            for packet in self._stream.encode(frame):
-                self.outputframe(bytes(packet), packet.is_keyframe, timestamp=packet.pts, packet=packet)
-        while len(self._request_release_queue) > self._request_release_delay:
-            self._request_release_queue.popleft().release()
+        frame = self._frame_maker.make_frame(request, stream)
+        frame.pts = timestamp_us
+        for packet in self._stream.encode(frame):
+            self.outputframe(bytes(packet), packet.is_keyframe, timestamp=packet.pts, packet=packet)
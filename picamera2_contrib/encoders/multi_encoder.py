@@ -1,10 +1,14 @@
 """This is a base class for a multi-threaded software encoder."""
 
-import queue
+import collections
 import threading
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import numpy as np
 
 from picamera2_contrib.encoders.encoder import Encoder
+from picamera2_contrib.request import MappedArray
+from picamera2_contrib.subscription import BackpressurePolicy
 
 
 class MultiEncoder(Encoder):
@@ -16,34 +20,92 @@ class MultiEncoder(Encoder):
     Parameters:
     num_threads - the number of parallel threads to use. Probably match this to the number of cores available for
     best performance.
+    max_in_flight - the most frames that may be waiting or being encoded at once, or None for no limit.
+    Every one of these frames holds a camera buffer (unless copy_frames is set), so if encoding falls
+    behind without a limit, the camera eventually runs out of buffers and everything stalls.
+    drop_policy - what to do with a new frame when max_in_flight frames are already in flight.
+    BackpressurePolicy.DROP_NEWEST drops the new frame. BackpressurePolicy.DROP_OLDEST skips to the latest
+    frame, dropping frames that are waiting and have not started encoding yet (and the new frame only if
+    there are none of those).
+    copy_frames - copy each frame into a reusable array and release the camera buffer straight away, rather
+    than holding it until the frame is encoded. The derived class must then provide encode_array_func.
+
+    The counters frames_dropped and max_queue_depth, and the queue_depth property, show how well the encoder
+    is keeping up.
     """
 
-    def __init__(self, num_threads=4):
+    def __init__(self, num_threads=4, max_in_flight=None, drop_policy=BackpressurePolicy.DROP_NEWEST,
+                 copy_frames=False):
         """Initialise mult-threaded encoder
 
         :param num_threads: Number of threads to use, defaults to 4
         :type num_threads: int, optional
+        :param max_in_flight: Most frames waiting or being encoded, defaults to None (no limit)
+        :type max_in_flight: int, optional
+        :param drop_policy: Policy when max_in_flight is reached, defaults to BackpressurePolicy.DROP_NEWEST
+        :type drop_policy: BackpressurePolicy, optional
+        :param copy_frames: Whether to copy frames so that camera buffers are released at once, defaults to False
+        :type copy_frames: bool, optional
         """
         super().__init__()
+        if max_in_flight is not None and max_in_flight < 1:
+            raise RuntimeError("max_in_flight must be at least 1")
+        if drop_policy not in (BackpressurePolicy.DROP_NEWEST, BackpressurePolicy.DROP_OLDEST):
+            raise RuntimeError("drop_policy must be DROP_NEWEST or DROP_OLDEST")
         self.threads = ThreadPoolExecutor(num_threads)
-        self.tasks = queue.Queue()
+        self.max_in_flight = max_in_flight
+        self.drop_policy = drop_policy
+        self.copy_frames = copy_frames
+        # The (future, request) pairs for frames in flight, in frame order. The request is None when frames
+        # are copied, and an entry of None tells the output thread to stop.
+        self.tasks = collections.deque()
+        self._tasks_cond = threading.Condition()
+        self._frame_pool = []
+        self.frames_dropped = 0
+        self.max_queue_depth = 0
+
+    @property
+    def queue_depth(self):
+        """The number of frames waiting or being encoded."""
+        return sum(task is not None for task in self.tasks)
+
+    def stats(self):
+        """Return a dictionary of this encoder's counters."""
+        return {"frames_encoded": self.frames_encoded, "frames_dropped": self.frames_dropped,
+                "queue_depth": self.queue_depth, "max_queue_depth": self.max_queue_depth}
 
     def _start(self):
+        if self.copy_frames and type(self).encode_array_func is MultiEncoder.encode_array_func:
+            raise RuntimeError(f"{type(self).__name__} does not support copy_frames")
+        self.frames_dropped = 0
+        self.max_queue_depth = 0
         self.thread = threading.Thread(target=self.output_thread, daemon=True)
         self.thread.start()
 
     def _stop(self):
-        self.tasks.put(None)
+        with self._tasks_cond:
+            self.tasks.append(None)
+            self._tasks_cond.notify()
         self.thread.join()
 
     def output_thread(self):
         """Outputs frame"""
         while True:
-            task = self.tasks.get()
+            with self._tasks_cond:
+                self._tasks_cond.wait_for(lambda: self.tasks)
+                task = self.tasks[0]
             if task is None:
+                with self._tasks_cond:
+                    self.tasks.popleft()
                 return
 
-            buffer, timestamp_us = task.result()
+            try:
+                buffer, timestamp_us = task[0].result()
+            except CancelledError:
+                # Whoever cancelled the frame has already removed it.
+                continue
+            with self._tasks_cond:
+                self.tasks.popleft()
             if self.output:
                 self.outputframe(buffer, timestamp=timestamp_us)
 
@@ -58,6 +120,53 @@ class MultiEncoder(Encoder):
         request.release()
         return (buffer, timestamp_us)
 
+    def do_encode_array(self, array, config, timestamp_us):
+        """Encodes a copied frame in a thread, and returns the array to the pool
+
+        :param array: Copy of the frame
+        :param config: Stream configuration
+        :param timestamp_us: Timestamp of the frame
+        :return: Buffer
+        """
+        buffer = self.encode_array_func(array, config)
+        with self._tasks_cond:
+            self._frame_pool.append(array)
+        return (buffer, timestamp_us)
+
+    def _count_drop(self):
+        # Encoder.encode counts every frame it hands to _encode as encoded, so take dropped ones back off.
+        self.frames_dropped += 1
+        self.frames_encoded -= 1
+
+    def _make_room(self):
+        # Called with the tasks lock held. Returns whether another frame may be put in flight.
+        if self.max_in_flight is None or self.queue_depth < self.max_in_flight:
+            return True
+        if self.drop_policy == BackpressurePolicy.DROP_OLDEST:
+            for task in list(self.tasks):
+                if self.queue_depth < self.max_in_flight:
+                    break
+                # Frames that have started encoding can't be cancelled.
+                if task is not None and task[0].cancel():
+                    self.tasks.remove(task)
+                    if task[1] is not None:
+                        task[1].release()
+                    self._count_drop()
+        return self.queue_depth < self.max_in_flight
+
+    def _copy_frame(self, request, stream):
+        with MappedArray(request, stream, write=False) as m:
+            array = None
+            while self._frame_pool:
+                array = self._frame_pool.pop()
+                if array.shape == m.array.shape and array.dtype == m.array.dtype:
+                    break
+                array = None
+            if array is None:
+                array = np.empty_like(m.array)
+            np.copyto(array, m.array)
+        return array
+
     def _encode(self, stream, request):
         """Encode frame using a thread
 
@@ -65,9 +174,29 @@ class MultiEncoder(Encoder):
         :param request: Request
         """
         if self._running:
-            request.acquire()
-            self.tasks.put(self.threads.submit(self.do_encode, request, stream))
+            with self._tasks_cond:
+                if not self._make_room():
+                    self._count_drop()
+                    return
+                if self.copy_frames:
+                    array = self._copy_frame(request, stream)
+                    future = self.threads.submit(self.do_encode_array, array, request.config[stream],
+                                                 self._timestamp(request))
+                    self.tasks.append((future, None))
+                else:
+                    request.acquire()
+                    self.tasks.append((self.threads.submit(self.do_encode, request, stream), request))
+                self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+                self._tasks_cond.notify()
 
     def encode_func(self, request, name):
         """Empty function, which will be overriden"""
         return b""
+
+    def encode_array_func(self, array, config):
+        """Function to encode a copied frame when copy_frames is set, which will be overriden
+
+        :param array: Copy of the frame, as MappedArray would give it
+        :param config: Stream configuration
+        """
+        return b""
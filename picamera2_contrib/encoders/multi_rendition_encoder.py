@@ -0,0 +1,257 @@
+"""Encode each frame as several JPEGs of different sizes and qualities"""
+
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+import simplejpeg
+
+from picamera2_contrib.encoders import Quality
+from picamera2_contrib.encoders.jpeg_encoder import JpegEncoder
+from picamera2_contrib.encoders.multi_encoder import MultiEncoder
+from picamera2_contrib.outputs import Output
+from picamera2_contrib.request import MappedArray
+from picamera2_contrib.subscription import BackpressurePolicy
+
+
+class Rendition:
+    """One size and quality of JPEG that a MultiRenditionEncoder makes from every frame.
+
+    Parameters:
+    output - the Output, or list of Outputs, that receive this rendition.
+    size - the (width, height) of the JPEG, or None for the size of the stream. Sizes are rounded down
+    to even numbers for YUV420 streams.
+    quality - the JPEG quality (0 to 100), or None to follow the quality the encoder is started with.
+    colour_subsampling - '420', '422' or '444'. JPEGs made from YUV420 streams are always 4:2:0.
+    name - the camera stream to encode, or None for the stream that the encoder was started on.
+    """
+
+    def __init__(self, output, size=None, quality=None, colour_subsampling='420', name=None):
+        """Creates a rendition
+
+        :param output: Output or list of Outputs for this rendition
+        :type output: Output or List[Output]
+        :param size: Size of the JPEG, defaults to None (the stream size)
+        :type size: tuple, optional
+        :param quality: JPEG quality, defaults to None (the encoder's quality)
+        :type quality: int, optional
+        :param colour_subsampling: Colour subsampling for RGB streams, defaults to '420'
+        :type colour_subsampling: str, optional
+        :param name: Stream name, defaults to None (the encoder's stream)
+        :type name: str, optional
+        """
+        if isinstance(output, Output):
+            output = [output]
+        elif not isinstance(output, list) or not all(isinstance(out, Output) for out in output):
+            raise RuntimeError("Must pass Output")
+        self.output = output
+        self.size = size
+        self.quality = quality
+        self.colour_subsampling = colour_subsampling
+        self.name = name
+        self.frames_encoded = 0
+
+    def __repr__(self):
+        return f"<Rendition {self.name or 'stream'} size={self.size} quality={self.quality}>"
+
+
+def _resize_plane(plane, width, height):
+    # Shrink an image plane (with optional channels) to the given size. We average boxes of pixels
+    # by the largest whole factor that doesn't go below the target, and pick the nearest pixels from
+    # what's left, which is cheap and looks a great deal better than picking pixels on their own.
+    if plane.shape[1] == width and plane.shape[0] == height:
+        return plane
+    factor = max(1, min(plane.shape[1] // width, plane.shape[0] // height))
+    if factor > 1:
+        rows, cols = plane.shape[0] // factor, plane.shape[1] // factor
+        boxes = plane[:rows * factor, :cols * factor].reshape((rows, factor, cols, factor) + plane.shape[2:])
+        plane = (boxes.sum(axis=(1, 3), dtype=np.uint32) // (factor * factor)).astype(np.uint8)
+    if plane.shape[1] != width or plane.shape[0] != height:
+        rows = np.arange(height) * plane.shape[0] // height
+        cols = np.arange(width) * plane.shape[1] // width
+        plane = plane.take(rows, axis=0).take(cols, axis=1)
+    return plane
+
+
+class _RenditionFrame:
+    # Tracks the renditions of one frame being encoded across the thread pool. When they have all
+    # finished, the camera buffers are unmapped, the request released, and the future completed.
+    # The frame can be cancelled (dropping it) until a worker starts on one of its renditions.
+
+    def __init__(self, request, mapped, count, timestamp_us):
+        self.request = request
+        self.mapped = mapped
+        self.results = [None] * count
+        self.remaining = count
+        self.error = None
+        self.timestamp_us = timestamp_us
+        self.lock = threading.Lock()
+        self.future = Future()
+        self.tasks = []
+
+    def start(self):
+        # Called by a worker before it encodes one of the renditions. Returns whether it should go ahead,
+        # which it shouldn't if the frame has been cancelled. Once started, a frame can't be cancelled.
+        with self.lock:
+            if self.future.running():
+                return True
+            return self.future.set_running_or_notify_cancel()
+
+    def done(self, future):
+        # If the frame was cancelled, the renditions not yet started needn't be.
+        if future.cancelled():
+            for task in self.tasks:
+                task.cancel()
+
+    def finished(self, index, future):
+        with self.lock:
+            try:
+                self.results[index] = future.result()
+            except Exception as e:
+                self.error = self.error or e
+            self.remaining -= 1
+            if self.remaining:
+                return
+        for m in self.mapped.values():
+            m.__exit__(None, None, None)
+        self.request.release()
+        if self.future.cancelled():
+            return
+        if self.error is not None:
+            self.future.set_exception(self.error)
+        else:
+            self.future.set_result((self.results, self.timestamp_us))
+
+
+class MultiRenditionEncoder(MultiEncoder):
+    """Makes several JPEGs, each with its own size, quality and outputs, from every frame.
+
+    Each frame's buffers are mapped only once, however many renditions use them, and the renditions
+    are then scaled (in the YUV domain for YUV420 streams) and encoded in parallel across the thread
+    pool. Every rendition's JPEGs go to that rendition's own outputs, in frame order, for example:
+
+        encoder = MultiRenditionEncoder([Rendition(FileOutput("full.mjpeg"), quality=85),
+                                         Rendition(FileOutput("small.mjpeg"), (854, 480), quality=50),
+                                         Rendition(thumbnail_output, (320, 180), name="lores")])
+        picam2.start_encoder(encoder)
+
+    The encoder's own output is the list of all the renditions' outputs, so should not be set.
+    Parameters are as for MultiEncoder, except that copying frames is not supported.
+    renditions - a list of Rendition objects.
+    """
+
+    FORMAT_TABLE = JpegEncoder.FORMAT_TABLE
+
+    def __init__(self, renditions, num_threads=4, max_in_flight=None, drop_policy=BackpressurePolicy.DROP_NEWEST):
+        """Creates a multi-rendition encoder
+
+        :param renditions: Renditions to make from every frame
+        :type renditions: List[Rendition]
+        :param num_threads: Number of threads to use, defaults to 4
+        :type num_threads: int, optional
+        :param max_in_flight: Most frames waiting or being encoded, defaults to None (no limit)
+        :type max_in_flight: int, optional
+        :param drop_policy: Policy when max_in_flight is reached, defaults to BackpressurePolicy.DROP_NEWEST
+        :type drop_policy: BackpressurePolicy, optional
+        """
+        if not renditions or not all(isinstance(rendition, Rendition) for rendition in renditions):
+            raise RuntimeError("Must pass a list of Renditions")
+        super().__init__(num_threads=num_threads, max_in_flight=max_in_flight, drop_policy=drop_policy)
+        self.renditions = list(renditions)
+        self.output = [out for rendition in self.renditions for out in rendition.output]
+        self.q = None
+
+    def _setup(self, quality):
+        quality = Quality.MEDIUM if quality is None else quality
+        Q_TABLE = {Quality.VERY_LOW: 25,
+                   Quality.LOW: 35,
+                   Quality.MEDIUM: 50,
+                   Quality.HIGH: 65,
+                   Quality.VERY_HIGH: 80}
+        self.q = Q_TABLE[quality]
+        for rendition in self.renditions:
+            rendition.frames_encoded = 0
+
+    def encode_rendition(self, rendition, array, config):
+        """Scales and encodes one rendition of a frame in a thread
+
+        :param rendition: Rendition
+        :param array: Frame, as MappedArray gives it
+        :param config: Stream configuration
+        :return: Jpeg image
+        """
+        quality = self.q if rendition.quality is None else rendition.quality
+        width, height = config["size"]
+        out_width, out_height = rendition.size or (width, height)
+        if config["format"] == "YUV420":
+            out_width, out_height = out_width & ~1, out_height & ~1
+            Y = array[:height, :width]
+            reshaped = array.reshape((array.shape[0] * 2, array.strides[0] // 2))
+            U = reshaped[2 * height: 2 * height + height // 2, :width // 2]
+            V = reshaped[2 * height + height // 2:, :width // 2]
+            Y = _resize_plane(Y, out_width, out_height)
+            U = _resize_plane(U, out_width // 2, out_height // 2)
+            V = _resize_plane(V, out_width // 2, out_height // 2)
+            return simplejpeg.encode_jpeg_yuv_planes(Y, U, V, quality)
+        image = _resize_plane(array, out_width, out_height)
+        return simplejpeg.encode_jpeg(image, quality=quality,
+                                      colorspace=self.FORMAT_TABLE[config["format"]],
+                                      colorsubsampling=rendition.colour_subsampling)
+
+    def _encode_rendition_of_frame(self, frame, rendition, array, config):
+        # Runs in the thread pool, encoding the rendition unless the frame has been dropped.
+        if not frame.start():
+            return None
+        return self.encode_rendition(rendition, array, config)
+
+    def _encode(self, stream, request):
+        """Start encoding all the renditions of a frame across the thread pool
+
+        :param stream: Stream
+        :param request: Request
+        """
+        if not self._running:
+            return
+        with self._tasks_cond:
+            if not self._make_room():
+                self._count_drop()
+                return
+            names = [rendition.name or stream for rendition in self.renditions]
+            mapped = {}
+            for name in names:
+                if name not in mapped:
+                    mapped[name] = MappedArray(request, name, write=False).__enter__()
+            request.acquire()
+            frame = _RenditionFrame(request, mapped, len(self.renditions), self._timestamp(request))
+            for index, (rendition, name) in enumerate(zip(self.renditions, names)):
+                future = self.threads.submit(self._encode_rendition_of_frame, frame, rendition,
+                                             mapped[name].array, request.config[name])
+                frame.tasks.append(future)
+                future.add_done_callback(lambda f, index=index: frame.finished(index, f))
+            frame.future.add_done_callback(frame.done)
+            self.tasks.append((frame.future, None))
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            self._tasks_cond.notify()
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+        """Writes each rendition of a frame to that rendition's outputs
+
+        :param frame: List of Jpeg images, one for each rendition
+        :type frame: List[bytes]
+        :param keyframe: Whether frame is a keyframe or not, defaults to True
+        :type keyframe: bool, optional
+        """
+        if audio:
+            return super().outputframe(frame, keyframe, timestamp, packet, audio)
+        tracer = self._tracer
+        key = None
+        if tracer is not None and timestamp is not None and self.firsttimestamp is not None:
+            key = self.firsttimestamp + timestamp
+            tracer.mark(key, "encoded")
+        with self._output_lock:
+            for rendition, buffer in zip(self.renditions, frame):
+                rendition.frames_encoded += 1
+                for out in rendition.output:
+                    out.outputframe(buffer, keyframe, timestamp)
+        if key is not None:
+            tracer.mark(key, "output_end")
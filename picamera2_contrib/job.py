@@ -86,6 +86,14 @@ class Job(Generic[T]):
         """
         return self._future.result(timeout=timeout)
 
+    @property
+    def future(self) -> Future:
+        """The concurrent.futures.Future that completes with the job's result.
+
+        This allows the job to be waited for in other ways, for example with asyncio.wrap_future.
+        """
+        return self._future
+
     def cancel(self) -> None:
         """
         Mark this job as cancelled, so that requesting the result raises a CancelledError.
@@ -0,0 +1,239 @@
+"""Record chosen metadata fields for every frame into compact columnar buffers"""
+
+import os
+import queue
+import threading
+from logging import getLogger
+
+import numpy as np
+
+try:
+    import pyarrow  # type: ignore
+    import pyarrow.parquet  # type: ignore
+except ModuleNotFoundError:  # pragma: no cover
+    # pyarrow is an optional dependency, needed only for Parquet output.
+    pyarrow = None  # type: ignore
+
+_log = getLogger(__name__)
+
+# The fields recorded by default, and the types used to store them.
+DEFAULT_FIELDS = {
+    "SensorTimestamp": np.int64,
+    "FrameDuration": np.int32,
+    "ExposureTime": np.int32,
+    "AnalogueGain": np.float32,
+    "DigitalGain": np.float32,
+    "Lux": np.float32,
+    "ColourTemperature": np.int32,
+    "ColourGains": np.float32,
+    "FocusFoM": np.int32,
+}
+
+
+class MetadataRecorder:
+    """
+    Records chosen metadata fields from every frame into fixed-size, typed NumPy columns.
+
+    Recording is enabled by assigning a MetadataRecorder to Picamera2.metadata_recorder, after which
+    each completed request has its fields appended as it comes out of the camera. Only the fields
+    being recorded are ever converted from their libcamera types. Fields with several values (such as
+    ColourGains) get a 2d column, whose width is taken from the first frame that reports the field.
+    Frames that lack a field record NaN for floating point types and 0 for integer ones, as do frames
+    whose value doesn't fit the column (having a different number of values, or not being numbers).
+    A field whose first value can't be stored at all (a list of rectangles, for example) is dropped.
+    Either way, a message is logged once for the field, and values_rejected counts the values affected.
+
+    When directory is None, the columns are a ring holding the most recent chunk_size frames, which
+    can be fetched with the data method. Otherwise each chunk is handed to a background thread as
+    soon as it fills up, to be written out as a numbered .npz or .parquet file, and is then reused.
+    Call close (or flush) to write out the final, partially filled chunk.
+
+    Parameters:
+    fields - a list of metadata field names (stored as float64), or a dictionary of names to NumPy
+        dtypes. Defaults to DEFAULT_FIELDS.
+    chunk_size - the number of frames in each chunk.
+    directory - where to write the chunk files, or None to keep only the most recent chunk in memory.
+    prefix - the start of each chunk file's name, which is followed by a sequence number.
+    format - "npz" (compressed) or "parquet" (which needs pyarrow).
+    """
+
+    def __init__(self, fields=None, chunk_size=3600, directory=None, prefix="metadata", format="npz"):
+        """Create a metadata recorder."""
+        if fields is None:
+            fields = DEFAULT_FIELDS
+        elif not isinstance(fields, dict):
+            fields = {name: np.float64 for name in fields}
+        if chunk_size < 1:
+            raise RuntimeError("chunk_size must be at least 1")
+        if format not in ("npz", "parquet"):
+            raise RuntimeError(f"Unsupported metadata recording format {format}")
+        if format == "parquet" and pyarrow is None:
+            raise RuntimeError("Parquet output requires pyarrow")
+        self.fields = {name: np.dtype(dtype) for name, dtype in fields.items()}
+        self.chunk_size = chunk_size
+        self.directory = directory
+        self.prefix = prefix
+        self.format = format
+        self._widths = {}
+        self._lock = threading.Lock()
+        self._columns = None
+        self._count = 0
+        self._wrapped = False
+        self._spare_columns = []
+        self._chunk_index = 0
+        self.frames_recorded = 0
+        self.chunks_written = 0
+        self.values_rejected = 0
+        self._dropped_fields = set()
+        self._warned_fields = set()
+        self._queue = None
+        self._thread = None
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._write_thread, name="picamera2-metadata", daemon=True)
+            self._thread.start()
+
+    def _fill_value(self, name):
+        return np.nan if np.issubdtype(self.fields[name], np.floating) else 0
+
+    def _new_column(self, name, width):
+        shape = (self.chunk_size,) if width is None else (self.chunk_size, width)
+        return np.full(shape, self._fill_value(name), dtype=self.fields[name])
+
+    def _allocate(self):
+        if self._spare_columns:
+            columns = self._spare_columns.pop()
+            # Fields that have only now been seen for the first time have no column yet.
+            for name, width in self._widths.items():
+                if name not in columns:
+                    columns[name] = self._new_column(name, width)
+            return columns
+        return {name: self._new_column(name, width) for name, width in self._widths.items()}
+
+    def _store(self, name, column, index, value, width):
+        # Put the value in the column, returning whether it fits. If not, the fill value goes in instead.
+        if width == (len(value) if isinstance(value, (tuple, list)) else None):
+            try:
+                column[index] = value
+                return True
+            except (TypeError, ValueError):
+                pass
+        column[index] = self._fill_value(name)
+        return False
+
+    def record(self, request):
+        """Append the recorded fields from a CompletedRequest. Normally Picamera2 calls this."""
+        metadata = request.metadata
+        with self._lock:
+            if self._columns is None:
+                self._columns = self._allocate()
+            index = self._count
+            for name in self.fields:
+                if name in self._dropped_fields:
+                    continue
+                value = metadata.get(name)
+                column = self._columns.get(name)
+                if column is None:
+                    if value is None:
+                        continue
+                    # First sighting of this field, which tells us whether it's a scalar or a vector.
+                    width = len(value) if isinstance(value, (tuple, list)) else None
+                    column = self._new_column(name, width)
+                    if not self._store(name, column, index, value, width):
+                        _log.warning(f"Not recording metadata field {name}, as {value!r} can't be stored")
+                        self._dropped_fields.add(name)
+                        self.values_rejected += 1
+                        continue
+                    self._widths[name] = width
+                    self._columns[name] = column
+                elif value is None:
+                    column[index] = self._fill_value(name)
+                elif not self._store(name, column, index, value, self._widths[name]):
+                    if name not in self._warned_fields:
+                        _log.warning(f"Metadata field {name} value {value!r} doesn't fit its column, "
+                                     "recording nothing for it")
+                        self._warned_fields.add(name)
+                    self.values_rejected += 1
+            self._count += 1
+            self.frames_recorded += 1
+            if self._count == self.chunk_size:
+                if self._queue is not None:
+                    self._queue.put((self._chunk_index, self._columns, self._count))
+                    self._chunk_index += 1
+                    self._columns = None
+                else:
+                    self._wrapped = True
+                self._count = 0
+
+    def data(self):
+        """Return a dictionary of the columns for the frames recorded in memory, oldest first.
+
+        When writing to files, this is the chunk that has not yet been written.
+        """
+        with self._lock:
+            if self._columns is None:
+                return {name: self._new_column(name, width)[:0] for name, width in self._widths.items()}
+            if self._wrapped:
+                return {name: np.roll(column, -self._count, axis=0) for name, column in self._columns.items()}
+            return {name: column[:self._count].copy() for name, column in self._columns.items()}
+
+    def _chunk_filename(self, index):
+        return os.path.join(self.directory, f"{self.prefix}{index:06d}.{self.format}")
+
+    def _write_chunk(self, index, columns, count):
+        filename = self._chunk_filename(index)
+        if self.format == "npz":
+            np.savez_compressed(filename, **{name: column[:count] for name, column in columns.items()})
+        else:
+            table = {}
+            for name, column in columns.items():
+                if column.ndim == 1:
+                    table[name] = column[:count]
+                else:
+                    for i in range(column.shape[1]):
+                        table[f"{name}_{i}"] = column[:count, i]
+            pyarrow.parquet.write_table(pyarrow.table(table), filename)
+        _log.debug(f"Wrote {count} frames of metadata to {filename}")
+
+    def _write_thread(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            index, columns, count = item
+            try:
+                self._write_chunk(index, columns, count)
+                self.chunks_written += 1
+            except Exception as e:
+                _log.exception("Failed to write metadata chunk", exc_info=e)
+            for name, column in columns.items():
+                column.fill(self._fill_value(name))
+            with self._lock:
+                self._spare_columns.append(columns)
+
+    def flush(self):
+        """Send any partially filled chunk to be written out (when writing to files)."""
+        if self._queue is None:
+            return
+        with self._lock:
+            if self._columns is None or self._count == 0:
+                return
+            self._queue.put((self._chunk_index, self._columns, self._count))
+            self._chunk_index += 1
+            self._columns = None
+            self._count = 0
+
+    def close(self):
+        """Write out any remaining frames, and wait for the background thread to finish."""
+        self.flush()
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        """Return a dictionary of this recorder's counters."""
+        return {"frames_recorded": self.frames_recorded, "chunks_written": self.chunks_written,
+                "values_rejected": self.values_rejected,
+                "chunks_pending": 0 if self._queue is None else self._queue.qsize()}
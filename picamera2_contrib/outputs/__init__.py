@@ -1,7 +1,13 @@
+from .arenacircularoutput import ArenaCircularOutput
 from .circularoutput import CircularOutput
 from .circularoutput2 import CircularOutput2
 from .ffmpegoutput import FfmpegOutput
 from .fileoutput import FileOutput
+from .hlsoutput import HlsOutput
 from .output import Output
 from .pyavoutput import PyavOutput
+from .queuedoutput import OverflowPolicy, QueuedOutput
+from .rtpoutput import RtpOutput
+from .segmentring import SegmentRing
 from .splittableoutput import SplittableOutput
+from .streamserveroutput import StreamServerOutput
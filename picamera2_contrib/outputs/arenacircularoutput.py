@@ -0,0 +1,195 @@
+"""Circular buffer bounded by bytes, holding frames in a single preallocated arena"""
+
+import collections
+from threading import Lock
+
+import numpy as np
+
+from .fileoutput import FileOutput
+
+_INDEX_DTYPE = np.dtype([("offset", np.int64), ("length", np.int64), ("timestamp", np.int64), ("keyframe", np.bool_)])
+_NO_TIMESTAMP = np.iinfo(np.int64).min
+
+
+class ArenaCircularOutput(FileOutput):
+    """
+    Circular buffer for file output, much like CircularOutput, but bounded by bytes rather than frames.
+
+    Every frame is copied into one preallocated bytearray (the arena), so memory use is fixed whatever
+    the bitrate, and no objects are allocated per frame. A compact index records the offset, length,
+    timestamp and keyframe flag of each frame in the arena, with the oldest frames being dropped as new
+    ones need their space.
+
+    The buffer always holds the most recent frames. To save them, set a file and start the output, for
+    example when something is detected:
+
+        output.fileoutput = "event.h264"
+        output.start()
+
+    On the next frame, everything from the oldest keyframe in the buffer onwards is written to the file
+    in a few large writes, and subsequent frames are written straight through until the output is stopped.
+    If outputtofile is False, frames are only buffered.
+    """
+
+    def __init__(self, file=None, pts=None, buffer_bytes=8 * 1024 * 1024, max_frames=30 * 60, outputtofile=True):
+        """Creates a circular buffer of 8MB, enough for 5s of 30fps video at over 10Mbps
+
+        :param file: File to write frames to, defaults to None
+        :type file: str or BufferedIOBase, optional
+        :param pts: File to write timestamps to, defaults to None
+        :type pts: str or BufferedWriter, optional
+        :param buffer_bytes: Size of the arena in bytes, defaults to 8MB
+        :type buffer_bytes: int, optional
+        :param max_frames: Most frames that the index can hold, defaults to 30*60
+        :type max_frames: int, optional
+        :param outputtofile: Boolean, whether to write frames to file when started
+        :type outputtofile: bool
+        """
+        super().__init__(file, pts=pts)
+        if buffer_bytes <= 0 or max_frames <= 0:
+            raise RuntimeError("buffer_bytes and max_frames must be positive")
+        self._lock = Lock()
+        self._arena = bytearray(buffer_bytes)
+        self._view = memoryview(self._arena)
+        self._index = np.zeros(max_frames, dtype=_INDEX_DTYPE)
+        self.outputtofile = outputtofile
+        # Frames are numbered in sequence, and frame n lives in index slot n % max_frames. The buffer
+        # holds frames _first_seq up to (but not including) _next_seq.
+        self._first_seq = 0
+        self._next_seq = 0
+        self._keyframe_seqs = collections.deque()
+        self._head = 0
+        self.frames_evicted = 0
+
+    @property
+    def buffer_bytes(self):
+        """Returns the size of the arena in bytes"""
+        return len(self._arena)
+
+    @property
+    def frames_buffered(self):
+        """Returns the number of frames in the buffer"""
+        return self._next_seq - self._first_seq
+
+    @property
+    def bytes_buffered(self):
+        """Returns the number of bytes of frames in the buffer"""
+        with self._lock:
+            entries = self._entries(self._first_seq)
+            return int(entries["length"].sum())
+
+    def _entries(self, seq):
+        # The index entries of the frames from seq onwards, in order.
+        slots = np.arange(seq, self._next_seq) % len(self._index)
+        return self._index[slots]
+
+    def _evict_oldest(self):
+        if self._keyframe_seqs and self._keyframe_seqs[0] == self._first_seq:
+            self._keyframe_seqs.popleft()
+        self._first_seq += 1
+        self.frames_evicted += 1
+
+    def _clear(self):
+        self.frames_evicted += self._next_seq - self._first_seq
+        self._first_seq = self._next_seq
+        self._keyframe_seqs.clear()
+        self._head = 0
+
+    def _store(self, frame, keyframe, timestamp):
+        # Called with the lock held. Copies the frame into the arena, making room by dropping the oldest
+        # frames. Each frame is kept contiguous, so one that doesn't fit before the end of the arena goes
+        # at the start instead, and the frames it passes over at the end are dropped too.
+        length = len(frame)
+        size = len(self._arena)
+        if length > size:
+            # Keeping frames either side of a missing one would be no use, so drop the lot.
+            self._next_seq += 1
+            self._clear()
+            return
+        if self._next_seq - self._first_seq == len(self._index):
+            self._evict_oldest()
+        if self._first_seq == self._next_seq:
+            self._head = 0
+        wrap = self._head + length > size
+        offset = 0 if wrap else self._head
+        while self._first_seq < self._next_seq:
+            oldest = self._index[self._first_seq % len(self._index)]["offset"]
+            if wrap:
+                overwritten = oldest >= self._head or oldest < length
+            else:
+                overwritten = self._head <= oldest < self._head + length
+            if not overwritten:
+                break
+            self._evict_oldest()
+        self._view[offset:offset + length] = frame
+        self._index[self._next_seq % len(self._index)] = \
+            (offset, length, _NO_TIMESTAMP if timestamp is None else timestamp, keyframe)
+        if keyframe:
+            self._keyframe_seqs.append(self._next_seq)
+        self._next_seq += 1
+        self._head = offset + length
+
+    def _write_from(self, seq):
+        # Called with the lock held. Write the frames from seq onwards to the file, with one write for
+        # each contiguous run of them in the arena (so at most two, unless frames were dropped).
+        entries = self._entries(seq)
+        if not len(entries):
+            return
+        offsets, lengths = entries["offset"], entries["length"]
+        timestamps = [None if timestamp == _NO_TIMESTAMP else int(timestamp) for timestamp in entries["timestamp"]]
+        if self._split:
+            # Datagrams must still carry one frame each.
+            for offset, length, timestamp in zip(offsets, lengths, timestamps):
+                self._write(self._view[offset:offset + length], timestamp)
+            return
+        breaks = np.flatnonzero(offsets[1:] != offsets[:-1] + lengths[:-1]) + 1
+        starts = np.concatenate(([0], breaks))
+        ends = np.concatenate((breaks, [len(entries)]))
+        try:
+            for start, end in zip(starts, ends):
+                self._fileoutput.write(self._view[offsets[start]:offsets[end - 1] + lengths[end - 1]])
+            self._fileoutput.flush()
+        except (ConnectionResetError, ConnectionRefusedError, BrokenPipeError, ValueError) as e:
+            self.dead = True
+            if self._connectiondead is not None:
+                self._connectiondead(e)
+            return
+        for timestamp in timestamps:
+            self.outputtimestamp(timestamp)
+
+    def _trigger(self):
+        # Called with the lock held. Write out the buffer from the oldest keyframe, if there is one.
+        if self._keyframe_seqs:
+            self._write_from(self._keyframe_seqs[0])
+            self._firstframe = False
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+        """Write frame to circular buffer, and to the file if the output has been started
+
+        :param frame: Frame
+        :type frame: bytes
+        :param keyframe: Whether frame is a keyframe, defaults to True
+        :type keyframe: bool, optional
+        :param timestamp: Timestamp of frame
+        :type timestamp: int
+        """
+        if audio:
+            raise RuntimeError("ArenaCircularOutput does not support audio")
+        with self._lock:
+            self._store(frame, keyframe, timestamp)
+            if self._fileoutput is not None and self.recording and self.outputtofile:
+                if self._firstframe:
+                    self._trigger()
+                else:
+                    self._write(frame, timestamp)
+
+    def stop(self):
+        """Write out the buffer if nothing has been written yet, then close file handle and stop recording"""
+        if not self.recording or self._fileoutput is None:
+            return
+        with self._lock:
+            if self._firstframe and self.outputtofile:
+                self._trigger()
+        self.recording = False
+        self._firstframe = False
+        self.close()
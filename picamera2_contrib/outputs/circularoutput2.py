@@ -3,6 +3,8 @@
 import collections
 from threading import Lock
 
+import av
+
 from .output import Output
 
 
@@ -16,9 +18,17 @@ class CircularOutput2(Output):
     Once the CircularOutput2 has been started, use the open_output method to start start recording
     a new output, and use close_output when finished. If the output has not been closed when the
     circular buffer is stopped, then the remainder of the buffer will be flush into the output.
+
+    Long buffers at high bitrates needn't all be held in memory. Pass a SegmentRing as spill, and only the
+    most recent memory_duration_ms of frames are kept in memory, with older ones moved out to the ring's
+    memory-mapped segment files until they leave the buffer, for example:
+
+        circular = CircularOutput2(buffer_duration_ms=60000, spill=SegmentRing("/var/tmp", num_segments=16))
+
+    If the ring fills up before the buffer duration has passed, its oldest frames leave the buffer early.
     """
 
-    def __init__(self, pts=None, buffer_duration_ms=5000):
+    def __init__(self, pts=None, buffer_duration_ms=5000, spill=None, memory_duration_ms=1000):
         """Create a CircularOutput2."""
         super().__init__(pts=pts)
         # A note on locking. The lock is principally to protect outputframe, which is called by
@@ -32,6 +42,9 @@ class CircularOutput2(Output):
             raise RuntimeError("buffer_duration_ms may not be negative")
         self._buffer_duration_ms = buffer_duration_ms
         self._circular = collections.deque()
+        # Frames in the spill ring are all older than those in _circular.
+        self._spill = spill
+        self.memory_duration_ms = memory_duration_ms
         self._output = None
         self._streams = []
         self._first_frame = True
@@ -78,24 +91,66 @@ class CircularOutput2(Output):
     def _flush(self, timestamp_now, output):
         # Flush out anything that is time-expired compared to timestamp_now.
         # If timestamp_now is None, flush everything.
-        while self._circular and (front := self._circular[0]):
-            frame, keyframe, timestamp, packet, audio = front
+        if self._spill is not None and timestamp_now:
+            self._spill_old(timestamp_now, output)
+        while True:
+            if self._spill is not None and len(self._spill):
+                timestamp = self._spill.oldest_timestamp()
+            elif self._circular:
+                timestamp = self._circular[0][2]
+            else:
+                break
 
             if timestamp_now and timestamp_now - timestamp < self.buffer_duration_ms * 1000:
                 break
 
             # We need to drop this entry, writing it out if we can.
-            self._circular.popleft()
-
-            if keyframe and not audio:
-                if self._first_frame:
-                    self._time_offset = timestamp
-                self._first_frame = False
-
-            if not self._first_frame and output:
-                new_timestamp = timestamp - self._time_offset
-                if new_timestamp >= 0:
-                    output.outputframe(frame, keyframe, new_timestamp, packet, audio)
+            if self._spill is not None and len(self._spill):
+                self._drop_spilled(self._spill.pop() if output else self._spill.pop_entry(), output)
+            else:
+                self._drop(self._circular.popleft(), output)
+
+    def _drop(self, entry, output):
+        # An entry is leaving the buffer, so write it out if there's an output that can take it.
+        frame, keyframe, timestamp, packet, audio = entry
+        if keyframe and not audio:
+            if self._first_frame:
+                self._time_offset = timestamp
+            self._first_frame = False
+
+        if not self._first_frame and output:
+            new_timestamp = timestamp - self._time_offset
+            if new_timestamp >= 0:
+                output.outputframe(frame, keyframe, new_timestamp, packet, audio)
+
+    def _spill_old(self, timestamp_now, output):
+        # Move everything older than memory_duration_ms out to the spill ring. Anything the ring has to
+        # evict to make room leaves the buffer early.
+        while self._circular and timestamp_now - self._circular[0][2] >= self.memory_duration_ms * 1000:
+            frame, keyframe, timestamp, packet, audio = self._circular.popleft()
+            data = bytes(packet) if frame is None else frame
+            stream = packet.stream if packet is not None else None
+            for evicted in self._spill.append(data, keyframe, timestamp, audio, stream, read_evicted=bool(output)):
+                self._drop_spilled(evicted, output)
+
+    def _drop_spilled(self, entry, output):
+        # A frame from the spill ring is leaving the buffer. Without an output to take it, only its
+        # keyframe flag and timestamp matter, so it won't have been read back from the ring.
+        if output:
+            self._drop(self._from_spill(entry), output)
+        else:
+            _, keyframe, timestamp, audio, _ = entry
+            self._drop((None, keyframe, timestamp, None, audio), None)
+
+    @staticmethod
+    def _from_spill(entry):
+        # Turn a frame from the spill ring back into an entry, remaking the packet that the frame came in.
+        data, keyframe, timestamp, audio, stream = entry
+        packet = None
+        if stream is not None:
+            packet = av.Packet(data)
+            packet.stream = stream
+        return None if audio else data, keyframe, timestamp, packet, audio
 
     def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
         """Write frame to circular buffer"""
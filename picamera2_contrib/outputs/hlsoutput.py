@@ -0,0 +1,290 @@
+"""Write live HLS (or low-latency HLS) in fragmented MP4 segments, for serving from a static web server"""
+
+import collections
+import math
+import os
+import struct
+
+from .pyavoutput import PyavOutput
+
+# Sample flags bit saying that a sample is not a sync sample (keyframe).
+_NON_SYNC = 0x10000
+# Segments may end this many seconds short of the target duration.
+_SLACK = 0.01
+
+
+def _boxes(data, start=0, end=None):
+    # Yield the type, payload start and end of each ISO BMFF box in data[start:end].
+    end = len(data) if end is None else end
+    while start + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, start)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, start + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - start
+        if size < header:
+            break
+        yield box_type, start + header, start + size
+        start += size
+
+
+def _child(data, box_type, start, end):
+    for child_type, child_start, child_end in _boxes(data, start, end):
+        if child_type == box_type:
+            return child_start, child_end
+    return None
+
+
+def _parse_moov(moov):
+    # Return {track_ID: [handler type, timescale, default duration, default flags]} from an init segment's moov.
+    tracks = {}
+    trex = {}
+    for box_type, start, end in _boxes(moov):
+        if box_type == b"trak":
+            tkhd = _child(moov, b"tkhd", start, end)
+            mdia = _child(moov, b"mdia", start, end)
+            if tkhd is None or mdia is None:
+                continue
+            version = moov[tkhd[0]]
+            track_id = struct.unpack_from(">I", moov, tkhd[0] + (20 if version == 1 else 12))[0]
+            mdhd = _child(moov, b"mdhd", *mdia)
+            hdlr = _child(moov, b"hdlr", *mdia)
+            version = moov[mdhd[0]]
+            timescale = struct.unpack_from(">I", moov, mdhd[0] + (20 if version == 1 else 12))[0]
+            tracks[track_id] = [moov[hdlr[0] + 8:hdlr[0] + 12], timescale, 0, 0]
+        elif box_type == b"mvex":
+            for child_type, child_start, _ in _boxes(moov, start, end):
+                if child_type == b"trex":
+                    track_id, _, duration, _, flags = struct.unpack_from(">5I", moov, child_start + 4)
+                    trex[track_id] = (duration, flags)
+    for track_id, (duration, flags) in trex.items():
+        if track_id in tracks:
+            tracks[track_id][2:] = [duration, flags]
+    return tracks
+
+
+def _parse_moof(moof, tracks):
+    # Return the start time and duration (in seconds) of the video in a fragment, and whether it starts
+    # with a keyframe. Fragments without video take their times from whatever track they have.
+    result = None
+    for box_type, start, end in _boxes(moof):
+        if box_type != b"traf":
+            continue
+        tfhd = _child(moof, b"tfhd", start, end)
+        flags = int.from_bytes(moof[tfhd[0] + 1:tfhd[0] + 4], "big")
+        track_id = struct.unpack_from(">I", moof, tfhd[0] + 4)[0]
+        handler, timescale, duration, sample_flags = tracks.get(track_id, [b"", 1, 0, 0])
+        pos = tfhd[0] + 8 + (8 if flags & 0x1 else 0) + (4 if flags & 0x2 else 0)
+        if flags & 0x8:
+            duration = struct.unpack_from(">I", moof, pos)[0]
+            pos += 4
+        pos += 4 if flags & 0x10 else 0
+        if flags & 0x20:
+            sample_flags = struct.unpack_from(">I", moof, pos)[0]
+        base_time = 0
+        tfdt = _child(moof, b"tfdt", start, end)
+        if tfdt is not None:
+            base_time = struct.unpack_from(">Q" if moof[tfdt[0]] == 1 else ">I", moof, tfdt[0] + 4)[0]
+        total, first_flags = 0, None
+        for child_type, child_start, _ in _boxes(moof, start, end):
+            if child_type != b"trun":
+                continue
+            flags = int.from_bytes(moof[child_start + 1:child_start + 4], "big")
+            count = struct.unpack_from(">I", moof, child_start + 4)[0]
+            pos = child_start + 8 + (4 if flags & 0x1 else 0)
+            if flags & 0x4:
+                first_flags = struct.unpack_from(">I", moof, pos)[0]
+                pos += 4
+            fields = [(flags & bit) != 0 for bit in (0x100, 0x200, 0x400, 0x800)]
+            for i in range(count):
+                if fields[0]:
+                    total += struct.unpack_from(">I", moof, pos)[0]
+                else:
+                    total += duration
+                if fields[2] and i == 0 and first_flags is None:
+                    first_flags = struct.unpack_from(">I", moof, pos + 4 * fields[0] + 4 * fields[1])[0]
+                pos += 4 * sum(fields)
+        if first_flags is None:
+            first_flags = sample_flags
+        track = (base_time / timescale, total / timescale, not first_flags & _NON_SYNC)
+        if handler == b"vide":
+            return track
+        result = result or (track[0], track[1], False)
+    return result
+
+
+def _write_atomic(path, data):
+    # Write to a temporary file and rename it, so that a web server never serves a partial file.
+    temp = path + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(data)
+    os.replace(temp, path)
+
+
+class _FragmentWriter:
+    # The file-like object that the MP4 muxer writes to. It splits what is written into top-level boxes.
+
+    def __init__(self, callback):
+        self._callback = callback
+        self._buffer = bytearray()
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= 8:
+            size, box_type = struct.unpack_from(">I4s", self._buffer)
+            if size == 1:
+                if len(self._buffer) < 16:
+                    break
+                size = struct.unpack_from(">Q", self._buffer, 8)[0]
+            if size < 8 or len(self._buffer) < size:
+                break
+            box = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            self._callback(box_type, box)
+        return len(data)
+
+
+class HlsOutput(PyavOutput):
+    """
+    The HlsOutput writes live HLS, or low-latency HLS, for a static web server to serve.
+
+    It muxes H.264 video (and AAC audio, if the encoder has any) into fragmented MP4 segments using PyAV,
+    in-process, rather than piping the stream to FFmpeg and having it re-timestamp everything. The
+    directory gets an initialisation segment, media segments and a rolling playlist listing the last
+    list_size segments, all written atomically (to a temporary file, then renamed), and old segments are
+    deleted. So a plain static web server pointed at the directory serves live video, for example:
+
+        picam2.start_recording(H264Encoder(), HlsOutput("/var/www/html/live", part_duration_ms=333))
+
+    and then play http://<host>/live/stream.m3u8. Segments start at the first keyframe after
+    segment_duration_ms, so the encoder's keyframe interval should divide it. If part_duration_ms is given,
+    the playlist is low-latency HLS: each segment is also written as a series of parts of about that
+    length, which are listed as soon as they are ready. (A static server can't support blocking playlist
+    reloads, so clients poll for the parts.)
+
+    Parameters:
+    directory - where to write the playlist and segments.
+    playlist - the name of the playlist file.
+    segment_duration_ms - the target segment length.
+    part_duration_ms - the target part length for low-latency HLS, or None for plain HLS.
+    list_size - the number of segments in the playlist.
+    """
+
+    def __init__(self, directory, playlist="stream.m3u8", segment_duration_ms=2000, part_duration_ms=None,
+                 list_size=6, pts=None):
+        movflags = "empty_moov+delay_moov+default_base_moof+frag_keyframe+skip_trailer"
+        options = {"movflags": movflags, "flush_packets": "1"}
+        if part_duration_ms is not None:
+            options["frag_duration"] = str(int(part_duration_ms * 1000))
+        super().__init__(None, format="mp4", pts=pts, options=options)
+        self.directory = directory
+        self.playlist = playlist
+        self.segment_duration_ms = segment_duration_ms
+        self.part_duration_ms = part_duration_ms
+        self.list_size = list_size
+        self._sequence = 0
+
+    def start(self):
+        """Start the HlsOutput."""
+        os.makedirs(self.directory, exist_ok=True)
+        self._output_name = _FragmentWriter(self._box)
+        self._tracks = {}
+        self._moof = None
+        # Finished segments, each a (sequence number, duration, parts), the last ones being those listed.
+        # A part is a (name, duration, independent) tuple.
+        self._segments = collections.deque()
+        self._current = None
+        self._max_part = 0
+        self._ended = False
+        super().start()
+
+    def stop(self):
+        """Stop the HlsOutput, finishing the last segment and ending the playlist."""
+        super().stop()
+        if self._current is not None:
+            self._finish_segment()
+        self._ended = True
+        self._write_playlist()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _box(self, box_type, box):
+        if box_type == b"moov":
+            self._tracks = _parse_moov(box[8:])
+            _write_atomic(self._path("init.mp4"), self._init + box)
+        elif box_type == b"ftyp":
+            self._init = box
+        elif box_type == b"moof":
+            self._moof = box
+        elif box_type == b"mdat" and self._moof is not None:
+            self._fragment(self._moof, box)
+            self._moof = None
+
+    def _fragment(self, moof, mdat):
+        start, duration, independent = _parse_moof(moof[8:], self._tracks) or (0, 0, False)
+        if self._current is None and not independent:
+            # Wait for a keyframe before starting the first segment.
+            return
+        # Allow a little slack, so that frame timestamps just short of the target still end the segment.
+        if self._current is not None and independent and \
+                start - self._current["start"] >= self.segment_duration_ms / 1000 - _SLACK:
+            self._finish_segment()
+        if self._current is None:
+            self._current = {"sequence": self._sequence, "start": start, "data": [], "parts": []}
+            self._sequence += 1
+        current = self._current
+        current["data"].append(moof + mdat)
+        current["end"] = start + duration
+        if self.part_duration_ms is not None:
+            name = f"segment{current['sequence']}.{len(current['parts'])}.m4s"
+            _write_atomic(self._path(name), moof + mdat)
+            current["parts"].append((name, duration, independent))
+            self._max_part = max(self._max_part, duration)
+            self._write_playlist()
+
+    def _finish_segment(self):
+        current = self._current
+        self._current = None
+        _write_atomic(self._path(f"segment{current['sequence']}.m4s"), b"".join(current["data"]))
+        self._segments.append((current["sequence"], current["end"] - current["start"], current["parts"]))
+        # Keep one segment more than the playlist lists, for clients that loaded the previous playlist.
+        while len(self._segments) > self.list_size + 1:
+            sequence, _, parts = self._segments.popleft()
+            for name in [f"segment{sequence}.m4s"] + [part[0] for part in parts]:
+                try:
+                    os.remove(self._path(name))
+                except FileNotFoundError:
+                    pass
+        self._write_playlist()
+
+    def _write_playlist(self):
+        segments = list(self._segments)[-self.list_size:]
+        if not segments and self._current is None:
+            return
+        target = max([self.segment_duration_ms / 1000] + [duration for _, duration, _ in segments])
+        lines = ["#EXTM3U", f"#EXT-X-VERSION:{9 if self.part_duration_ms is not None else 7}",
+                 f"#EXT-X-TARGETDURATION:{math.ceil(target)}"]
+        if self.part_duration_ms is not None:
+            part_target = max(self.part_duration_ms / 1000, self._max_part)
+            lines += [f"#EXT-X-SERVER-CONTROL:PART-HOLD-BACK={3 * part_target:.3f}",
+                      f"#EXT-X-PART-INF:PART-TARGET={part_target:.3f}"]
+        first = segments[0][0] if segments else self._current["sequence"]
+        lines += [f"#EXT-X-MEDIA-SEQUENCE:{first}", "#EXT-X-INDEPENDENT-SEGMENTS", '#EXT-X-MAP:URI="init.mp4"']
+
+        def part_lines(parts):
+            return [f'#EXT-X-PART:DURATION={duration:.5f},URI="{name}"' + (",INDEPENDENT=YES" if independent else "")
+                    for name, duration, independent in parts]
+
+        for i, (sequence, duration, parts) in enumerate(segments):
+            # Parts need only be listed for the last few segments.
+            if len(segments) - i <= 2:
+                lines += part_lines(parts)
+            lines += [f"#EXTINF:{duration:.5f},", f"segment{sequence}.m4s"]
+        if self._current is not None:
+            lines += part_lines(self._current["parts"])
+        if self._ended:
+            lines.append("#EXT-X-ENDLIST")
+        _write_atomic(self._path(self.playlist), ("\n".join(lines) + "\n").encode())
@@ -0,0 +1,193 @@
+"""Deliver frames to an output from its own queue and thread"""
+
+import collections
+import threading
+import time
+from enum import Enum
+from logging import getLogger
+
+from .output import Output
+
+_log = getLogger(__name__)
+
+
+class OverflowPolicy(Enum):
+    """What a QueuedOutput does with a frame when its queue is full."""
+
+    DROP_TO_KEYFRAME = "drop_to_keyframe"  # drop frames until the next keyframe that fits
+    BLOCK = "block"  # wait for the output to catch up, holding up the encoder
+    DISCONNECT = "disconnect"  # discard the queue and stop the output altogether
+
+
+class QueuedOutput(Output):
+    """
+    Wraps another output so that frames are written to it from a bounded queue on a thread of its own.
+
+    An encoder writes to all its outputs in turn, so without this a single slow output (a file on a
+    network share, or an FfmpegOutput whose pipe has stalled) holds up every other output, and the
+    encoder itself. Wrapping each output in a QueuedOutput leaves the encoder only queueing frames, and
+    isolates the outputs from one another, for example:
+
+        encoder.output = [QueuedOutput(FileOutput("/mnt/share/video.h264")),
+                          QueuedOutput(FfmpegOutput("-f mpegts udp://<ip>:12345"),
+                                       policy=OverflowPolicy.DISCONNECT)]
+
+    Frames that are not already bytes are copied, because encoders may reuse their buffers as soon as
+    outputframe returns. When max_frames frames are already queued, the policy decides what happens:
+
+    OverflowPolicy.DROP_TO_KEYFRAME - drop the frame, and every frame after it until a keyframe that
+        fits in the queue, so that the output never receives a frame that can't be decoded.
+    OverflowPolicy.BLOCK - wait until the output has taken a frame. This holds up the encoder.
+    OverflowPolicy.DISCONNECT - discard the queued frames and stop the wrapped output, which then
+        receives nothing more until this output is restarted.
+
+    The counters frames_delivered and frames_dropped, the disconnected flag, and the latencies (from
+    queueing each frame to the output having finished with it) are reported by stats.
+
+    Parameters:
+    output - the Output to deliver frames to.
+    max_frames - the most frames that may wait in the queue.
+    policy - the OverflowPolicy to apply when the queue is full.
+    """
+
+    def __init__(self, output, max_frames=30, policy=OverflowPolicy.DROP_TO_KEYFRAME):
+        """Wrap an output with a delivery queue
+
+        :param output: Output to deliver frames to
+        :type output: Output
+        :param max_frames: Most frames that may wait in the queue, defaults to 30
+        :type max_frames: int, optional
+        :param policy: What to do when the queue is full, defaults to OverflowPolicy.DROP_TO_KEYFRAME
+        :type policy: OverflowPolicy, optional
+        """
+        super().__init__()
+        if not isinstance(output, Output):
+            raise RuntimeError("Must pass Output")
+        if max_frames < 1:
+            raise RuntimeError("max_frames must be at least 1")
+        if not isinstance(policy, OverflowPolicy):
+            raise RuntimeError("policy must be an OverflowPolicy")
+        self.output = output
+        self.max_frames = max_frames
+        self.policy = policy
+        self.needs_pacing = output.needs_pacing
+        self.needs_add_stream = output.needs_add_stream
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._waiting_for_keyframe = False
+        self.disconnected = False
+        self.frames_delivered = 0
+        self.frames_dropped = 0
+        self.max_queue_depth = 0
+        self.last_latency = None
+        self.max_latency = 0.0
+        self._total_latency = 0.0
+
+    @property
+    def queue_depth(self):
+        """The number of frames waiting to be delivered."""
+        return len(self._queue)
+
+    def stats(self):
+        """Return a dictionary of this output's counters, with latencies in seconds."""
+        return {"frames_delivered": self.frames_delivered, "frames_dropped": self.frames_dropped,
+                "queue_depth": self.queue_depth, "max_queue_depth": self.max_queue_depth,
+                "disconnected": self.disconnected, "last_latency": self.last_latency,
+                "max_latency": self.max_latency,
+                "mean_latency": self._total_latency / self.frames_delivered if self.frames_delivered else None}
+
+    def start(self):
+        """Start the wrapped output and the delivery thread"""
+        self._reset_stats()
+        self._queue.clear()
+        self.output.start()
+        super().start()
+        self._thread = threading.Thread(target=self._delivery_thread, name="picamera2-output", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Deliver any queued frames, then stop the delivery thread and the wrapped output"""
+        super().stop()
+        if self._thread is not None:
+            with self._cond:
+                self._queue.append(None)
+                self._cond.notify_all()
+            self._thread.join()
+            self._thread = None
+        if not self.disconnected:
+            self.output.stop()
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+        """Queue a frame for delivery to the wrapped output
+
+        :param frame: Frame
+        :type frame: bytes
+        :param keyframe: Whether frame is a keyframe, defaults to True
+        :type keyframe: bool, optional
+        :param timestamp: Timestamp of frame
+        :type timestamp: int
+        """
+        if not self.recording:
+            return
+        if self.disconnected:
+            self.frames_dropped += 1
+            return
+        if frame is not None and not isinstance(frame, bytes):
+            frame = bytes(frame)
+        with self._cond:
+            if self._waiting_for_keyframe and not audio:
+                if not keyframe:
+                    self.frames_dropped += 1
+                    return
+                self._waiting_for_keyframe = False
+            if len(self._queue) >= self.max_frames:
+                if self.policy == OverflowPolicy.BLOCK:
+                    self._cond.wait_for(lambda: len(self._queue) < self.max_frames or self.disconnected)
+                elif self.policy == OverflowPolicy.DROP_TO_KEYFRAME:
+                    self.frames_dropped += 1
+                    if not audio:
+                        self._waiting_for_keyframe = True
+                    return
+                else:
+                    _log.warning(f"Disconnecting {self.output} as it has fallen {len(self._queue)} frames behind")
+                    self.frames_dropped += len(self._queue) + 1
+                    self._queue.clear()
+                    self.disconnected = True
+                    self._cond.notify_all()
+                    return
+            self._queue.append((time.monotonic(), (frame, keyframe, timestamp, packet, audio)))
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+            self._cond.notify_all()
+
+    def _delivery_thread(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self.disconnected)
+                if self.disconnected:
+                    break
+                item = self._queue.popleft()
+                self._cond.notify_all()
+            if item is None:
+                return
+            queued_time, args = item
+            try:
+                self.output.outputframe(*args)
+            except Exception as e:
+                _log.exception(f"Output {self.output} failed", exc_info=e)
+            latency = time.monotonic() - queued_time
+            self.frames_delivered += 1
+            self.last_latency = latency
+            self.max_latency = max(self.max_latency, latency)
+            self._total_latency += latency
+        # We've been disconnected, so give up on the output now, in this thread, in case stopping it blocks.
+        try:
+            self.output.stop()
+        except Exception as e:
+            _log.exception(f"Failed to stop {self.output}", exc_info=e)
+
+    def _add_stream(self, encoder_stream, *args, **kwargs):
+        self.output._add_stream(encoder_stream, *args, **kwargs)
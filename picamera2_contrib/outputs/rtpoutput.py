@@ -0,0 +1,251 @@
+"""Send H.264 over RTP (RFC 6184), with an SDP description that players can open directly"""
+
+import base64
+import ipaddress
+import os
+import random
+import socket
+import struct
+import time
+
+from .output import Output
+
+_STAP_A = 24
+_FU_A = 28
+_NAL_SPS = 7
+_NAL_PPS = 8
+# The bytes of IP, UDP and RTP headers, for reckoning the rate when pacing.
+_OVERHEAD = 40
+
+
+def _nal_units(data):
+    # Yield (start, end) for each NAL unit in an Annex B buffer, without the start codes or trailing zeros.
+    start = data.find(b"\x00\x00\x01")
+    while start >= 0:
+        start += 3
+        end = data.find(b"\x00\x00\x01", start)
+        next_start = end
+        if end < 0:
+            end = len(data)
+        # A NAL unit never ends with a zero byte, so any here belong to the next start code.
+        while end > start and data[end - 1] == 0:
+            end -= 1
+        if end > start:
+            yield start, end
+        start = next_start
+
+
+class RtpOutput(Output):
+    """
+    The RtpOutput sends the H.264 encoders' output as an RTP stream over UDP, packetised as RFC 6184 says.
+
+    Unlike writing the raw stream to a UDP socket, this survives NAL units bigger than a datagram, and
+    players know where each frame starts and when to show it. NAL units are found in each frame and sent
+    straight from the encoder's buffer, without being copied. Those that are too big for the mtu are split
+    into FU-A fragments, and runs of small ones (such as the SPS and PPS before each keyframe) are
+    combined into STAP-A packets. RTP timestamps are taken from the encoder's, on the 90kHz clock.
+
+    Once the stream's SPS and PPS have been seen, the sdp method describes the stream. If sdp_file is
+    given, the description is written there too, and a player can receive the stream with, for example:
+
+        ffplay -protocol_whitelist file,udp,rtp -fflags nobuffer stream.sdp
+
+    The address may be multicast, in which case ttl limits how far the packets go. If max_bitrate is
+    given, packets are spread out so that they never leave faster than that (counting their headers),
+    rather than each keyframe leaving as one burst that a receiver or network may drop. It should be
+    comfortably above the encoder's bitrate.
+
+    Parameters:
+    address - the IP address to send to.
+    port - the port to send to, which should be even.
+    payload_type - the RTP payload type, between 96 and 127.
+    mtu - the largest RTP packet (excluding IP and UDP headers) to send.
+    sdp_file - a file to write the SDP description to, or None.
+    max_bitrate - the rate (in bits per second) to pace packets to, or None to send them at once.
+    ttl - the multicast time to live.
+    """
+
+    def __init__(self, address, port=5004, payload_type=96, mtu=1400, sdp_file=None, max_bitrate=None, ttl=1,
+                 pts=None):
+        """Create an RTP output
+
+        :param address: IP address to send to
+        :type address: str
+        :param port: Port to send to, defaults to 5004
+        :type port: int, optional
+        :param payload_type: RTP payload type, defaults to 96
+        :type payload_type: int, optional
+        :param mtu: Largest RTP packet to send, defaults to 1400
+        :type mtu: int, optional
+        :param sdp_file: File to write the SDP description to, defaults to None
+        :type sdp_file: str, optional
+        :param max_bitrate: Rate to pace packets to, defaults to None (no pacing)
+        :type max_bitrate: int, optional
+        :param ttl: Multicast time to live, defaults to 1
+        :type ttl: int, optional
+        :param pts: File to write timestamps to, defaults to None
+        :type pts: str or BufferedWriter, optional
+        """
+        super().__init__(pts=pts)
+        if not 96 <= payload_type <= 127:
+            raise RuntimeError("RTP payload type must be between 96 and 127")
+        if mtu < 100:
+            raise RuntimeError("mtu is too small")
+        self.address = address
+        self.port = port
+        self.payload_type = payload_type
+        self.mtu = mtu
+        self.sdp_file = sdp_file
+        self.max_bitrate = max_bitrate
+        self.ttl = ttl
+        self._socket = None
+        self._sps = None
+        self._pps = None
+        self.packets_sent = 0
+        self.bytes_sent = 0
+
+    def stats(self):
+        """Return a dictionary of how many packets and bytes of RTP payload have been sent."""
+        return {"packets_sent": self.packets_sent, "bytes_sent": self.bytes_sent}
+
+    def start(self):
+        """Open the socket and start sending"""
+        family = socket.AF_INET6 if ipaddress.ip_address(self.address).version == 6 else socket.AF_INET
+        self._socket = socket.socket(family, socket.SOCK_DGRAM)
+        if ipaddress.ip_address(self.address).is_multicast:
+            if family == socket.AF_INET6:
+                self._socket.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_MULTICAST_HOPS, self.ttl)
+            else:
+                self._socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.ttl)
+        self._socket.connect((self.address, self.port))
+        # RFC 3550 asks for random initial values, so that streams can't be confused.
+        self._ssrc = random.getrandbits(32)
+        self._sequence = random.getrandbits(16)
+        self._timestamp_offset = random.getrandbits(32)
+        self._session_id = random.getrandbits(32)
+        self._next_send = 0
+        self._sps = self._pps = None
+        self.packets_sent = self.bytes_sent = 0
+        super().start()
+
+    def stop(self):
+        """Stop sending and close the socket"""
+        super().stop()
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def sdp(self):
+        """Return the SDP description of the stream, or None if the SPS and PPS haven't been seen yet."""
+        if self._sps is None or self._pps is None:
+            return None
+        version = ipaddress.ip_address(self.address).version
+        connection = f"IN IP{version} {self.address}"
+        if version == 4 and ipaddress.ip_address(self.address).is_multicast:
+            connection += f"/{self.ttl}"
+        sprop = ",".join(base64.b64encode(nal).decode() for nal in (self._sps, self._pps))
+        return "\r\n".join([
+            "v=0",
+            f"o=- {self._session_id} 1 IN IP{version} {self.address}",
+            "s=Picamera2",
+            f"c={connection}",
+            "t=0 0",
+            f"m=video {self.port} RTP/AVP {self.payload_type}",
+            f"a=rtpmap:{self.payload_type} H264/90000",
+            f"a=fmtp:{self.payload_type} packetization-mode=1;profile-level-id={self._sps[1:4].hex()};"
+            f"sprop-parameter-sets={sprop}",
+            ""])
+
+    def _parameter_sets(self, data, nals):
+        # Remember the SPS and PPS, and write the SDP description whenever they change.
+        changed = False
+        for start, end in nals:
+            nal_type = data[start] & 0x1F
+            if nal_type == _NAL_SPS and self._sps != data[start:end]:
+                self._sps = bytes(data[start:end])
+                changed = True
+            elif nal_type == _NAL_PPS and self._pps != data[start:end]:
+                self._pps = bytes(data[start:end])
+                changed = True
+        if changed and self.sdp_file is not None and self.sdp() is not None:
+            temp = self.sdp_file + ".tmp"
+            with open(temp, "w") as f:
+                f.write(self.sdp())
+            os.replace(temp, self.sdp_file)
+
+    def _send(self, buffers, timestamp, marker):
+        header = struct.pack(">BBHII", 0x80, self.payload_type | (0x80 if marker else 0), self._sequence,
+                             timestamp, self._ssrc)
+        self._sequence = (self._sequence + 1) & 0xFFFF
+        size = sum(len(buffer) for buffer in buffers)
+        if self.max_bitrate:
+            now = time.monotonic()
+            # Only sleep once the packets are more than a millisecond ahead, to keep the sleeps few.
+            if self._next_send - now > 0.001:
+                time.sleep(self._next_send - now)
+            self._next_send = max(self._next_send, now) + (size + len(header) + _OVERHEAD) * 8 / self.max_bitrate
+        try:
+            self._socket.sendmsg([header] + buffers)
+        except ConnectionRefusedError:
+            # Nothing is listening yet, which is no reason to stop.
+            return
+        self.packets_sent += 1
+        self.bytes_sent += size
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+        """Send a frame as RTP packets
+
+        :param frame: Frame
+        :type frame: bytes
+        :param keyframe: Whether frame is a keyframe, defaults to True
+        :type keyframe: bool, optional
+        :param timestamp: Timestamp of frame
+        :type timestamp: int
+        """
+        if audio or not self.recording or self._socket is None:
+            return
+        # Anything we can search (bytes, or a memory mapped buffer) is used in place.
+        data = frame if hasattr(frame, "find") else bytes(frame)
+        view = memoryview(data)
+        nals = list(_nal_units(data))
+        if not nals:
+            return
+        if keyframe:
+            self._parameter_sets(view, nals)
+        if timestamp is None:
+            timestamp = time.monotonic_ns() // 1000
+        rtp_timestamp = (self._timestamp_offset + timestamp * 9 // 100) & 0xFFFFFFFF
+        payload = self.mtu - 12
+        i = 0
+        while i < len(nals):
+            start, end = nals[i]
+            if end - start > payload:
+                # Split it into FU-A fragments, each headed by the NAL unit's header bits and type.
+                indicator = (data[start] & 0xE0) | _FU_A
+                nal_type = data[start] & 0x1F
+                position = start + 1
+                while position < end:
+                    chunk = min(payload - 2, end - position)
+                    fu_header = nal_type | (0x80 if position == start + 1 else 0) | \
+                        (0x40 if position + chunk == end else 0)
+                    self._send([bytes((indicator, fu_header)), view[position:position + chunk]], rtp_timestamp,
+                               position + chunk == end and i == len(nals) - 1)
+                    position += chunk
+                i += 1
+                continue
+            # Gather as many following NAL units as fit with this one into a STAP-A packet.
+            size, j = 1 + 2 + end - start, i + 1
+            while j < len(nals) and size + 2 + nals[j][1] - nals[j][0] <= payload:
+                size += 2 + nals[j][1] - nals[j][0]
+                j += 1
+            if j == i + 1:
+                self._send([view[start:end]], rtp_timestamp, i == len(nals) - 1)
+            else:
+                # The STAP-A header takes the highest importance (NRI) of the NAL units it holds.
+                nri = max(data[nal_start] & 0x60 for nal_start, _ in nals[i:j])
+                buffers = [bytes((nri | _STAP_A,))]
+                for nal_start, nal_end in nals[i:j]:
+                    buffers += [struct.pack(">H", nal_end - nal_start), view[nal_start:nal_end]]
+                self._send(buffers, rtp_timestamp, j == len(nals))
+            i = j
+        self.outputtimestamp(timestamp)
@@ -0,0 +1,159 @@
+"""A ring of encoded frames kept in preallocated, memory-mapped segment files"""
+
+import mmap
+import os
+import tempfile
+
+import numpy as np
+
+_INDEX_DTYPE = np.dtype([("offset", np.int64), ("length", np.int64), ("timestamp", np.int64),
+                         ("keyframe", np.bool_), ("audio", np.bool_), ("tag", np.int16)])
+
+
+class SegmentRing:
+    """
+    Keeps encoded frames, oldest first, in a fixed set of preallocated segment files on local storage.
+
+    The segment files are created (with their space reserved) in the given directory, memory mapped,
+    and then unlinked at once, so they take no more space than was asked for, and nothing is left
+    behind if the process dies. A compact index records the position, length, timestamp and keyframe
+    and audio flags of every frame. Frames never straddle two segments, and when a new frame needs
+    space that older frames occupy, those frames are evicted and returned to the caller, oldest first.
+
+    Each frame carries a tag, any object (such as the PyAV stream the frame came from) which is kept
+    in a small table rather than on disk, and given back with the frame.
+
+    Parameters:
+    directory - where to create the segment files, or None for the system's temporary directory.
+    segment_bytes - the size of each segment file, which is also the largest frame that can be kept.
+    num_segments - the number of segment files, at least 2.
+    max_frames - the most frames that the index can hold.
+    """
+
+    def __init__(self, directory=None, segment_bytes=32 * 1024 * 1024, num_segments=8, max_frames=65536):
+        """Create and map the segment files."""
+        if segment_bytes <= 0 or num_segments < 2 or max_frames <= 0:
+            raise RuntimeError("SegmentRing needs positive sizes and at least 2 segments")
+        self.segment_bytes = segment_bytes
+        self.num_segments = num_segments
+        self._maps = []
+        try:
+            for _ in range(num_segments):
+                fd, path = tempfile.mkstemp(prefix="picamera2-ring-", suffix=".seg", dir=directory)
+                try:
+                    os.unlink(path)
+                    # Reserve the space now, so that we can't run out of it later.
+                    os.posix_fallocate(fd, 0, segment_bytes)
+                    self._maps.append(mmap.mmap(fd, segment_bytes))
+                finally:
+                    os.close(fd)
+        except Exception:
+            self.close()
+            raise
+        self._index = np.zeros(max_frames, dtype=_INDEX_DTYPE)
+        self._tags = []
+        # Frames are numbered in sequence, and frame n lives in index slot n % max_frames. The ring holds
+        # frames _first_seq up to (but not including) _next_seq. Offsets run over all the segments in turn.
+        self._first_seq = 0
+        self._next_seq = 0
+        self._head = 0
+        self.frames_evicted = 0
+
+    def __len__(self):
+        return self._next_seq - self._first_seq
+
+    @property
+    def size(self):
+        """The total size of the segment files in bytes."""
+        return self.segment_bytes * self.num_segments
+
+    def oldest_timestamp(self):
+        """Return the timestamp of the oldest frame, or None if the ring is empty."""
+        if self._first_seq == self._next_seq:
+            return None
+        return int(self._index[self._first_seq % len(self._index)]["timestamp"])
+
+    def _tag_id(self, tag):
+        if tag is None:
+            return -1
+        for i, known in enumerate(self._tags):
+            if known is tag:
+                return i
+        self._tags.append(tag)
+        return len(self._tags) - 1
+
+    def _pop_index(self):
+        # Remove the oldest frame's index entry, returning it.
+        if self._first_seq == self._next_seq:
+            raise RuntimeError("SegmentRing is empty")
+        entry = self._index[self._first_seq % len(self._index)]
+        self._first_seq += 1
+        return entry
+
+    def _entry_tuple(self, data, entry):
+        tag = int(entry["tag"])
+        return data, bool(entry["keyframe"]), int(entry["timestamp"]), bool(entry["audio"]), \
+            None if tag < 0 else self._tags[tag]
+
+    def pop(self):
+        """Remove the oldest frame and return it as (data, keyframe, timestamp, audio, tag)."""
+        entry = self._pop_index()
+        offset, length = int(entry["offset"]), int(entry["length"])
+        segment, start = divmod(offset, self.segment_bytes)
+        return self._entry_tuple(self._maps[segment][start:start + length], entry)
+
+    def pop_entry(self):
+        """Remove the oldest frame without reading it back, returning it as pop does but with data None."""
+        return self._entry_tuple(None, self._pop_index())
+
+    def append(self, data, keyframe, timestamp, audio=False, tag=None, read_evicted=True):
+        """Add a frame, returning a list of the frames evicted to make room for it, oldest first.
+
+        The evicted frames are in the form that pop returns, or that pop_entry returns if read_evicted
+        is False, which saves reading them back. A frame bigger than a segment can't be kept, so
+        everything in the ring is evicted, followed by the new frame itself.
+        """
+        pop = self.pop if read_evicted else self.pop_entry
+        length = len(data)
+        if length > self.segment_bytes:
+            evicted = [pop() for _ in range(len(self))]
+            self.frames_evicted += len(evicted)
+            return evicted + [(bytes(data) if read_evicted else None, keyframe, timestamp, audio, tag)]
+        evicted = []
+        if len(self) == len(self._index):
+            evicted.append(pop())
+        if self._first_seq == self._next_seq:
+            self._head = 0
+        # Frames don't straddle segments, so one that won't fit goes at the start of the next segment.
+        segment, start = divmod(self._head, self.segment_bytes)
+        if start + length > self.segment_bytes:
+            offset = (segment + 1) % self.num_segments * self.segment_bytes
+        else:
+            offset = self._head
+        # Evict whatever starts between the head and the end of the new frame, going round the ring.
+        zone = (offset - self._head) % self.size + length
+        while self._first_seq < self._next_seq:
+            oldest = int(self._index[self._first_seq % len(self._index)]["offset"])
+            if (oldest - self._head) % self.size >= zone:
+                break
+            evicted.append(pop())
+        segment, start = divmod(offset, self.segment_bytes)
+        self._maps[segment][start:start + length] = data
+        self._index[self._next_seq % len(self._index)] = \
+            (offset, length, timestamp, keyframe, audio, self._tag_id(tag))
+        self._next_seq += 1
+        self._head = (offset + length) % self.size
+        self.frames_evicted += len(evicted)
+        return evicted
+
+    def clear(self):
+        """Discard every frame."""
+        self._first_seq = self._next_seq
+        self._head = 0
+        self._tags = []
+
+    def close(self):
+        """Unmap the segment files, which frees their space."""
+        for m in self._maps:
+            m.close()
+        self._maps = []
@@ -1,7 +1,21 @@
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from logging import getLogger
 from threading import Event
 
+from .fileoutput import FileOutput
 from .output import Output
 
+_log = getLogger(__name__)
+
+# The segment index is this magic, then a record for each segment: start and end PTS and wall clock start
+# time (all in microseconds), size in bytes, and the length of the path, followed by the path itself.
+_INDEX_MAGIC = b"PC2SEGS1"
+_INDEX_RECORD = struct.Struct("<qqqQH")
+
 
 class SplittableOutput(Output):
     """
@@ -11,15 +25,55 @@ class SplittableOutput(Output):
     it switches seamlessly from the current output, which is closed, to a new one, without dropping
     any frames. By default, it performs the switch at a video keyframem though it can be told not to
     wait for one (by setting wait_for_keyframe to False).
+
+    It can also split the output automatically, every segment_duration_ms of video or every segment_bytes
+    bytes, whichever comes first. Each segment goes to a new output, made by calling output_factory
+    (FileOutput by default) with a path made from path_pattern, which is formatted with the segment
+    "number" and the local "time" of its first frame, for example:
+
+        SplittableOutput(segment_duration_ms=60000, path_pattern="{time:%Y%m%d-%H%M%S}.mp4",
+                         output_factory=PyavOutput, index_path="segments.idx")
+
+    Splits happen at the first video keyframe once a segment is due to end, and the next segment's output
+    is created and started ahead of time, so there is no gap between them. Until its first frame arrives,
+    a segment is written under a temporary name (its file name with ".part<number>-" in front), and it is
+    renamed once that frame says what its path should be. A split that would give the new segment the
+    same path as the current one (a "time" format without seconds, say) waits until the path changes.
+    Outputs are opened, renamed and closed in a thread of their own, so the encoder is never held up.
+    If index_path is given, a record of every finished segment (its start and end PTS, the wall clock time
+    it starts at, its path and its size) is appended to that file, which read_index and find_segment can use.
     """
 
-    def __init__(self, output=None, *args, **kwargs):
+    def __init__(self, output=None, *args, segment_duration_ms=None, segment_bytes=None, path_pattern=None,
+                 output_factory=FileOutput, index_path=None, **kwargs):
         super().__init__(*args, **kwargs)
         self._output = output
         self._new_output = None
         self._split_done = Event()
         self._streams = []
         self.needs_add_stream = True
+        self.segment_duration_ms = segment_duration_ms
+        self.segment_bytes = segment_bytes
+        self.path_pattern = path_pattern
+        self.output_factory = output_factory
+        self.index_path = index_path
+        self._auto = segment_duration_ms is not None or segment_bytes is not None
+        if self._auto and (output is not None or path_pattern is None):
+            raise RuntimeError("Automatic segmenting needs a path_pattern, and no output")
+        # The thread that opens and closes segments' outputs, while started.
+        self._jobs = None
+        self._segment_number = 0
+        # The current segment's path, which is None until its first frame arrives and it is renamed
+        # from its temporary path to this.
+        self._path = None
+        self._temp_path = None
+        self._number = None
+        # The current segment's [start PTS, end PTS, bytes, wall clock start] once it has any frames.
+        self._segment = None
+        self._next = None
+        self._time_base = None
+        # The path we last warned couldn't be split from, so as to warn only once per segment.
+        self._stuck_path = None
 
     def split_output(self, new_output, wait_for_keyframe=True):
         """
@@ -45,6 +99,8 @@ class SplittableOutput(Output):
             old_output.stop()
 
     def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+        if self._auto and self.recording:
+            self._roll(keyframe, timestamp, audio)
         # Audio frames probably always say they're keyframes, but we must wait for a video one.
         if self._new_output and (not self._wait_for_keyframe or (not audio and keyframe)):
             self._split_done.set()
@@ -52,16 +108,183 @@ class SplittableOutput(Output):
             self._output = self._new_output
             self._new_output = None
         if self._output:
+            if self._auto and self._path is None:
+                self._name_segment(self._wall_time(timestamp))
             self._output.outputframe(frame, keyframe, timestamp, packet, audio)
+            if self._auto and timestamp is not None:
+                size = len(frame) if frame is not None else packet.size if packet is not None else 0
+                if self._segment is None:
+                    self._segment = [timestamp, timestamp, 0, self._wall_time(timestamp)]
+                self._segment[1] = max(self._segment[1], timestamp)
+                self._segment[2] += size
+
+    def _wall_time(self, timestamp):
+        # The wall clock time of a frame, in microseconds since the epoch.
+        if timestamp is None:
+            return time.time_ns() // 1000
+        if self._time_base is None:
+            self._time_base = time.time_ns() // 1000 - timestamp
+        return self._time_base + timestamp
+
+    def _segment_path(self, number, wall_time):
+        return self.path_pattern.format(number=number, time=datetime.fromtimestamp(wall_time / 1000000))
+
+    def _make_output(self):
+        # Create and start the output for the next segment, telling it about the streams we know of. It
+        # gets a temporary path, as its real one depends on when its first frame arrives.
+        number = self._segment_number
+        self._segment_number += 1
+        directory, name = os.path.split(self._segment_path(number, time.time_ns() // 1000))
+        temp_path = os.path.join(directory, f".part{number}-{name}")
+        output = self.output_factory(temp_path)
+        output.start()
+        for encoder_stream, codec, kwargs in self._streams:
+            output._add_stream(encoder_stream, codec, **kwargs)
+        return output, temp_path, number
+
+    def _name_segment(self, wall_time):
+        # The current segment's first frame has arrived, so it can be given its real path.
+        self._path = self._segment_path(self._number, wall_time)
+        self._jobs.submit(self._rename, self._temp_path, self._path)
+
+    @staticmethod
+    def _rename(temp_path, path):
+        try:
+            # Outputs that don't write to the file system (or haven't yet) have nothing to rename.
+            if os.path.exists(temp_path):
+                os.replace(temp_path, path)
+        except Exception as e:
+            _log.error(f"Failed to rename segment {temp_path} to {path}: {e}")
+
+    def _roll(self, keyframe, timestamp, audio):
+        # Called before each frame is written when segmenting automatically, to switch to the next
+        # segment's output if the current segment is due to end and this is a video keyframe.
+        if self._next is None:
+            self._next = self._jobs.submit(self._make_output)
+        segment = self._segment
+        if segment is None or audio or not keyframe or not self._next.done():
+            return
+        # Frames without timestamps can only end a segment by size.
+        if not (self.segment_duration_ms is not None and timestamp is not None and
+                timestamp - segment[0] >= self.segment_duration_ms * 1000) \
+           and not (self.segment_bytes is not None and segment[2] >= self.segment_bytes):
+            return
+        try:
+            output, temp_path, number = self._next.result()
+        except Exception as e:
+            # Carry on with the current segment, and try again at the next keyframe.
+            _log.error(f"Failed to open next segment: {e}")
+            self._next = None
+            return
+        wall_time = self._wall_time(timestamp)
+        if self._segment_path(number, wall_time) == self._path:
+            # The new segment would overwrite the current one, which had better carry on for now.
+            if self._stuck_path != self._path:
+                _log.warning(f"Next segment would also be {self._path}, waiting for a different path")
+                self._stuck_path = self._path
+            return
+        self._next = None
+        self._jobs.submit(self._finish_segment, self._output, self._path, segment)
+        self._output, self._temp_path, self._number, self._segment = output, temp_path, number, None
+        self._name_segment(wall_time)
+        self._next = self._jobs.submit(self._make_output)
+
+    def _finish_segment(self, output, path, segment):
+        # Close a segment's output and record it in the index.
+        try:
+            output.stop()
+            if segment is None or self.index_path is None:
+                return
+            start_pts, end_pts, size, start_time = segment
+            if os.path.isfile(path):
+                size = os.path.getsize(path)
+            path = os.fsencode(path)
+            with open(self.index_path, "ab") as f:
+                if f.tell() == 0:
+                    f.write(_INDEX_MAGIC)
+                f.write(_INDEX_RECORD.pack(start_pts, end_pts, start_time, size, len(path)) + path)
+        except Exception as e:
+            _log.error(f"Failed to finish segment {path}: {e}")
+
+    @staticmethod
+    def read_index(index_path):
+        """Return a list of the segments recorded in a segment index, oldest first.
+
+        Each is a dictionary with the segment's "start_pts" and "end_pts" (in microseconds since the
+        recording started), "start_time" (the wall clock time of its first frame, in microseconds since
+        the epoch), "path" and "size" in bytes.
+        """
+        with open(index_path, "rb") as f:
+            data = f.read()
+        if not data.startswith(_INDEX_MAGIC):
+            raise RuntimeError(f"{index_path} is not a segment index")
+        segments = []
+        pos = len(_INDEX_MAGIC)
+        # A record cut short (if writing it was interrupted) is ignored.
+        while pos + _INDEX_RECORD.size <= len(data):
+            start_pts, end_pts, start_time, size, length = _INDEX_RECORD.unpack_from(data, pos)
+            pos += _INDEX_RECORD.size
+            if pos + length > len(data):
+                break
+            segments.append({"start_pts": start_pts, "end_pts": end_pts, "start_time": start_time,
+                             "path": os.fsdecode(data[pos:pos + length]), "size": size})
+            pos += length
+        return segments
+
+    @staticmethod
+    def find_segment(index_path, when):
+        """Return the segment (as read_index gives it) containing the given time, or None.
+
+        :param when: Wall clock time to look for
+        :type when: datetime or float (seconds since the epoch)
+        """
+        if isinstance(when, datetime):
+            when = when.timestamp()
+        when_us = int(when * 1000000)
+        for segment in reversed(SplittableOutput.read_index(index_path)):
+            start = segment["start_time"]
+            if start <= when_us <= start + segment["end_pts"] - segment["start_pts"]:
+                return segment
+        return None
 
     def start(self):
         super().start()
-        if self._output:
+        if self._auto:
+            # The encoder tells us about its streams again every time it starts.
+            self._streams = []
+            self._time_base = None
+            self._jobs = ThreadPoolExecutor(1, thread_name_prefix="picamera2-segments")
+            self._output, self._temp_path, self._number = self._make_output()
+            self._path = None
+        elif self._output:
             self._output.start()
 
     def stop(self):
         super().stop()
-        if self._output:
+        if self._auto:
+            # Throw away any output opened ahead of time, and finish the last segment.
+            if self._next is not None:
+                try:
+                    output, temp_path, _ = self._next.result()
+                    output.stop()
+                    if os.path.isfile(temp_path):
+                        os.remove(temp_path)
+                    # It was the last one made, so the next recording can have its number.
+                    self._segment_number -= 1
+                except Exception:
+                    pass
+                self._next = None
+            if self._output:
+                if self._path is None:
+                    # No frames ever arrived, so name the segment after the time it finished.
+                    self._name_segment(time.time_ns() // 1000)
+                self._jobs.submit(self._finish_segment, self._output, self._path, self._segment)
+            # This waits for the last segment to be finished, and lets the thread go.
+            if self._jobs is not None:
+                self._jobs.shutdown(wait=True)
+                self._jobs = None
+            self._output, self._path, self._temp_path, self._segment = None, None, None, None
+        elif self._output:
             self._output.stop()
 
     def _add_stream(self, encoder_stream, codec_name, **kwargs):
@@ -0,0 +1,328 @@
+"""Serve encoded frames to many TCP, HTTP and WebSocket clients from one asyncio loop"""
+
+import asyncio
+import base64
+import hashlib
+import socket
+import struct
+import threading
+from logging import getLogger
+
+import numpy as np
+
+from .output import Output
+
+_log = getLogger(__name__)
+
+_WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+# The longest frame a client may send, which is the longest a control frame can be.
+_MAX_CLIENT_FRAME = 125
+_CONTENT_TYPES = {"h264": "video/h264", "mjpeg": "multipart/x-mixed-replace; boundary=FRAME"}
+
+
+def _websocket_header(opcode, length):
+    # The header of an unmasked, final WebSocket frame, as servers send them.
+    if length < 126:
+        return struct.pack(">BB", 0x80 | opcode, length)
+    if length < 65536:
+        return struct.pack(">BBH", 0x80 | opcode, 126, length)
+    return struct.pack(">BBQ", 0x80 | opcode, 127, length)
+
+
+class _StreamClient:
+    # A connected client. Its transport's write buffer is its queue of frames, which the StreamServerOutput
+    # keeps within bounds by skipping frames, rather than ever waiting for the client.
+
+    def __init__(self, server, writer, kind):
+        self.server = server
+        self.writer = writer
+        self.transport = writer.transport
+        self.kind = kind
+        self.peer = writer.get_extra_info("peername")
+        self.waiting_for_keyframe = True
+        self.frames_sent = 0
+        self.frames_dropped = 0
+
+    def send(self, frame, keyframe):
+        if self.transport.is_closing():
+            return
+        server = self.server
+        buffered = self.transport.get_write_buffer_size()
+        if self.waiting_for_keyframe:
+            # Start (or start again, after falling behind) at a keyframe, once the backlog has mostly gone.
+            if not keyframe or buffered > server.max_queue_bytes // 2:
+                self.frames_dropped += 1
+                server.frames_dropped += 1
+                return
+            self.waiting_for_keyframe = False
+        elif buffered >= server.max_queue_bytes:
+            _log.debug(f"Client {self.peer} has fallen behind, skipping to the next keyframe")
+            self.waiting_for_keyframe = True
+            self.frames_dropped += 1
+            server.frames_dropped += 1
+            server.lag_events += 1
+            return
+        if self.kind == "websocket":
+            self.transport.writelines((_websocket_header(0x2, len(frame)), frame))
+        elif self.kind == "http" and server.codec == "mjpeg":
+            self.transport.writelines((f"--FRAME\r\nContent-Type: image/jpeg\r\nContent-Length: {len(frame)}"
+                                       "\r\n\r\n".encode(), frame, b"\r\n"))
+        else:
+            self.transport.write(frame)
+        self.frames_sent += 1
+        server.frames_sent += 1
+
+
+class StreamServerOutput(Output):
+    """
+    The StreamServerOutput serves an encoder's H.264 or MJPEG frames to any number of network clients.
+
+    All the clients are handled by a single asyncio event loop on a thread of its own. Each frame is
+    handed to the loop once, and written to every client without copying it again, so the cost per client
+    is small and no thread wakes per client per frame. Clients can connect in any of three ways:
+
+    - plain TCP, sending nothing (for example "nc <host> 8000 | ffplay -"), to receive the raw stream.
+    - HTTP GET, to receive the raw H.264 stream, or an MJPEG stream that browsers can show in an <img>.
+    - WebSocket, to receive each frame as a binary message.
+
+    Each client's queue of frames is bounded by max_queue_bytes. A client that falls behind has frames
+    skipped until the next keyframe (every frame is one, for MJPEG), so it never holds up the encoder or
+    other clients. New clients start at a keyframe too, so H.264 encoders should repeat their headers.
+
+    The counters frames_sent, frames_dropped (across all clients) and lag_events (the number of times a
+    client fell behind) are reported by stats, along with the number of clients.
+
+    Parameters:
+    port - the port to listen on, or 0 to choose a free one (the port attribute says which once started).
+    host - the address to listen on, by default all of them.
+    codec - "h264" or "mjpeg".
+    max_queue_bytes - the most bytes that may wait to be sent to a client.
+    max_clients - the most clients that may connect, or None for no limit.
+    """
+
+    def __init__(self, port=8000, host=None, codec="h264", max_queue_bytes=2 * 1024 * 1024, max_clients=None):
+        """Create a stream server output
+
+        :param port: Port to listen on, defaults to 8000
+        :type port: int, optional
+        :param host: Address to listen on, defaults to None (all addresses)
+        :type host: str, optional
+        :param codec: "h264" or "mjpeg", defaults to "h264"
+        :type codec: str, optional
+        :param max_queue_bytes: Most bytes waiting to be sent to each client, defaults to 2MB
+        :type max_queue_bytes: int, optional
+        :param max_clients: Most clients that may connect, defaults to None (no limit)
+        :type max_clients: int, optional
+        """
+        super().__init__()
+        if codec not in _CONTENT_TYPES:
+            raise RuntimeError(f"Unsupported codec {codec}")
+        self.port = port
+        self.host = host
+        self.codec = codec
+        self.max_queue_bytes = max_queue_bytes
+        self.max_clients = max_clients
+        # How long to wait for a client to say whether it's speaking HTTP, before treating it as plain TCP.
+        self.sniff_timeout = 0.5
+        # Allow for many viewers connecting at once.
+        self.backlog = 256
+        self._clients = set()
+        self._tasks = set()
+        self._loop = None
+        self._thread = None
+        self._servers = []
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.lag_events = 0
+
+    @property
+    def num_clients(self):
+        """The number of clients receiving the stream."""
+        return len(self._clients)
+
+    def stats(self):
+        """Return a dictionary of this output's counters."""
+        return {"clients": self.num_clients, "frames_sent": self.frames_sent,
+                "frames_dropped": self.frames_dropped, "lag_events": self.lag_events}
+
+    def start(self):
+        """Start listening for clients"""
+        if self._thread is not None:
+            return
+        self.frames_sent = self.frames_dropped = self.lag_events = 0
+        started = threading.Event()
+        error = []
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            try:
+                self._servers = self._loop.run_until_complete(self._listen())
+                self.port = self._servers[0].sockets[0].getsockname()[1]
+            except Exception as e:
+                error.append(e)
+                started.set()
+                self._loop.close()
+                return
+            started.set()
+            self._loop.run_forever()
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="picamera2-stream-server", daemon=True)
+        self._thread.start()
+        started.wait()
+        if error:
+            self._thread = None
+            raise error[0]
+        super().start()
+
+    def stop(self):
+        """Disconnect all the clients and stop listening"""
+        super().stop()
+        if self._thread is None:
+            return
+
+        async def shutdown():
+            for server in self._servers:
+                server.close()
+            # Dropping the connections lets each client's handler finish by itself.
+            for client in list(self._clients):
+                client.transport.abort()
+            if self._tasks:
+                await asyncio.wait(self._tasks, timeout=1 + self.sniff_timeout)
+            for server in self._servers:
+                await server.wait_closed()
+            self._loop.stop()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop)
+        self._thread.join()
+        self._thread = None
+        self._servers = []
+        self._clients.clear()
+
+    async def _listen(self):
+        # Return the servers listening for clients, of which there's one per address family when port is 0.
+        if self.port:
+            return [await asyncio.start_server(self._handle_client, self.host, self.port, reuse_address=True,
+                                               backlog=self.backlog)]
+        return [await asyncio.start_server(self._handle_client, sock=sock, backlog=self.backlog)
+                for sock in self._bind_free_port()]
+
+    def _bind_free_port(self):
+        # Listening on all addresses takes a socket per address family (IPv4 and IPv6), and each would be
+        # given a different free port. So let the first choose one, and bind the rest to that same port.
+        infos = dict.fromkeys((family, kind, proto, address)
+                              for family, kind, proto, _, address in
+                              socket.getaddrinfo(self.host, 0, type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE))
+        for attempt in range(10):
+            sockets = []
+            port = 0
+            try:
+                for family, kind, proto, address in infos:
+                    sock = socket.socket(family, kind, proto)
+                    sockets.append(sock)
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                    if family == socket.AF_INET6:
+                        # Otherwise the IPv6 socket would take the IPv4 port too.
+                        sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+                    sock.bind((address[0], port) + address[2:])
+                    sock.setblocking(False)
+                    port = sock.getsockname()[1]
+                return sockets
+            except OSError:
+                for sock in sockets:
+                    sock.close()
+                # The port the first socket got may be taken in another family, so try a different one.
+                if len(sockets) < 2 or attempt == 9:
+                    raise
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+        """Send a frame to all the clients
+
+        :param frame: Frame
+        :type frame: bytes
+        :param keyframe: Whether frame is a keyframe, defaults to True
+        :type keyframe: bool, optional
+        :param timestamp: Timestamp of frame
+        :type timestamp: int
+        """
+        if audio or not self.recording or self._loop is None:
+            return
+        # The encoder may reuse its buffer once we return, so we need our own copy (but only the one).
+        if not isinstance(frame, bytes):
+            frame = bytes(frame)
+        try:
+            self._loop.call_soon_threadsafe(self._broadcast, frame, keyframe)
+        except RuntimeError:
+            # The loop has been closed.
+            pass
+        self.outputtimestamp(timestamp)
+
+    def _broadcast(self, frame, keyframe):
+        for client in self._clients:
+            client.send(frame, keyframe)
+
+    async def _handle_client(self, reader, writer):
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = None
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            if self.max_clients is not None and len(self._clients) >= self.max_clients:
+                return
+            kind = "tcp"
+            try:
+                line = await asyncio.wait_for(reader.readline(), self.sniff_timeout)
+            except asyncio.TimeoutError:
+                line = b""
+            if line.startswith(b"GET "):
+                headers = {}
+                while (header := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                if headers.get("upgrade", "").lower() == "websocket":
+                    key = headers.get("sec-websocket-key", "").encode()
+                    accept = base64.b64encode(hashlib.sha1(key + _WEBSOCKET_GUID).digest()).decode()
+                    writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                                  f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+                    kind = "websocket"
+                else:
+                    writer.write((f"HTTP/1.1 200 OK\r\nContent-Type: {_CONTENT_TYPES[self.codec]}\r\n"
+                                  "Cache-Control: no-cache, private\r\nPragma: no-cache\r\nConnection: close\r\n\r\n")
+                                 .encode())
+                    kind = "http"
+            client = _StreamClient(self, writer, kind)
+            self._clients.add(client)
+            # Nothing more needs doing until the client goes away, apart from answering WebSocket control frames.
+            if kind == "websocket":
+                await self._read_websocket(reader, client)
+            else:
+                while await reader.read(4096):
+                    pass
+        except (ConnectionError, asyncio.IncompleteReadError, UnicodeDecodeError):
+            pass
+        finally:
+            self._tasks.discard(task)
+            if client is not None:
+                self._clients.discard(client)
+            writer.transport.abort()
+
+    async def _read_websocket(self, reader, client):
+        while True:
+            first, second = await reader.readexactly(2)
+            opcode, length = first & 0x0F, second & 0x7F
+            if length > _MAX_CLIENT_FRAME:
+                # Clients have no business sending us anything but control frames, which are short, so
+                # rather than read a big frame we close the connection ("message too big").
+                client.transport.write(_websocket_header(0x8, 2) + struct.pack(">H", 1009))
+                return
+            mask = await reader.readexactly(4) if second & 0x80 else bytes(4)
+            payload = await reader.readexactly(length)
+            payload = (np.frombuffer(payload, dtype=np.uint8) ^
+                       np.resize(np.frombuffer(mask, dtype=np.uint8), length)).tobytes()
+            if opcode == 0x8:
+                client.transport.write(_websocket_header(0x8, len(payload[:2])) + payload[:2])
+                return
+            if opcode == 0x9:
+                client.transport.write(_websocket_header(0xA, len(payload)) + payload)
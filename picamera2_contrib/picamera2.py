@@ -26,16 +26,23 @@ from PIL import Image
 import picamera2_contrib.formats as formats
 import picamera2_contrib.platform as Platform
 import picamera2_contrib.utils as utils
-from picamera2_contrib.allocators import DmaAllocator
+from picamera2_contrib.allocators import DmaAllocator, PersistentAllocator
 from picamera2_contrib.encoders import Encoder, H264Encoder, MJPEGEncoder, Quality
 from picamera2_contrib.outputs import FfmpegOutput, FileOutput
 from picamera2_contrib.previews import DrmPreview, NullPreview, QtGlPreview, QtPreview
 
+from .aio import AsyncPicamera2
+from .callback_executor import CallbackExecutor
 from .configuration import CameraConfiguration
 from .controls import Controls
 from .job import Job
+from .metadata_recorder import MetadataRecorder
+from .prepared_configuration import PreparedConfiguration
 from .request import CompletedRequest, Helpers
+from .save_pipeline import SavePipeline
 from .sensor_format import SensorFormat
+from .subscription import BackpressurePolicy, Subscription
+from .tracing import FrameTracer
 
 STILL = libcamera.StreamRole.StillCapture
 RAW = libcamera.StreamRole.Raw
@@ -138,8 +145,12 @@ class CameraManager:
             for req in self.cms.get_ready_requests():
                 if req.status == libcamera.Request.Status.Complete and req.cookie != flushid:
                     cams.add(req.cookie)
-                    with self.cameras[req.cookie]._requestslock:
-                        self.cameras[req.cookie]._requests += [CompletedRequest(req, self.cameras[req.cookie])]
+                    camera = self.cameras[req.cookie]
+                    completed_request = CompletedRequest(req, camera)
+                    if camera.tracer is not None:
+                        camera.tracer.mark_request(completed_request, "completed")
+                    with camera._requestslock:
+                        camera._requests += [completed_request]
             for c in cams:
                 os.write(self.cameras[c].notifyme_w, b"\x00")
 
@@ -344,6 +355,7 @@ class Picamera2:
         self.request_lock = threading.Lock()  # global lock used by requests
         self._requestslock = threading.Lock()
         self._requests = []
+        self._aio = None
         if verbose_console is None:
             verbose_console = int(os.environ.get('PICAMERA2_LOG_LEVEL', '0'))
         self.verbose_console = verbose_console
@@ -372,6 +384,13 @@ class Picamera2:
         # Set Allocator
         self.allocator = DmaAllocator() if allocator is None else allocator
 
+    @property
+    def aio(self) -> AsyncPicamera2:
+        """An asyncio front-end to this camera, whose capture methods return awaitables rather than blocking."""
+        if self._aio is None:
+            self._aio = AsyncPicamera2(self)
+        return self._aio
+
     @property
     def camera_manager(self) -> libcamera.CameraManager:
         return Picamera2._cm.cms
@@ -390,8 +409,13 @@ class Picamera2:
         self._job_list = []
         self.options = {}
         self._encoders = set()
+        self._subscriptions = []
         self.pre_callback = None
         self.post_callback = None
+        self.callback_executor: Optional[CallbackExecutor] = None
+        self.tracer: Optional[FrameTracer] = None
+        self.metadata_recorder: Optional[MetadataRecorder] = None
+        self.save_pipeline: Optional[SavePipeline] = None
         self.completed_requests = []
         self.lock = threading.Lock()  # protects the _job_list and completed_requests fields
         self._event_loop_running = False
@@ -401,6 +425,8 @@ class Picamera2:
         self.sensor_modes_ = []
         self._title_fields = []
         self._frame_drops = 0
+        self._prepared_configurations = {}
+        self._prepared_config = None
 
     @property
     def preview_configuration(self) -> CameraConfiguration:
@@ -702,6 +728,11 @@ class Picamera2:
             return
 
         self.stop()
+        with self.lock:
+            subscriptions = self._subscriptions
+            self._subscriptions = []
+        for subscription in subscriptions:
+            subscription.close()
         # camera.release() now throws an error if it fails.
         self.camera.release()
         self._cm.cleanup(self.camera_idx)
@@ -712,6 +743,8 @@ class Picamera2:
         self.camera_ctrl_info = {}
         self.camera_config = {}
         self.libcamera_config = {}
+        self._prepared_configurations = {}
+        self._prepared_config = None
         self.preview_configuration = {}
         self.still_configuration = {}
         self.video_configuration = {}
@@ -1064,6 +1097,23 @@ class Picamera2:
             requests.append(request)
         return requests
 
+    def _start_requests(self):
+        # Prepared configurations make their requests only once, and recycle them on every restart.
+        prepared = self._prepared_config
+        if prepared is None:
+            return self._make_requests()
+        if prepared.requests is None:
+            prepared.requests = self._make_requests()
+            return prepared.requests
+        requests = []
+        for request in prepared.requests:
+            # Leave out any whose buffers the application is still holding on to from an earlier run.
+            if any(self.allocator.mapped_buffers_used.get(buffer.planes[0].fd) for buffer in request.buffers.values()):
+                continue
+            request.reuse()
+            requests.append(request)
+        return requests
+
     def _update_stream_config(self, stream_config, libcamera_stream_config):
         # Update our stream config from libcamera's.
         stream_config["format"] = str(libcamera_stream_config.pixel_format)
@@ -1097,13 +1147,18 @@ class Picamera2:
         """Configure the camera system with the given configuration.
 
         :param camera_config: Camera configuration to be set
-        :type camera_config: str, dict or CameraConfiguration
+        :type camera_config: str, dict, CameraConfiguration or PreparedConfiguration
         :raises RuntimeError: Failed to configure at runtime
         :raises TypeError: Invalid type for `camera_config` given
         """
         if self.started:
             raise RuntimeError("Camera must be stopped before configuring")
 
+        if isinstance(camera_config, PreparedConfiguration):
+            self._configure_prepared(camera_config)
+            return
+        self._prepared_config = None
+
         initial_config = camera_config
 
         if isinstance(camera_config, str):
@@ -1152,7 +1207,18 @@ class Picamera2:
         elif status == libcamera.CameraConfiguration.Status.Adjusted:
             _log.info("Camera configuration has been adjusted!")
 
-        # Configure libcamera.
+        self._apply_configuration(camera_config, libcamera_config)
+
+        # Fill in the embedded configuration structures if those were used.
+        if initial_config == "still":
+            self.still_configuration.update(camera_config)
+        elif initial_config == "video":
+            self.video_configuration.update(camera_config)
+        elif isinstance(initial_config, str):
+            self.preview_configuration.update(camera_config)
+
+    def _apply_configuration(self, camera_config, libcamera_config):
+        # Configure libcamera with a validated configuration, and set ourselves up to match.
         if self.camera.configure(libcamera_config):
             raise RuntimeError(f"Configuration failed: {camera_config}")
         _log.info("Configuration successful!")
@@ -1196,14 +1262,6 @@ class Picamera2:
         self.libcamera_config = libcamera_config
         self.camera_config = camera_config
 
-        # Fill in the embedded configuration structures if those were used.
-        if initial_config == "still":
-            self.still_configuration.update(camera_config)
-        elif initial_config == "video":
-            self.video_configuration.update(camera_config)
-        elif isinstance(initial_config, str):
-            self.preview_configuration.update(camera_config)
-
         # Set the controls directly so as to overwrite whatever is there.
         self.controls = Controls(self, controls=self.camera_config['controls'])
         self.configure_count += 1
@@ -1220,6 +1278,58 @@ class Picamera2:
         """Configure the camera system with the given configuration. Defaults to the 'preview' configuration."""
         self.configure_("preview" if camera_config is None else camera_config)
 
+    def _configure_prepared(self, prepared):
+        if self._prepared_configurations.get(prepared.use_case) is not prepared:
+            raise RuntimeError("Prepared configuration has been released")
+        self.libcamera_config = {}
+        self.camera_config = {}
+        self.lores_index = prepared.lores_index
+        self.raw_index = prepared.raw_index
+        self._apply_configuration(prepared.camera_config.copy(), prepared.libcamera_config)
+        self._prepared_config = prepared
+
+    def prepare_configuration(self, camera_config) -> PreparedConfiguration:
+        """Validate a configuration and allocate its buffers now, so that switching to it later is fast.
+
+        The camera must be using a PersistentAllocator, and must be stopped. Each prepared configuration
+        needs its own use_case, as this is the key under which the allocator keeps its buffers. The camera
+        is left configured in the newly prepared configuration.
+        """
+        if not isinstance(self.allocator, PersistentAllocator):
+            raise RuntimeError("Prepared configurations need a PersistentAllocator")
+        if isinstance(camera_config, PreparedConfiguration):
+            return camera_config
+        self.configure_(camera_config)
+        use_case = self.camera_config.get("use_case")
+        if use_case is None or use_case in self._prepared_configurations:
+            self.libcamera_config = {}
+            self.camera_config = {}
+            raise RuntimeError(f"Prepared configurations need a unique use_case, not {use_case!r}")
+        prepared = PreparedConfiguration(self.camera_config.copy(), self.libcamera_config,
+                                         self.lores_index, self.raw_index)
+        self._prepared_configurations[use_case] = prepared
+        self._prepared_config = prepared
+        return prepared
+
+    def release_prepared_configuration(self, prepared) -> None:
+        """Free the buffers belonging to a prepared configuration that is no longer wanted."""
+        if self._prepared_configurations.get(prepared.use_case) is not prepared:
+            return
+        if self._prepared_config is prepared and self.started:
+            raise RuntimeError("Cannot release the prepared configuration that the camera is running")
+        if self._prepared_config is prepared:
+            self._prepared_config = None
+            self.libcamera_config = {}
+            self.camera_config = {}
+        del self._prepared_configurations[prepared.use_case]
+        prepared.requests = None
+        self.allocator.deallocate(prepared.use_case)
+
+    @property
+    def prepared_configurations(self) -> list[PreparedConfiguration]:
+        """The configurations that have been prepared and not released."""
+        return list(self._prepared_configurations.values())
+
     def camera_configuration(self) -> dict[str, Any]:
         """Return the camera configuration."""
         return self.camera_config
@@ -1250,7 +1360,7 @@ class Picamera2:
         self.controls = Controls(self)
         # camera.start() now throws an error if it fails.
         self.camera.start(controls)
-        for request in self._make_requests():
+        for request in self._start_requests():
             self.camera.queue_request(request)
         _log.info("Camera started")
         self.started = True
@@ -1320,6 +1430,8 @@ class Picamera2:
             while len(self.completed_requests) > 0:
                 self.completed_requests.pop(0).release()
             self.completed_requests = []
+            for subscription in list(self._subscriptions):
+                subscription.flush()
             _log.info("Camera stopped")
         return (True, None)
 
@@ -1354,6 +1466,23 @@ class Picamera2:
             else:
                 req.release()
         self.frames += len(requests)
+        tracer = self.tracer
+        if tracer is not None:
+            for req in requests:
+                tracer.mark_request(req, "process")
+        recorder = self.metadata_recorder
+        if recorder is not None:
+            for req in requests:
+                recorder.record(req)
+        # With a callback_executor, callbacks run in its worker pool, and a frame whose callback misses
+        # the deadline skips it. The pre_callback must finish before the requests become visible to
+        # applications, so we run it before taking the lock.
+        executor = self.callback_executor
+        missed = set()
+        if executor is not None and self.pre_callback and requests:
+            self._trace_requests(tracer, requests, "pre_callback")
+            missed = executor.run(self.pre_callback, requests)
+            self._trace_requests(tracer, requests, "pre_callback_end")
         # It works like this:
         # * We maintain a list of the requests that libcamera has completed (completed_requests).
         #   But we keep only a minimal number here so that we have one available to "return
@@ -1378,11 +1507,15 @@ class Picamera2:
                 display_request.acquire()
                 display_request.display = True  # display requests by default
 
-            if self.pre_callback:
+            if self.pre_callback and executor is None:
                 for req in requests:
                     # Some applications may (for example) want us to draw something onto these images before
                     # encoding or copying them for an application.
+                    if tracer is not None:
+                        tracer.mark_request(req, "pre_callback")
                     self.pre_callback(req)
+                    if tracer is not None:
+                        tracer.mark_request(req, "pre_callback_end")
 
             # See if we have a job to do. When executed, if it returns True then it's done and
             # we can discard it. Otherwise it remains here to be tried again next time.
@@ -1394,21 +1527,18 @@ class Picamera2:
                 else:
                     break
 
-            for req in requests:
-                # Some applications may want to do something to the image after they've had a change
-                # to copy it, but before it goes to the video encoder.
-                if self.post_callback:
-                    self.post_callback(req)
-
-                for encoder in self._encoders:
-                    if encoder.name in self.stream_map:
-                        encoder.encode(encoder.name, req)
+            if executor is None:
+                self._deliver_requests(requests, tracer, self.post_callback)
 
-                req.release()
-
-            # We hang on to the last completed request if we have been asked to.
-            while len(self.completed_requests) > self._max_queue_len:
-                self.completed_requests.pop(0).release()
+        if executor is not None:
+            # Wait for the post_callback without holding the lock, so that a slow one doesn't hold up
+            # applications. Requests that missed the pre_callback deadline skip the post_callback too.
+            if self.post_callback and requests:
+                self._trace_requests(tracer, requests, "post_callback")
+                executor.run(self.post_callback, requests, skip=missed)
+                self._trace_requests(tracer, requests, "post_callback_end")
+            with self.lock:
+                self._deliver_requests(requests, tracer, None)
 
         # If one of the functions we ran reconfigured the camera since this request came out,
         # then we don't want it going back to the application as the memory is not valid.
@@ -1421,6 +1551,38 @@ class Picamera2:
         for job in finished_jobs:
             job.signal()
 
+    def _deliver_requests(self, requests, tracer, post_callback):
+        # Called with the lock held, to hand the requests to subscribers and encoders, running the
+        # post_callback first if we're given it.
+        for req in requests:
+            # Some applications may want to do something to the image after they've had a change
+            # to copy it, but before it goes to the video encoder.
+            if post_callback:
+                if tracer is not None:
+                    tracer.mark_request(req, "post_callback")
+                post_callback(req)
+                if tracer is not None:
+                    tracer.mark_request(req, "post_callback_end")
+
+            for subscription in self._subscriptions:
+                subscription._deliver(req)
+
+            for encoder in self._encoders:
+                if encoder.name in self.stream_map:
+                    encoder.encode(encoder.name, req)
+
+            req.release()
+
+        # We hang on to the last completed request if we have been asked to.
+        while len(self.completed_requests) > self._max_queue_len:
+            self.completed_requests.pop(0).release()
+
+    @staticmethod
+    def _trace_requests(tracer, requests, stage):
+        if tracer is not None:
+            for req in requests:
+                tracer.mark_request(req, stage)
+
     def _run_process_requests(self):
         """Cause the process_requests method to run in the event loop again."""
         os.write(self.notifyme_w, b"\x00")
@@ -1484,7 +1646,7 @@ class Picamera2:
             return (True, None)
         while self.completed_requests:
             # Check if frame started being exposed after the timestamp.
-            md = self.completed_requests[0].get_metadata()
+            md = self.completed_requests[0].metadata
             frame_timestamp_ns = md['SensorTimestamp'] - 1000 * md['ExposureTime']
             if frame_timestamp_ns >= timestamp_ns:
                 return (True, None)
@@ -1524,6 +1686,13 @@ class Picamera2:
         if not self.completed_requests:
             return (False, None)
         request = self.completed_requests.pop(0)
+        if self.save_pipeline is not None:
+            # The pipeline holds or copies the request, so we can let go of it straight away.
+            try:
+                return (True, self.save_pipeline.submit(request, file_output, name, format=format,
+                                                        exif_data=exif_data))
+            finally:
+                request.release()
         if name == "raw" and formats.is_raw(self.camera_config["raw"]["format"]):
             request.save_dng(file_output)
         else:
@@ -1561,7 +1730,9 @@ class Picamera2:
                      ) -> Union[dict[str, Any], Job[dict[str, Any]]]:
         """Capture an image to a file in the current camera mode.
 
-        Return the metadata for the frame captured.
+        Return the metadata for the frame captured. When a SavePipeline has been assigned to
+        save_pipeline, the image is saved in the background and a Future that gives the metadata is
+        returned instead.
 
         exif_data - dictionary containing user defined exif data (based on `piexif`). This will
             overwrite existing exif information generated by picamera2_contrib.
@@ -1571,9 +1742,14 @@ class Picamera2:
         return self.dispatch_functions(functions, wait, signal_function)
 
     def switch_mode_(self, camera_config):
+        start_time = time.monotonic()
         self.stop_()
         self.configure_(camera_config)
         self.start_()
+        if isinstance(camera_config, PreparedConfiguration):
+            camera_config.switch_count += 1
+            camera_config.switch_latency = time.monotonic() - start_time
+            _log.debug(f"Switched to {camera_config} in {camera_config.switch_latency * 1000:.1f}ms")
         return (True, self.camera_config)
 
     @overload
@@ -1670,7 +1846,7 @@ class Picamera2:
         exif_data - dictionary containing user defined exif data (based on `piexif`). This will
             overwrite existing exif information generated by picamera2_contrib.
         """
-        preview_config = self.camera_config
+        preview_config = self._prepared_config or self.camera_config
 
         def capture_and_switch_back_(self, file_output, preview_config, format, exif_data=exif_data):
             done, result = self.capture_file_(file_output, name, format=format, exif_data=exif_data)
@@ -1717,7 +1893,7 @@ class Picamera2:
         fragmentation. It may be preferable to use switch_mode_capture_request_and_stop and to
         release the request before restarting the original camera mode.
         """
-        preview_config = self.camera_config
+        preview_config = self._prepared_config or self.camera_config
 
         def capture_and_switch_back_(self, preview_config):
             done, result = self.capture_request_()
@@ -1848,7 +2024,7 @@ class Picamera2:
             if not self.completed_requests:
                 return (False, None)
             req = self.completed_requests.pop(0)
-            sync_ready = req.get_metadata().get('SyncReady', False)
+            sync_ready = req.metadata.get('SyncReady', False)
             if not sync_ready:
                 # Not yet synced. Discard this request and wait some more.
                 req.release()
@@ -2022,7 +2198,7 @@ class Picamera2:
 
         Then return back to the initial camera mode.
         """
-        preview_config = self.camera_config
+        preview_config = self._prepared_config or self.camera_config
 
         def capture_buffer_and_switch_back_(self, preview_config, name):
             done, result = self.capture_buffer_(name)
@@ -2069,7 +2245,7 @@ class Picamera2:
 
         Then return back to the initial camera mode.
         """
-        preview_config = self.camera_config
+        preview_config = self._prepared_config or self.camera_config
 
         def capture_buffers_and_switch_back_(self, preview_config, names):
             done, result = self.capture_buffers_and_metadata_(names)
@@ -2159,6 +2335,80 @@ class Picamera2:
         """Make 2d image arrays from the next frames in the named streams."""
         return self.dispatch_functions([partial(self.capture_arrays_and_metadata_, names)], wait, signal_function)
 
+    def capture_burst_(self, num_frames, names, arrays, metadata):
+        # arrays (one per name) are allocated on the first frame if the caller didn't supply them, and
+        # metadata accumulates the metadata of each frame. Both persist across trips round the event loop.
+        while self.completed_requests:
+            request = self.completed_requests.pop(0)
+            try:
+                index = len(metadata)
+                for i, name in enumerate(names):
+                    if arrays[i] is None:
+                        image = request.make_array(name)
+                        arrays[i] = np.empty((num_frames,) + image.shape, dtype=image.dtype)
+                        arrays[i][index] = image
+                    else:
+                        request.make_array(name, out=arrays[i][index])
+                metadata.append(request.get_metadata())
+            finally:
+                request.release()
+            if len(metadata) == num_frames:
+                return (True, (arrays, metadata))
+        return (False, None)
+
+    @overload
+    def capture_burst(self, num_frames, names=["main"], out=None, wait: None = ...,
+                      signal_function: None = ...
+                      ) -> tuple[list[NDArray[np.uint8]], list[dict[str, Any]]]:
+        ...
+
+    @overload
+    def capture_burst(self, num_frames, names=["main"], out=None, wait: None = ...,
+                      signal_function: Callable[[Job], None] = ...
+                      ) -> Job[tuple[list[NDArray[np.uint8]], list[dict[str, Any]]]]:
+        ...
+
+    @overload
+    def capture_burst(self, num_frames, names=["main"], out=None, wait: Literal[True] = ...,
+                      signal_function: Optional[Callable[[Job], None]] = ...
+                      ) -> tuple[list[NDArray[np.uint8]], list[dict[str, Any]]]:
+        ...
+
+    @overload
+    def capture_burst(self, num_frames, names=["main"], out=None, wait: Literal[False] = ...,
+                      signal_function: Optional[Callable[[Job], None]] = ...
+                      ) -> Job[tuple[list[NDArray[np.uint8]], list[dict[str, Any]]]]:
+        ...
+
+    def capture_burst(self, num_frames, names=["main"], out=None, wait=None, signal_function=None
+                      ) -> Union[
+        tuple[list[NDArray[np.uint8]], list[dict[str, Any]]],
+        Job[tuple[list[NDArray[np.uint8]], list[dict[str, Any]]]]
+    ]:
+        """Capture num_frames consecutive frames from each of the named streams as a single job.
+
+        The frames for each stream are copied into one contiguous array of shape (num_frames, ...),
+        so that a burst costs no per-frame allocations or jobs. Returns a list of these arrays (one
+        per name) together with a list of the metadata of each frame.
+
+        out - optionally, a list of arrays (one per name) into which to copy the frames. Each must
+        have shape (num_frames,) followed by the shape that capture_array would give, and the same
+        dtype. Supplying the arrays returned by an earlier burst lets them be reused without any
+        allocation at all. Otherwise new arrays are allocated when the first frame arrives.
+        """
+        if num_frames < 1:
+            raise RuntimeError("num_frames must be at least 1")
+        if out is None:
+            arrays = [None] * len(names)
+        else:
+            arrays = list(out)
+            if len(arrays) != len(names):
+                raise RuntimeError("out must have one array for each of the names")
+            if any(array.shape[0] < num_frames for array in arrays):
+                raise RuntimeError("Arrays in out have room for fewer than num_frames frames")
+        return self.dispatch_functions([partial(self.capture_burst_, num_frames, names, arrays, [])],
+                                       wait, signal_function)
+
     @overload
     def switch_mode_and_capture_array(self, camera_config, name="main", wait: None = ...,
                                       signal_function: None = ..., delay=0
@@ -2189,7 +2439,7 @@ class Picamera2:
 
         Then return back to the initial camera mode.
         """
-        preview_config = self.camera_config
+        preview_config = self._prepared_config or self.camera_config
 
         def capture_array_and_switch_back_(self, preview_config, name):
             done, result = self.capture_array_(name)
@@ -2237,7 +2487,7 @@ class Picamera2:
 
         Then return back to the initial camera mode.
         """
-        preview_config = self.camera_config
+        preview_config = self._prepared_config or self.camera_config
 
         def capture_arrays_and_switch_back_(self, preview_config, names):
             done, result = self.capture_arrays_and_metadata_(names)
@@ -2332,7 +2582,7 @@ class Picamera2:
 
         Then return back to the initial camera mode.
         """
-        preview_config = self.camera_config
+        preview_config = self._prepared_config or self.camera_config
 
         def capture_image_and_switch_back_(self, preview_config, name):
             done, result = self.capture_image_(name)
@@ -2407,6 +2657,39 @@ class Picamera2:
             for encoder in remove:
                 self._encoders.remove(encoder)
 
+    def subscribe(self, max_queue=1, policy=BackpressurePolicy.DROP_OLDEST, block_timeout=0.1) -> Subscription:
+        """Subscribe to the completed requests coming out of the camera.
+
+        Each subscription receives every request, after the post_callback has run, into its own
+        bounded queue, and applies its own policy when it falls behind. See the Subscription class
+        for more details.
+
+        :param max_queue: Maximum number of requests the subscription may queue, defaults to 1
+        :type max_queue: int, optional
+        :param policy: What to do when the queue is full, defaults to BackpressurePolicy.DROP_OLDEST
+        :type policy: BackpressurePolicy, optional
+        :param block_timeout: Longest wait (in seconds) for room in the queue with the BLOCK policy
+        :type block_timeout: float, optional
+        :return: The new subscription
+        :rtype: Subscription
+        """
+        subscription = Subscription(max_queue=max_queue, policy=policy, block_timeout=block_timeout)
+        with self.lock:
+            # Replace the list rather than appending, so the event loop can iterate it safely.
+            self._subscriptions = self._subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription) -> None:
+        """Remove a subscription, releasing any requests still in its queue."""
+        with self.lock:
+            self._subscriptions = [s for s in self._subscriptions if s is not subscription]
+        subscription.close()
+
+    @property
+    def subscriptions(self) -> list[Subscription]:
+        """The list of current subscriptions."""
+        return self._subscriptions
+
     @property
     def encoders(self) -> set[Encoder]:
         """Extract current Encoder objects
@@ -2652,7 +2935,7 @@ class Picamera2:
         def wait_for_af_state(self, states):
             if not self.completed_requests:
                 return (False, None)
-            af_state = self.completed_requests[0].get_metadata()['AfState']
+            af_state = self.completed_requests[0].metadata['AfState']
             self.completed_requests.pop(0).release()
             return (af_state in states, af_state == controls.AfStateEnum.Focused)
 
@@ -0,0 +1,41 @@
+"""Camera configurations that have been validated and allocated in advance, for fast mode switches"""
+
+
+class PreparedConfiguration:
+    """
+    A camera configuration that has already been validated by libcamera and had its buffers allocated.
+
+    These are created by Picamera2.prepare_configuration, which requires the camera to be using a
+    PersistentAllocator. They can then be passed anywhere a camera configuration is accepted, such as
+    Picamera2.configure, switch_mode or any of the switch_mode_and_capture methods. Switching to a
+    prepared configuration skips making and validating the libcamera configuration, allocating the
+    buffers and creating the requests, leaving only the camera stop, libcamera configure and restart.
+    The switch methods return to a prepared configuration in the same way if that was the mode they
+    started in.
+
+    The following are available:
+    camera_config - the final configuration dictionary, as libcamera adjusted it.
+    use_case - the PersistentAllocator key under which the buffers are kept.
+    switch_count - the number of times the camera has been switched to this configuration.
+    switch_latency - the time in seconds that the most recent switch to this configuration took,
+        from stopping the camera to having restarted it (or None if it hasn't been started yet).
+    """
+
+    def __init__(self, camera_config, libcamera_config, lores_index, raw_index):
+        """Create a prepared configuration. Normally Picamera2.prepare_configuration does this."""
+        self.camera_config = camera_config
+        self.libcamera_config = libcamera_config
+        self.lores_index = lores_index
+        self.raw_index = raw_index
+        # The libcamera requests are made the first time the camera starts in this configuration.
+        self.requests = None
+        self.switch_count = 0
+        self.switch_latency = None
+
+    @property
+    def use_case(self):
+        return self.camera_config.get("use_case")
+
+    def __repr__(self):
+        main = self.camera_config["main"]
+        return f"<PreparedConfiguration {self.use_case!r} main={main['format']} {main['size']}>"
@@ -2,7 +2,12 @@ from __future__ import annotations
 
 import io
 import logging
+import os
+import struct
+import threading
 import time
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from typing import TYPE_CHECKING, Any, Dict, Optional, Union
@@ -19,6 +24,7 @@ import picamera2_contrib.formats as formats
 
 from .controls import Controls
 from .sensor_format import SensorFormat
+from .tiled_jpeg import encode_jpeg_tiled, encode_jpeg_yuv_planes_tiled
 from .utils import convert_from_libcamera_type
 
 if TYPE_CHECKING:
@@ -84,8 +90,87 @@ class MappedArray:
         return self.__array
 
 
+class LazyMetadata(Mapping):
+    """
+    A read-only view of a request's metadata that converts each value only when it is asked for.
+
+    CompletedRequest.metadata returns one of these. Values are converted from their libcamera types
+    the first time they are looked up and cached thereafter, and keys are found through a process-wide
+    table of control ids rather than by searching the whole list. Frequently read keys such as
+    SensorTimestamp, ExposureTime and FrameDuration therefore cost a single dictionary lookup, and the
+    other controls cost nothing at all unless they are read.
+    """
+
+    # Control names to libcamera control ids. These are the same for the lifetime of the process, so
+    # the table is filled in from the libcamera modules on demand, and from any metadata that gets listed.
+    _control_ids: Dict[str, Any] = {}
+
+    def __init__(self, control_list: Dict[Any, Any]) -> None:
+        self._control_list = control_list
+        self._cache: Dict[str, Any] = {}
+        self._names: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def _find_control_id(cls, name: str) -> Any:
+        control_id = cls._control_ids.get(name)
+        if control_id is None:
+            for module in (libcamera.controls, getattr(libcamera.controls, "rpi", None),
+                           getattr(libcamera.controls, "draft", None)):
+                control_id = getattr(module, name, None)
+                if control_id is not None and getattr(control_id, "name", None) == name:
+                    cls._control_ids[name] = control_id
+                    break
+            else:
+                control_id = None
+        return control_id
+
+    def _list_names(self) -> Dict[str, Any]:
+        if self._names is None:
+            self._names = {control_id.name: control_id for control_id in self._control_list}
+            LazyMetadata._control_ids.update(self._names)
+        return self._names
+
+    def __getitem__(self, name: str) -> Any:
+        try:
+            return self._cache[name]
+        except KeyError:
+            pass
+        control_id = self._find_control_id(name)
+        if control_id is None or control_id not in self._control_list:
+            # Not a control we know about, or not one that is in this request.
+            control_id = self._list_names().get(name)
+            if control_id is None:
+                raise KeyError(name)
+        value = convert_from_libcamera_type(self._control_list[control_id])
+        self._cache[name] = value
+        return value
+
+    def __contains__(self, name: object) -> bool:
+        if name in self._cache:
+            return True
+        control_id = self._find_control_id(name) if isinstance(name, str) else None
+        return (control_id is not None and control_id in self._control_list) or name in self._list_names()
+
+    def __iter__(self):
+        return iter(self._list_names())
+
+    def __len__(self) -> int:
+        return len(self._control_list)
+
+    def copy(self) -> Dict[str, Any]:
+        """Return an ordinary dictionary of all the (converted) metadata."""
+        return {name: self[name] for name in self._list_names()}
+
+    def __repr__(self) -> str:
+        return f"<LazyMetadata: {self.copy()}>"
+
+
 class CompletedRequest:
     FASTER_JPEG = True  # set to False to use the older JPEG encode method
+    # JPEGs of at least this many pixels are encoded in parallel bands, using TILED_JPEG_THREADS threads
+    # (or one per CPU if None). Set TILED_JPEG_MIN_PIXELS to None to always encode in a single thread.
+    TILED_JPEG_MIN_PIXELS: Optional[int] = 12000000
+    TILED_JPEG_THREADS: Optional[int] = None
 
     def __init__(self, request: Any, picam2: "Picamera2") -> None:
         self.request = request
@@ -96,6 +181,7 @@ class CompletedRequest:
         self.configure_count: int = picam2.configure_count
         self.config = self.picam2.camera_config.copy()
         self.stream_map = self.picam2.stream_map.copy()
+        self._metadata: Optional[LazyMetadata] = None
         with self.lock:
             self.syncs = [picam2.allocator.sync(self.picam2.allocator, buffer, False)
                           for buffer in self.request.buffers.values()]
@@ -158,30 +244,60 @@ class CompletedRequest:
         with _MappedBuffer(self, name, write=False) as b:
             return np.array(b, dtype=np.uint8)
 
+    @property
+    def metadata(self) -> LazyMetadata:
+        """A read-only mapping of this request's metadata, which converts values only as they are read."""
+        if self._metadata is None:
+            assert self.request is not None
+            self._metadata = LazyMetadata(self.request.metadata)
+        return self._metadata
+
     def get_metadata(self) -> Dict[str, Any]:
         """Fetch the metadata corresponding to this completed request."""
-        metadata = {}
-        assert self.request is not None
-        for k, v in self.request.metadata.items():
-            metadata[k.name] = convert_from_libcamera_type(v)
-        return metadata
-
-    def make_array(self, name: str) -> np.ndarray:
-        """Make a 2d numpy array from the named stream's buffer."""
+        return self.metadata.copy()
+
+    def make_array(self, name: str, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Make a 2d numpy array from the named stream's buffer.
+
+        If out is given, the image is copied into it (it must have the right shape) rather than
+        into a newly allocated array, and out is returned.
+        """
         config = self.config.get(name, None)
         if config is None:
             raise RuntimeError(f'Stream {name!r} is not defined')
         elif config['format'] == 'MJPEG':
-            return np.array(Image.open(io.BytesIO(self.make_buffer(name))))
+            array = np.array(Image.open(io.BytesIO(self.make_buffer(name))))
+            if out is None:
+                return array
+            return self._copy_array(array, out)
 
         # We don't want to send out an exported handle to the camera buffer, so we're going to have
         # to do a copy. If the buffer is not contiguous, we can use the copy to make it so.
         with MappedArray(self, name) as m:
-            if m.array.data.c_contiguous:
+            if out is not None:
+                return self._copy_array(m.array, out)
+            elif m.array.data.c_contiguous:
                 return np.copy(m.array)
             else:
                 return np.ascontiguousarray(m.array)
 
+    @staticmethod
+    def _copy_array(array: np.ndarray, out: np.ndarray) -> np.ndarray:
+        if out.shape != array.shape or out.dtype != array.dtype:
+            raise RuntimeError(f"Output array {out.shape} {out.dtype} does not match image {array.shape} {array.dtype}")
+        np.copyto(out, array)
+        return out
+
+    def make_unpacked_array(self, name: str = "raw", out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Make a 2d uint16 array of the pixel values in the named raw stream, unpacking them as necessary."""
+        config = self.config.get(name, None)
+        if config is None:
+            raise RuntimeError(f'Stream {name!r} is not defined')
+        if not formats.is_raw(config['format']):
+            raise RuntimeError(f'Stream {name!r} is not a raw stream')
+        with _MappedBuffer(self, name, write=False) as b:
+            return self.picam2.helpers.unpack_raw(np.array(b, copy=False, dtype=np.uint8), config, out=out)
+
     def make_image(self, name: str, width: Optional[int] = None, height: Optional[int] = None) -> Image.Image:
         """Make a PIL image from the named stream's buffer."""
         config = self.config.get(name, None)
@@ -232,21 +348,31 @@ class CompletedRequest:
         if (config['format'] == 'YUV420' or (self.FASTER_JPEG and config['format'] != "MJPEG")) and \
            self.picam2.helpers._get_format_str(file_output, format) in ('jpg', 'jpeg'):
             quality = self.picam2.options.get("quality", 90)
+            width, height = config['size']
+            threads = self.TILED_JPEG_THREADS or os.cpu_count() or 1
+            tiled = self.TILED_JPEG_MIN_PIXELS is not None and width * height >= self.TILED_JPEG_MIN_PIXELS \
+                and threads > 1
             with MappedArray(self, name) as m:
                 format = self.config[name]["format"]
                 if format == 'YUV420':
-                    width, height = self.config[name]['size']
                     Y = m.array[:height, :width]
                     reshaped = m.array.reshape((m.array.shape[0] * 2, m.array.strides[0] // 2))
                     U = reshaped[2 * height: 2 * height + height // 2, :width // 2]
                     V = reshaped[2 * height + height // 2:, :width // 2]
-                    output_bytes = simplejpeg.encode_jpeg_yuv_planes(Y, U, V, quality)
+                    if tiled:
+                        output_bytes = encode_jpeg_yuv_planes_tiled(Y, U, V, quality, num_threads=threads)
+                    else:
+                        output_bytes = simplejpeg.encode_jpeg_yuv_planes(Y, U, V, quality)
                     Y = reshaped = U = V = None
                 else:
                     FORMAT_TABLE = {"XBGR8888": "RGBX", "XRGB8888": "BGRX", "BGR888": "RGB", "RGB888": "BGR"}
-                    output_bytes = simplejpeg.encode_jpeg(m.array, quality, FORMAT_TABLE[format], '420')
+                    if tiled:
+                        output_bytes = encode_jpeg_tiled(m.array, quality, FORMAT_TABLE[format], '420',
+                                                         num_threads=threads)
+                    else:
+                        output_bytes = simplejpeg.encode_jpeg(m.array, quality, FORMAT_TABLE[format], '420')
 
-            exif = self.picam2.helpers._prepare_exif(self.get_metadata(), exif_data)
+            exif = self.picam2.helpers._prepare_exif(self.metadata, exif_data)
 
             if isinstance(file_output, io.BytesIO):
                 f = file_output
@@ -264,7 +390,7 @@ class CompletedRequest:
                 if f is not file_output:
                     f.close()
         else:
-            return self.picam2.helpers.save(self.make_image(name), self.get_metadata(), file_output,
+            return self.picam2.helpers.save(self.make_image(name), self.metadata, file_output,
                                             format, exif_data)
 
     def save_dng(self, file_output: Any, name: str = "raw") -> None:
@@ -277,14 +403,162 @@ class CompletedRequest:
             return self.picam2.helpers.save_dng(buffer, self.get_metadata(), self.config[name], file_output)
 
 
+_decompress_pool = None
+_decompress_pool_lock = threading.Lock()
+_decompress_scratch = threading.local()
+
+
+def _get_decompress_pool() -> ThreadPoolExecutor:
+    global _decompress_pool
+    with _decompress_pool_lock:
+        if _decompress_pool is None:
+            _decompress_pool = ThreadPoolExecutor(os.cpu_count() or 1, thread_name_prefix="picamera2-decompress")
+        return _decompress_pool
+
+
+def _decompress_band(words: np.ndarray, pixels: np.ndarray) -> None:
+    # Decompress a band of PISP_COMP1 rows, given as int32 word pairs, into the matching (rows, pairs, 4, 2)
+    # uint16 view of the output. The arithmetic is exactly that of the original whole-frame version, but
+    # all the temporaries are scratch buffers belonging to this thread, allocated once and then reused.
+    shape = words.shape
+    scratch = getattr(_decompress_scratch, "buffers", None)
+    if scratch is None or scratch[0].shape[1:] != shape[1:] or scratch[0].shape[0] < shape[0]:
+        scratch = [np.empty(shape, dtype=np.int32) for _ in range(12)] + [np.empty(shape, dtype=bool)]
+        _decompress_scratch.buffers = scratch
+    qmode, lim, pix0, pix1, pix2, pix3, q0, q1, q2, q3, t, u, mask = (buffer[:shape[0]] for buffer in scratch)
+
+    np.bitwise_and(words, 3, out=qmode)
+    np.right_shift(words, 2, out=pix0)
+    pix0 &= 511
+    np.right_shift(words, 11, out=pix1)
+    pix1 &= 127
+    pix1 -= 64
+    np.right_shift(words, 18, out=pix2)
+    pix2 &= 127
+    np.right_shift(words, 25, out=pix3)
+    pix3 &= 127
+    np.copyto(q1, pix0)
+    np.add(pix1, 448, out=q2)
+    np.multiply(qmode, pix0, out=t)
+    np.less(t, 768, out=mask)
+    np.subtract(pix0, pix1, out=t)
+    np.maximum(pix0, t, where=mask, out=q1)
+    np.add(pix0, pix1, out=t)
+    np.maximum(pix0, t, where=mask, out=q2)
+    np.right_shift(1536, qmode, out=lim)
+    for q, pix, result in ((q1, pix2, q0), (q2, pix3, q3)):
+        np.subtract(q, 64, out=t)
+        np.maximum(t, 0, out=t)
+        np.minimum(lim, t, out=t)
+        np.add(t, pix, out=result)
+    for q, result in ((q0, pix0), (q1, pix1), (q2, pix2), (q3, pix3)):
+        np.multiply(q, 16, out=t)
+        np.subtract(q, 160, out=u)
+        u *= 32
+        np.maximum(t, u, out=t)
+        np.multiply(qmode, 64, out=u)
+        u *= q
+        np.maximum(t, u, out=result)
+
+    # Pixels in quantisation mode 3 are decoded differently.
+    np.equal(qmode, 3, out=mask)
+    np.right_shift(words, 2, out=t)
+    t &= 32767
+    np.right_shift(words, 17, out=u)
+    u &= 32767
+    for packed, pair in ((t, (pix0, pix1)), (u, (pix2, pix3))):
+        np.bitwise_and(packed, 15, out=q0)
+        np.right_shift(packed, 8, out=q1)
+        q1 //= 11
+        q1 *= 16
+        q0 += q1
+        np.right_shift(packed, 4, out=q1)
+        q1 %= 176
+        for q, pix in zip((q0, q1), pair):
+            np.subtract(q, 47, out=q2)
+            q2 *= 512
+            np.multiply(q, 256, out=q3)
+            np.maximum(q3, q2, out=pix, where=mask)
+
+    for i, pix in enumerate((pix0, pix1, pix2, pix3)):
+        pix += 2048
+        np.clip(pix, 0, 65535, out=pix)
+        pixels[:, :, i, :] = pix
+
+
+# Sizes in bytes of the TIFF field types, for finding where values live in an EXIF block.
+_EXIF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+
+
+def _exif_value_offsets(exif: bytes) -> Dict[tuple, int]:
+    # Return the offset of every value in a piexif.dump result, keyed by (ifd name, tag). piexif always
+    # writes big-endian TIFF data following a 6 byte "Exif" header, and we only need the 0th and Exif IFDs.
+    tiff = 6
+    offsets = {}
+    ifds = [("0th", struct.unpack_from(">L", exif, tiff + 4)[0])]
+    while ifds:
+        ifd, start = ifds.pop()
+        start += tiff
+        for i in range(struct.unpack_from(">H", exif, start)[0]):
+            entry = start + 2 + 12 * i
+            tag, value_type, count, value = struct.unpack_from(">HHLL", exif, entry)
+            if ifd == "0th" and tag == piexif.ImageIFD.ExifTag:
+                ifds.append(("Exif", value))
+            size = _EXIF_TYPE_SIZES.get(value_type, 1) * count
+            offsets[(ifd, tag)] = entry + 8 if size <= 4 else tiff + value
+    return offsets
+
+
+class _ExifTemplate:
+    """An EXIF block, already dumped by piexif, into which each frame's values are patched."""
+
+    DATETIME_PLACEHOLDER = "0000:00:00 00:00:00"
+
+    def __init__(self, camera_id: str, exif_data: Optional[Dict]):
+        zero_ifd = {piexif.ImageIFD.Make: "Raspberry Pi",
+                    piexif.ImageIFD.Model: camera_id,
+                    piexif.ImageIFD.Software: "Picamera2",
+                    piexif.ImageIFD.DateTime: self.DATETIME_PLACEHOLDER}
+        exif_ifd = {piexif.ExifIFD.DateTimeOriginal: self.DATETIME_PLACEHOLDER,
+                    piexif.ExifIFD.ExposureTime: (0, 1000000),
+                    piexif.ExifIFD.ISOSpeedRatings: 0}
+        exif_dict = {"0th": zero_ifd, "Exif": exif_ifd} | (exif_data or {})
+        self.exif = piexif.dump(exif_dict)
+        # User exif_data replaces whole IFDs, so only patch the fields of ours that survived.
+        offsets = _exif_value_offsets(self.exif)
+        self.datetime_offsets = []
+        self.exposure_offset = self.iso_offset = None
+        if exif_dict["0th"] is zero_ifd:
+            self.datetime_offsets.append(offsets[("0th", piexif.ImageIFD.DateTime)])
+        if exif_dict["Exif"] is exif_ifd:
+            self.datetime_offsets.append(offsets[("Exif", piexif.ExifIFD.DateTimeOriginal)])
+            self.exposure_offset = offsets[("Exif", piexif.ExifIFD.ExposureTime)]
+            self.iso_offset = offsets[("Exif", piexif.ExifIFD.ISOSpeedRatings)]
+
+    def fill(self, datetime_now: str, exposure_time: int, iso: int) -> bytes:
+        """Return a copy of the EXIF block with this frame's values patched in."""
+        exif = bytearray(self.exif)
+        encoded = datetime_now.encode("latin1")
+        for offset in self.datetime_offsets:
+            exif[offset:offset + len(encoded)] = encoded
+        if self.exposure_offset is not None:
+            struct.pack_into(">LL", exif, self.exposure_offset, exposure_time, 1000000)
+            struct.pack_into(">H", exif, self.iso_offset, iso)
+        return bytes(exif)
+
+
 class Helpers:
     """This class implements functionality required by the CompletedRequest methods.
 
     In such a way that it can be usefully accessed even without a CompletedRequest object.
     """
 
+    # The most EXIF templates (one per distinct exif_data) that we keep.
+    MAX_EXIF_TEMPLATES = 8
+
     def __init__(self, picam2: "Picamera2"):
         self.picam2 = picam2
+        self._exif_templates: Dict[tuple, _ExifTemplate] = {}
 
     def _make_array_shared(self, buffer: np.ndarray, config: Dict[str, Any]) -> np.ndarray:
         """Makes a 2d numpy array from the named stream's buffer without copying memory.
@@ -379,19 +653,17 @@ class Helpers:
     def _prepare_exif(self, metadata, exif_data):
         exif = b''
         if "AnalogueGain" in metadata and "DigitalGain" in metadata:
+            # The EXIF block is only ever dumped once for each camera and exif_data, after which just
+            # the date, exposure time and ISO are written into a copy of it.
+            key = (self.picam2.camera.id, repr(exif_data) if exif_data else None)
+            template = self._exif_templates.get(key)
+            if template is None:
+                if len(self._exif_templates) >= self.MAX_EXIF_TEMPLATES:
+                    self._exif_templates.clear()
+                template = self._exif_templates[key] = _ExifTemplate(self.picam2.camera.id, exif_data)
             datetime_now = datetime.now().strftime("%Y:%m:%d %H:%M:%S")
-            zero_ifd = {piexif.ImageIFD.Make: "Raspberry Pi",
-                        piexif.ImageIFD.Model: self.picam2.camera.id,
-                        piexif.ImageIFD.Software: "Picamera2",
-                        piexif.ImageIFD.DateTime: datetime_now}
             total_gain = metadata["AnalogueGain"] * metadata["DigitalGain"]
-            exif_ifd = {piexif.ExifIFD.DateTimeOriginal: datetime_now,
-                        piexif.ExifIFD.ExposureTime: (metadata["ExposureTime"], 1000000),
-                        piexif.ExifIFD.ISOSpeedRatings: int(total_gain * 100)}
-            exif_dict = {"0th": zero_ifd, "Exif": exif_ifd}
-            # merge user provided exif data, overwriting the defaults
-            exif_dict = exif_dict | (exif_data or {})
-            exif = piexif.dump(exif_dict)
+            exif = template.fill(datetime_now, metadata["ExposureTime"], int(total_gain * 100))
         return exif
 
     def _get_format_str(self, file_output, format):
@@ -466,39 +738,119 @@ class Helpers:
         _log.info(f"Saved {self} to file {file_output}.")
         _log.info(f"Time taken for encode: {(end_time-start_time)*1000} ms.")
 
-    def decompress(self, array: np.ndarray):
-        """Decompress an image buffer that has been compressed with a PiSP compression format."""
-        # These are the standard configurations used in the drivers.
-        offset = 2048
+    # The number of image rows that each worker decompresses at a time.
+    DECOMPRESS_BAND_ROWS = 32
+
+    def decompress(self, array: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Decompress an image buffer that has been compressed with a PiSP compression format.
+
+        The image is processed in bands of DECOMPRESS_BAND_ROWS rows, spread across a pool of worker
+        threads, each of which reuses its own small scratch buffers. The result is returned as an
+        array of bytes (pairs of which form each little-endian 16-bit pixel), written into out if
+        that is given.
+        """
+        if array.shape[1] % 8:
+            raise RuntimeError("Compressed image rows must be a multiple of 8 bytes")
+        if out is None:
+            out = np.empty((array.shape[0], array.shape[1] * 2), dtype=np.uint8)
+        elif out.shape != (array.shape[0], array.shape[1] * 2) or out.dtype != np.uint8:
+            raise RuntimeError("Output array for decompression has the wrong shape or type")
 
         words = array.view(np.int32)  # Assume all Pis are little-endian. Note signed arithmetic is used!
         words = words.reshape((words.shape[0], words.shape[1] // 2, 2))  # pairs of words by component
-        qmode = words & 3
-        pix0 = (words >> 2) & 511
-        pix1 = ((words >> 11) & 127) - 64
-        pix2 = (words >> 18) & 127
-        pix3 = (words >> 25) & 127
-        q1 = np.copy(pix0)
-        q2 = pix1 + 448
-        np.maximum(pix0, pix0 - pix1, where=(qmode * pix0 < 768), out=q1)
-        np.maximum(pix0, pix0 + pix1, where=(qmode * pix0 < 768), out=q2)
-        q0 = np.minimum(1536 >> qmode, np.maximum(0, q1 - 64)) + pix2
-        q3 = np.minimum(1536 >> qmode, np.maximum(0, q2 - 64)) + pix3
-        np.maximum(np.maximum(16 * q0, 32 * (q0 - 160)), 64 * qmode * q0, out=pix0)
-        np.maximum(np.maximum(16 * q1, 32 * (q1 - 160)), 64 * qmode * q1, out=pix1)
-        np.maximum(np.maximum(16 * q2, 32 * (q2 - 160)), 64 * qmode * q2, out=pix2)
-        np.maximum(np.maximum(16 * q3, 32 * (q3 - 160)), 64 * qmode * q3, out=pix3)
-        q2 = (words >> 2) & 32767
-        q3 = (words >> 17) & 32767
-        q0 = (q2 & 15) + 16 * ((q2 >> 8) // 11)
-        q1 = (q2 >> 4) % 176
-        q2 = (q3 & 15) + 16 * ((q3 >> 8) // 11)
-        q3 = (q3 >> 4) % 176
-        np.maximum(256 * q0, 512 * (q0 - 47), out=pix0, where=(qmode == 3))
-        np.maximum(256 * q1, 512 * (q1 - 47), out=pix1, where=(qmode == 3))
-        np.maximum(256 * q2, 512 * (q2 - 47), out=pix2, where=(qmode == 3))
-        np.maximum(256 * q3, 512 * (q3 - 47), out=pix3, where=(qmode == 3))
-        res = np.stack((pix0, pix1, pix2, pix3), axis=2).reshape(array.shape)
-
-        res = np.clip(res + offset, 0, 65535).astype(np.uint16)
-        return res.view(np.uint8)
+        pixels = out.view(np.uint16).reshape((words.shape[0], words.shape[1], 4, 2))
+        rows = self.DECOMPRESS_BAND_ROWS
+        bands = [(words[r:r + rows], pixels[r:r + rows]) for r in range(0, words.shape[0], rows)]
+        if len(bands) == 1:
+            _decompress_band(*bands[0])
+        else:
+            # NumPy releases the GIL for the arithmetic, so the bands really do run in parallel.
+            list(_get_decompress_pool().map(lambda band: _decompress_band(*band), bands))
+        return out
+
+    def unpack_raw(self, array: np.ndarray, config: Dict[str, Any], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Unpack a raw image into a 2d uint16 array of pixel values at the sensor's own bit depth.
+
+        The array can be the raw stream's buffer, or the (height, stride) array that make_array
+        returns for raw streams. CSI2P packed 10 and 12-bit formats are unpacked using whole-image
+        shifts and masks, with out (or the returned array) as the only full size buffer. The result
+        is written into out if that is given.
+        """
+        w, h = config["size"]
+        stride = config["stride"]
+        fmt = SensorFormat(config["format"])
+        if out is None:
+            out = np.empty((h, w), dtype=np.uint16)
+        elif out.shape != (h, w) or out.dtype != np.uint16:
+            raise RuntimeError(f"Output array for raw unpacking must be uint16 with shape {(h, w)}")
+        array = np.asarray(array).reshape(-1)[:h * stride].reshape(h, stride)
+
+        if fmt.packing == "CSI2P":
+            if fmt.bit_depth == 10:
+                samples, bytes_per_group = 4, 5
+            elif fmt.bit_depth == 12:
+                samples, bytes_per_group = 2, 3
+            else:
+                raise RuntimeError(f"Cannot unpack raw format {fmt}")
+            groups = -(-w // samples)
+            packed = array[:, :groups * bytes_per_group].reshape(h, groups, bytes_per_group)
+            # Rows whose width isn't a whole number of groups need a wider array to unpack into.
+            whole_groups = w == groups * samples
+            pixels = out if whole_groups else np.empty((h, groups * samples), dtype=np.uint16)
+            pixels = pixels.reshape(h, groups, samples)
+            # Each pixel's most significant 8 bits have their own byte, and the final byte of each group
+            # holds the remaining bits of all of them.
+            np.left_shift(packed[:, :, :samples], fmt.bit_depth - 8, out=pixels, dtype=np.uint16)
+            low_bits = np.empty((h, groups), dtype=np.uint8)
+            mask = (1 << (fmt.bit_depth - 8)) - 1
+            for i in range(samples):
+                np.right_shift(packed[:, :, samples], i * (fmt.bit_depth - 8), out=low_bits)
+                low_bits &= mask
+                pixels[:, :, i] |= low_bits
+            if not whole_groups:
+                np.copyto(out, pixels.reshape(h, -1)[:, :w])
+        elif fmt.packing == "PISP_COMP1":
+            np.copyto(out, self.decompress(array).view(np.uint16)[:, :w])
+        elif fmt.packing is not None:
+            raise RuntimeError(f"Cannot unpack raw format {fmt}")
+        elif fmt.bit_depth == 8:
+            np.copyto(out, array[:, :w])
+        else:
+            np.copyto(out, array.view(np.uint16)[:, :w])
+        return out
+
+    def debayer_binned(self, raw: np.ndarray, sensor_format: Union[str, SensorFormat],
+                       out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Make a half resolution RGB image from an unpacked raw image by binning each 2x2 Bayer cell.
+
+        raw is the uint16 array that unpack_raw returns, and sensor_format is the raw stream's format,
+        from which the Bayer order and bit depth are taken. Each output pixel takes the red and blue
+        values of its cell and the average of the two greens, in that (R, G, B) order. The values keep
+        the sensor's bit depth if out is uint16 (the default), or are scaled to 8 bits if out is uint8.
+        """
+        fmt = SensorFormat(sensor_format) if isinstance(sensor_format, str) else sensor_format
+        if fmt.mono:
+            raise RuntimeError("Cannot debayer a monochrome raw image")
+        h, w = raw.shape[0] // 2, raw.shape[1] // 2
+        if out is None:
+            out = np.empty((h, w, 3), dtype=np.uint16)
+        elif out.shape != (h, w, 3) or out.dtype not in (np.uint8, np.uint16):
+            raise RuntimeError(f"Output array for debayering must be uint8 or uint16 with shape {(h, w, 3)}")
+        shift = fmt.bit_depth - 8 if out.dtype == np.uint8 else 0
+
+        cells = raw[:2 * h, :2 * w].reshape(h, 2, w, 2)
+        channels = {}
+        for position, colour in enumerate(fmt.bayer_order):
+            channels.setdefault(colour, []).append(cells[:, position // 2, :, position % 2])
+        for index, colour in ((0, "R"), (2, "B")):
+            np.right_shift(channels[colour][0], shift, out=out[:, :, index], casting="unsafe")
+        green0, green1 = channels["G"]
+        if fmt.bit_depth < 16:
+            green = np.add(green0, green1, dtype=np.uint16)
+        else:
+            # 16-bit samples could overflow, so halve them first.
+            green = np.right_shift(green0, 1)
+            green += green1 >> 1
+            shift -= 1
+        np.right_shift(green, shift + 1, out=out[:, :, 1], casting="unsafe")
+        return out
@@ -0,0 +1,229 @@
+"""Encode and write captured images on background threads"""
+
+import collections
+import io
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from logging import getLogger
+from pathlib import Path
+
+import picamera2_contrib.formats as formats
+
+from .subscription import BackpressurePolicy
+
+_log = getLogger(__name__)
+
+# Stream formats that Helpers can turn into an image from a copy of the buffer.
+_COPYABLE_FORMATS = formats.RGB_FORMATS - {"RGB161616", "BGR161616"}
+
+
+class _SaveJob:
+    def __init__(self, request, file_output, name, format, exif_data, nbytes):
+        self.request = request
+        self.file_output = file_output
+        self.name = name
+        self.format = format
+        self.exif_data = exif_data
+        self.nbytes = nbytes
+        self.buffer = None
+        self.helpers = None
+        self.config = None
+        self.metadata = None
+        self.future = None
+
+
+class SavePipeline:
+    """
+    Saves images to files on a pool of background threads, returning a Future for each one.
+
+    Images can be queued from a CompletedRequest with submit, or captured with Picamera2.capture_file
+    and its relatives when a SavePipeline has been assigned to Picamera2.save_pipeline, in which case
+    these return a Future rather than waiting. Each Future's result is the metadata of the saved frame.
+
+    A camera buffer is kept only as long as it must be. When a worker is free, the worker encodes
+    straight from the camera buffer, releasing the request before it writes the file. Otherwise the
+    image is copied out of the camera buffer (for raw and RGB streams) and the request is released
+    immediately, so that queued images never starve the camera of buffers. The copy argument to submit
+    can force either behaviour.
+
+    The total size of the images waiting or being saved is bounded by max_bytes. What happens when
+    another image would exceed this (because storage is slower than capture) is given by the policy:
+
+    BackpressurePolicy.BLOCK - wait, for up to block_timeout seconds (or forever if None), for room.
+        Images that still don't fit are dropped. This is the default, waiting up to 0.1s.
+    BackpressurePolicy.DROP_NEWEST - drop the new image.
+    BackpressurePolicy.DROP_OLDEST - drop the oldest images that have not started saving yet.
+
+    Note that capture_file submits from the camera thread, so while it blocks no other frames are
+    delivered. This is why block_timeout is short by default, and setting it to None risks stalling the
+    camera for as long as storage does. Use one of the drop policies where the preview must keep running.
+
+    The Future for a dropped image is cancelled. The counters saved, dropped and failed record what
+    has happened to the images submitted.
+
+    Parameters:
+    num_threads - the number of worker threads.
+    max_bytes - the greatest total size of the images that may be queued or saving at once.
+    policy - the BackpressurePolicy to apply when max_bytes would be exceeded.
+    block_timeout - the longest time in seconds to wait for room with the BLOCK policy.
+    """
+
+    def __init__(self, num_threads=2, max_bytes=256 * 1024 * 1024, policy=BackpressurePolicy.BLOCK,
+                 block_timeout=0.1):
+        """Create a save pipeline."""
+        if num_threads < 1:
+            raise RuntimeError("num_threads must be at least 1")
+        if not isinstance(policy, BackpressurePolicy):
+            raise RuntimeError("policy must be a BackpressurePolicy")
+        self.num_threads = num_threads
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._pool = ThreadPoolExecutor(num_threads, thread_name_prefix="picamera2-save")
+        self._cond = threading.Condition()
+        self._jobs = collections.deque()
+        self._bytes = 0
+        self._running = 0
+        self.saved = 0
+        self.dropped = 0
+        self.failed = 0
+
+    @property
+    def pending_bytes(self):
+        """The total size of the images queued or being saved."""
+        return self._bytes
+
+    @property
+    def pending(self):
+        """The number of images queued or being saved."""
+        return len(self._jobs)
+
+    def _make_room(self, nbytes):
+        # Called with the condition held. Returns whether there is now room for nbytes more.
+        if self._bytes + nbytes <= self.max_bytes or not self._jobs:
+            return True
+        if self.policy == BackpressurePolicy.DROP_OLDEST:
+            for job in list(self._jobs):
+                if self._bytes + nbytes <= self.max_bytes:
+                    break
+                # Only jobs that haven't started can be cancelled, and their done callbacks tidy up.
+                if job.future.cancel():
+                    self.dropped += 1
+            return self._bytes + nbytes <= self.max_bytes
+        elif self.policy == BackpressurePolicy.BLOCK:
+            return self._cond.wait_for(lambda: self._bytes + nbytes <= self.max_bytes or not self._jobs,
+                                       self.block_timeout)
+        return False
+
+    def submit(self, request, file_output, name="main", format=None, exif_data=None, copy=None):
+        """Queue an image from the named stream of a CompletedRequest to be saved, returning a Future.
+
+        Raw streams are saved as DNG files, and others according to format or the file name. The
+        request is acquired or copied as necessary, so the caller may release it as soon as this returns.
+
+        copy - True to copy the image out of the camera buffer now, False to encode directly from the
+            camera buffer, or None (the default) to encode directly only if a worker is free.
+        """
+        config = request.config.get(name)
+        if config is None:
+            raise RuntimeError(f'Stream {name!r} is not defined')
+        if not (name == "raw" and formats.is_raw(config["format"])):
+            # Work out the format now, as the encoding is done in memory, where PIL needs its own name.
+            format = request.picam2.helpers._get_format_str(str(file_output) if isinstance(file_output, Path)
+                                                            else file_output, format)
+            if format == "jpg":
+                format = "jpeg"
+        nbytes = config["framesize"]
+        future = Future()
+        with self._cond:
+            if not self._make_room(nbytes):
+                self.dropped += 1
+                future.cancel()
+                return future
+            copyable = name == "raw" or config["format"] in _COPYABLE_FORMATS
+            if copy is None:
+                copy = copyable and self._running + len(self._jobs) >= self.num_threads
+            elif copy and not copyable:
+                raise RuntimeError(f"Cannot save a copy of a {config['format']} image")
+            job = _SaveJob(request, file_output, name, format, exif_data, nbytes)
+            if copy:
+                job.buffer = request.make_buffer(name)
+                job.helpers = request.picam2.helpers
+                job.config = config
+                job.metadata = request.get_metadata()
+                job.request = None
+            else:
+                request.acquire()
+            job.future = future
+            self._jobs.append(job)
+            self._bytes += nbytes
+        future.add_done_callback(lambda _: self._finished(job))
+        self._pool.submit(self._run, job)
+        return future
+
+    def _finished(self, job):
+        with self._cond:
+            self._jobs.remove(job)
+            self._bytes -= job.nbytes
+            self._cond.notify_all()
+        if job.request is not None:
+            job.request.release()
+            job.request = None
+
+    def _run(self, job):
+        if not job.future.set_running_or_notify_cancel():
+            return
+        with self._cond:
+            self._running += 1
+        try:
+            result = self._save(job)
+        except Exception as e:
+            _log.exception("Failed to save image", exc_info=e)
+            self.failed += 1
+            job.future.set_exception(e)
+        else:
+            self.saved += 1
+            job.future.set_result(result)
+        finally:
+            with self._cond:
+                self._running -= 1
+
+    def _save(self, job):
+        output = io.BytesIO()
+        is_raw = job.name == "raw"
+        if job.request is not None:
+            request = job.request
+            if is_raw and formats.is_raw(request.config["raw"]["format"]):
+                request.save_dng(output)
+            else:
+                request.save(job.name, output, format=job.format, exif_data=job.exif_data)
+            metadata = request.get_metadata()
+            # The camera buffer isn't needed to write the file, so give it back now.
+            with self._cond:
+                job.request = None
+            request.release()
+        else:
+            helpers = job.helpers
+            if is_raw:
+                helpers.save_dng(job.buffer, job.metadata, job.config, output)
+            else:
+                image = helpers.make_image(job.buffer, job.config)
+                helpers.save(image, job.metadata, output, job.format, job.exif_data)
+            metadata = job.metadata
+            job.buffer = None
+
+        if isinstance(job.file_output, (str, Path)):
+            with open(job.file_output, "wb") as f:
+                f.write(output.getbuffer())
+        else:
+            job.file_output.write(output.getbuffer())
+        return metadata
+
+    def stats(self):
+        """Return a dictionary of this pipeline's counters."""
+        return {"saved": self.saved, "dropped": self.dropped, "failed": self.failed,
+                "pending": self.pending, "pending_bytes": self.pending_bytes}
+
+    def shutdown(self, wait=True):
+        """Stop accepting images and, if wait is set, finish saving those already queued."""
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,152 @@
+"""Independent consumers of the stream of completed requests"""
+
+import collections
+import threading
+from enum import Enum
+
+
+class BackpressurePolicy(Enum):
+    """Enum describing what a Subscription does when its queue is full and another frame arrives.
+
+    DROP_OLDEST - the oldest queued request is released and the new one is queued instead.
+    DROP_NEWEST - the new request is not queued.
+    BLOCK - the camera event loop waits (up to the subscription's block_timeout) for the
+        consumer to make room, after which the new request is dropped. Use with care, because
+        while it waits, no other consumer, job or encoder receives any frames either.
+    """
+
+    DROP_OLDEST = 0
+    DROP_NEWEST = 1
+    BLOCK = 2
+
+
+class Subscription:
+    """
+    A subscription to the completed requests coming out of the camera.
+
+    Subscriptions are normally created by Picamera2.subscribe. Every subscription has its own
+    bounded queue of requests, so that each consumer gets its own cursor into the stream of
+    frames, and what happens when a consumer falls behind is decided by its own policy. In this
+    way a slow consumer can't starve the others, nor can it hold on to more camera buffers than
+    its queue length allows.
+
+    Each request in a subscription's queue holds a reference of its own, so requests returned
+    by get must be released by the consumer when it has finished with them (iterating over
+    the subscription does this automatically). For example, in a consumer thread:
+
+    subscription = picam2.subscribe(max_queue=2, policy=BackpressurePolicy.DROP_OLDEST)
+    for request in subscription:
+        array = request.make_array("main")
+
+    The following counters are available:
+    lag - the number of requests currently queued but not yet taken by the consumer.
+    max_lag - the largest value that lag has reached.
+    received - the number of requests the camera offered to this subscription.
+    delivered - the number of requests taken by the consumer.
+    dropped - the number of requests discarded because the queue was full.
+    """
+
+    def __init__(self, max_queue=1, policy=BackpressurePolicy.DROP_OLDEST, block_timeout=0.1):
+        """Create a subscription.
+
+        :param max_queue: Maximum number of requests that may be queued, defaults to 1
+        :type max_queue: int, optional
+        :param policy: What to do when the queue is full, defaults to BackpressurePolicy.DROP_OLDEST
+        :type policy: BackpressurePolicy, optional
+        :param block_timeout: Longest time (in seconds) to wait for room in the queue with the BLOCK
+            policy, defaults to 0.1
+        :type block_timeout: float, optional
+        :raises RuntimeError: Invalid parameters
+        """
+        if not isinstance(max_queue, int) or max_queue < 1:
+            raise RuntimeError("max_queue must be a positive integer")
+        if not isinstance(policy, BackpressurePolicy):
+            raise RuntimeError("policy must be a BackpressurePolicy")
+        self.max_queue = max_queue
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.max_lag = 0
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    @property
+    def lag(self):
+        """The number of requests queued but not yet taken by the consumer."""
+        return len(self._queue)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def _deliver(self, request):
+        # Called from the camera event loop with each new request.
+        with self._cond:
+            if self._closed:
+                return
+            self.received += 1
+            if len(self._queue) >= self.max_queue:
+                if self.policy == BackpressurePolicy.DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                elif self.policy == BackpressurePolicy.BLOCK:
+                    if not self._cond.wait_for(lambda: len(self._queue) < self.max_queue or self._closed,
+                                               self.block_timeout) or self._closed:
+                        self.dropped += 1
+                        return
+                else:
+                    self._queue.popleft().release()
+                    self.dropped += 1
+            request.acquire()
+            self._queue.append(request)
+            self.max_lag = max(self.max_lag, len(self._queue))
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        """Return the next queued request, waiting up to timeout seconds for one to arrive.
+
+        The caller must release the request when finished with it. None is returned if the wait
+        times out, or if the subscription is closed.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._queue or self._closed, timeout)
+            if not self._queue:
+                return None
+            request = self._queue.popleft()
+            self.delivered += 1
+            # Wake the camera event loop if it's waiting for room in the queue.
+            self._cond.notify_all()
+            return request
+
+    def __iter__(self):
+        """Iterate over the requests until the subscription is closed, releasing each one in turn."""
+        while True:
+            request = self.get()
+            if request is None:
+                return
+            try:
+                yield request
+            finally:
+                request.release()
+
+    def flush(self):
+        """Release any requests that are still queued."""
+        with self._cond:
+            while self._queue:
+                self._queue.popleft().release()
+            self._cond.notify_all()
+
+    def close(self):
+        """Stop receiving requests, releasing any that were queued and waking up the consumer."""
+        with self._cond:
+            self._closed = True
+        self.flush()
+
+    def stats(self):
+        """Return a dictionary of this subscription's counters."""
+        with self._cond:
+            return {"lag": len(self._queue), "max_lag": self.max_lag, "received": self.received,
+                    "delivered": self.delivered, "dropped": self.dropped}
@@ -0,0 +1,114 @@
+"""Encode large JPEGs in parallel bands, joined into one baseline JPEG with restart markers"""
+
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import simplejpeg
+
+# The height in pixels of a row of MCUs (minimum coded units) for each colour subsampling.
+_MCU_HEIGHT = {'444': 8, '422': 8, '411': 8, 'Gray': 8, '420': 16, '440': 16}
+# The width in pixels of an MCU for each colour subsampling.
+_MCU_WIDTH = {'444': 8, '440': 8, 'Gray': 8, '422': 16, '420': 16, '411': 32}
+# The restart interval is a 16-bit count of MCUs.
+_MAX_RESTART_INTERVAL = 65535
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(num_threads):
+    with _pools_lock:
+        pool = _pools.get(num_threads)
+        if pool is None:
+            pool = _pools[num_threads] = ThreadPoolExecutor(num_threads, thread_name_prefix="picamera2-jpeg")
+        return pool
+
+
+def _split_jpeg(jpeg):
+    # Return the header of a baseline JPEG up to the start of its SOS segment, the SOS segment itself,
+    # the offset of the SOF0 segment within the header, and the entropy coded data (without the EOI).
+    pos = 2
+    sof = None
+    while True:
+        if jpeg[pos] != 0xFF:
+            raise RuntimeError("Malformed JPEG segment")
+        marker = jpeg[pos + 1]
+        length = int.from_bytes(jpeg[pos + 2:pos + 4], 'big')
+        if marker == 0xC0:
+            sof = pos
+        elif marker == 0xDA:
+            if sof is None:
+                raise RuntimeError("JPEG is not baseline")
+            end = pos + 2 + length
+            return jpeg[:pos], jpeg[pos:end], sof, jpeg[end:-2]
+        pos += 2 + length
+
+
+def _bands(height, width, subsampling, num_threads):
+    # Divide the image into whole rows of MCUs, at least one band per thread, and with no band more
+    # MCUs than a restart interval can count. Only the last band can be a different height.
+    mcu_height = _MCU_HEIGHT[subsampling]
+    mcu_rows = math.ceil(height / mcu_height)
+    mcus_per_row = math.ceil(width / _MCU_WIDTH[subsampling])
+    max_rows = max(1, _MAX_RESTART_INTERVAL // mcus_per_row)
+    rows_per_band = min(max_rows, math.ceil(mcu_rows / num_threads))
+    band_height = rows_per_band * mcu_height
+    return [(top, min(top + band_height, height)) for top in range(0, height, band_height)], \
+        rows_per_band * mcus_per_row
+
+
+def _join(jpegs, height, restart_interval):
+    # Stitch the bands together under the first band's headers, with the full image height and a DRI
+    # segment, putting a restart marker between the entropy coded data of each band. A restart resets the
+    # DC predictions, just as at the start of each band, so the data needs no other change.
+    header, sos, sof, data = _split_jpeg(jpegs[0])
+    pieces = [header[:sof + 5], height.to_bytes(2, 'big'), header[sof + 7:],
+              b'\xff\xdd\x00\x04', restart_interval.to_bytes(2, 'big'), sos, data]
+    for i, jpeg in enumerate(jpegs[1:]):
+        band_header, band_sos, band_sof, band_data = _split_jpeg(jpeg)
+        if band_header[:band_sof + 5] != header[:sof + 5] or band_header[band_sof + 7:] != header[sof + 7:] \
+           or band_sos != sos:
+            raise RuntimeError("JPEG bands were encoded differently")
+        pieces += [bytes((0xFF, 0xD0 + i % 8)), band_data]
+    pieces.append(b'\xff\xd9')
+    return b''.join(pieces)
+
+
+def encode_jpeg_tiled(image, quality=85, colorspace='RGB', colorsubsampling='420', num_threads=None):
+    """Encode an image array into a JPEG using several threads.
+
+    The image is cut into horizontal bands of whole MCU rows, which are encoded in parallel with
+    simplejpeg (which releases the GIL), and then joined into a single baseline JPEG with restart
+    markers between the bands. The image data is exactly what simplejpeg.encode_jpeg would produce,
+    except for the restart markers, so the result decodes to the same image. The parameters are those
+    of simplejpeg.encode_jpeg, with num_threads defaulting to the number of CPUs.
+    """
+    num_threads = num_threads or os.cpu_count() or 1
+    height, width = image.shape[:2]
+    bands, restart_interval = _bands(height, width, colorsubsampling, num_threads)
+    if len(bands) == 1:
+        return simplejpeg.encode_jpeg(image, quality=quality, colorspace=colorspace,
+                                      colorsubsampling=colorsubsampling)
+    pool = _get_pool(num_threads)
+    futures = [pool.submit(simplejpeg.encode_jpeg, image[top:bottom], quality=quality, colorspace=colorspace,
+                           colorsubsampling=colorsubsampling) for top, bottom in bands]
+    return _join([future.result() for future in futures], height, restart_interval)
+
+
+def encode_jpeg_yuv_planes_tiled(Y, U, V, quality=85, num_threads=None):
+    """Encode Y, U and V planes (with 4:2:0 chroma) into a JPEG using several threads.
+
+    This works just like encode_jpeg_tiled, but takes the planes that simplejpeg.encode_jpeg_yuv_planes
+    accepts.
+    """
+    num_threads = num_threads or os.cpu_count() or 1
+    height, width = Y.shape
+    bands, restart_interval = _bands(height, width, '420', num_threads)
+    if len(bands) == 1:
+        return simplejpeg.encode_jpeg_yuv_planes(Y, U, V, quality)
+    pool = _get_pool(num_threads)
+    futures = [pool.submit(simplejpeg.encode_jpeg_yuv_planes, Y[top:bottom], U[top // 2:(bottom + 1) // 2],
+                           V[top // 2:(bottom + 1) // 2], quality) for top, bottom in bands]
+    return _join([future.result() for future in futures], height, restart_interval)
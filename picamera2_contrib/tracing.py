@@ -0,0 +1,141 @@
+"""Per-frame latency tracing through the camera, encoder and output pipeline"""
+
+import collections
+import json
+import threading
+import time
+
+import numpy as np
+
+
+class FrameTracer:
+    """
+    Records when each frame passes various points in the pipeline, relative to its SensorTimestamp.
+
+    Tracing is enabled by assigning a FrameTracer to Picamera2.tracer, and when that is None (the
+    default) each stamping point costs no more than a test against None. Frames are identified by
+    their SensorTimestamp in microseconds, which is also how encoders and outputs see them (after
+    subtracting the encoder's first timestamp). The stages that are stamped are:
+
+    completed - libcamera has completed the request (CameraManager.handle_request).
+    process - Picamera2.process_requests has picked up the request.
+    pre_callback, pre_callback_end - around the pre_callback.
+    post_callback, post_callback_end - around the post_callback.
+    encode - Encoder.encode has been given the frame.
+    encoded - the encoded frame has come out of the encoder (Encoder.outputframe).
+    output_end - every Output.outputframe has returned.
+
+    Where several encoders see the same frame, the first to reach a stage is the one recorded.
+
+    Parameters:
+    max_frames - the number of recent frames for which all the stamps are kept, for export as a trace.
+    window - the number of recent latencies kept for each stage, from which the rolling statistics and
+        histograms are calculated.
+    """
+
+    def __init__(self, max_frames=300, window=1000):
+        """Create a frame tracer."""
+        self.max_frames = max_frames
+        self.window = window
+        self._lock = threading.Lock()
+        self._frames = collections.OrderedDict()
+        self._latencies = {}
+
+    @staticmethod
+    def request_key(request):
+        """Return the key (SensorTimestamp in microseconds) identifying a CompletedRequest, or None."""
+        try:
+            # Rounded the same way as Encoder._timestamp, so that encoders and outputs can match it up.
+            return int(request.metadata["SensorTimestamp"] / 1000)
+        except (AttributeError, KeyError):
+            return None
+
+    def mark_request(self, request, stage):
+        """Stamp the current time against a CompletedRequest for the given stage."""
+        self.mark(self.request_key(request), stage)
+
+    def mark(self, key, stage, time_ns=None):
+        """Stamp the given time (now, by default) against the frame with this key for the given stage."""
+        if key is None:
+            return
+        if time_ns is None:
+            time_ns = time.monotonic_ns()
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is None:
+                frame = self._frames[key] = {}
+                if len(self._frames) > self.max_frames:
+                    self._frames.popitem(last=False)
+            if stage in frame:
+                return
+            frame[stage] = time_ns
+            latencies = self._latencies.get(stage)
+            if latencies is None:
+                latencies = self._latencies[stage] = collections.deque(maxlen=self.window)
+            latencies.append(time_ns - key * 1000)
+
+    def reset(self):
+        """Discard everything recorded so far."""
+        with self._lock:
+            self._frames.clear()
+            self._latencies = {}
+
+    @property
+    def stages(self):
+        """The stages for which latencies have been recorded, in pipeline order."""
+        with self._lock:
+            latencies = {stage: np.median(values) for stage, values in self._latencies.items()}
+        return sorted(latencies, key=latencies.get)
+
+    def latencies(self, stage):
+        """Return the stage's recent latencies as a numpy array, in ms since the SensorTimestamp."""
+        with self._lock:
+            values = list(self._latencies.get(stage, ()))
+        return np.array(values, dtype=np.float64) / 1e6
+
+    def histogram(self, stage, bins=20, range=None):
+        """Return the numpy counts and bin edges for the stage's recent latencies, in ms."""
+        return np.histogram(self.latencies(stage), bins=bins, range=range)
+
+    def stats(self):
+        """Return a dictionary of rolling latency statistics (in ms) for every stage."""
+        result = {}
+        for stage in self.stages:
+            values = self.latencies(stage)
+            if not len(values):
+                continue
+            p50, p90, p99 = np.percentile(values, (50, 90, 99))
+            result[stage] = {"count": len(values), "mean": float(values.mean()), "p50": float(p50),
+                             "p90": float(p90), "p99": float(p99), "max": float(values.max())}
+        return result
+
+    def frames(self):
+        """Return a dictionary of the recent frames, giving the time (in ns) at which each reached each stage."""
+        with self._lock:
+            return {key: dict(frame) for key, frame in self._frames.items()}
+
+    def chrome_trace(self, lanes=4):
+        """Return the recent frames as a Chrome trace (chrome://tracing or Perfetto) dictionary.
+
+        Each frame is drawn as consecutive spans from its SensorTimestamp through each stage. Frames
+        are spread across a number of lanes so that overlapping frames don't hide one another.
+        """
+        events = []
+        for index, (key, frame) in enumerate(self.frames().items()):
+            tid = index % lanes
+            previous_stage, previous_time = "sensor", key * 1000
+            for stage, time_ns in sorted(frame.items(), key=lambda item: item[1]):
+                events.append({"name": f"{previous_stage} -> {stage}", "cat": "frame", "ph": "X",
+                               "ts": previous_time / 1000, "dur": max(0, time_ns - previous_time) / 1000,
+                               "pid": 0, "tid": tid, "args": {"frame": key}})
+                previous_stage, previous_time = stage, time_ns
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, file_output, lanes=4):
+        """Write the recent frames to a file (name or file object) in Chrome trace JSON format."""
+        trace = self.chrome_trace(lanes=lanes)
+        if isinstance(file_output, str):
+            with open(file_output, "w") as f:
+                json.dump(trace, f)
+        else:
+            json.dump(trace, file_output)
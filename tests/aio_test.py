@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+
+import asyncio
+import time
+
+from picamera2_contrib import AsyncioPreview, Picamera2
+
+
+async def client(picam2, n):
+    for _ in range(n):
+        array = await picam2.aio.capture_array("main")
+        assert array.shape[:2] == (480, 640)
+    return n
+
+
+async def main():
+    picam2 = Picamera2()
+    config = picam2.create_preview_configuration({"size": (640, 480)})
+    picam2.aio.start(config)
+    assert isinstance(picam2._preview, AsyncioPreview)
+
+    # Many concurrent waiters, none of which needs a thread.
+    start = time.monotonic()
+    results = await asyncio.gather(*[client(picam2, 5) for _ in range(20)])
+    print("Captured", sum(results), "arrays in", round(time.monotonic() - start, 2), "seconds")
+
+    metadata = await picam2.aio.capture_metadata()
+    assert "SensorTimestamp" in metadata
+
+    timestamps = []
+    async for request in picam2.aio.requests("main"):
+        timestamps.append(request.get_metadata()["SensorTimestamp"])
+        if len(timestamps) == 10:
+            break
+    if any(t1 <= t0 for t0, t1 in zip(timestamps[:-1], timestamps[1:])):
+        print("Error: request timestamps not increasing")
+
+    # A cancelled capture must not leak its request.
+    task = asyncio.ensure_future(picam2.aio.capture_request())
+    await asyncio.sleep(0)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+    still = picam2.create_still_configuration()
+    array = await picam2.aio.switch_mode_and_capture_array(still, "main")
+    assert array.ndim == 3
+    await picam2.aio.capture_array("main")
+
+    await picam2.aio.close()
+
+
+asyncio.run(main())
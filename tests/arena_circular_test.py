@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+
+# Fill an ArenaCircularOutput from the H.264 encoder, then trigger it. The buffer must stay within its
+# byte budget, and the file must start with a keyframe (an SPS, as headers are repeated) and contain
+# the frames buffered before the trigger, followed by the ones after it.
+
+import io
+import time
+
+from picamera2_contrib import Picamera2
+from picamera2_contrib.encoders import H264Encoder
+from picamera2_contrib.outputs import ArenaCircularOutput
+
+picam2 = Picamera2()
+config = picam2.create_video_configuration({"size": (1280, 720)}, controls={"FrameRate": 30})
+picam2.configure(config)
+
+encoder = H264Encoder(5000000, repeat=True, iperiod=15)
+output = ArenaCircularOutput(buffer_bytes=2 * 1024 * 1024)
+picam2.start_recording(encoder, output)
+time.sleep(5)
+
+buffered = output.bytes_buffered
+print("buffered", output.frames_buffered, "frames,", buffered, "bytes, evicted", output.frames_evicted)
+if buffered > output.buffer_bytes:
+    print("Error: buffer exceeded its byte budget")
+if not output.frames_evicted:
+    print("Error: no frames were evicted")
+
+file = io.BytesIO()
+pts = io.StringIO()
+output.fileoutput = file
+output.ptsoutput = pts
+output.start()
+time.sleep(2)
+output.stop()
+picam2.stop_recording()
+
+data = file.getvalue()
+print("wrote", len(data), "bytes,", pts.getvalue().count("\n"), "timestamps")
+if not data.startswith(b"\x00\x00\x00\x01") or data[4] & 0x1f != 7:
+    print("Error: recording does not start with a keyframe")
+if len(data) < buffered // 2:
+    print("Error: buffered frames were not written")
+if pts.getvalue().count("\n") < 2 * 30:
+    print("Error: frames after the trigger were not written")
+
+picam2.close()
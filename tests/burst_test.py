@@ -0,0 +1,32 @@
+#!/usr/bin/python3
+
+import time
+
+from picamera2_contrib import Picamera2
+
+picam2 = Picamera2()
+config = picam2.create_video_configuration({"size": (640, 480)}, lores={"size": (320, 240)})
+picam2.configure(config)
+picam2.start()
+
+arrays, metadata = picam2.capture_burst(30, ["main", "lores"])
+if len(metadata) != 30:
+    print("Error: expected 30 metadata dictionaries, got", len(metadata))
+if arrays[0].shape[:3] != (30, 480, 640) or arrays[1].shape[:2] != (30, 360):
+    print("Error: unexpected burst shapes", arrays[0].shape, arrays[1].shape)
+timestamps = [md["SensorTimestamp"] for md in metadata]
+frame_duration = metadata[0]["FrameDuration"] * 1000
+if any(t2 - t1 > 1.5 * frame_duration for t1, t2 in zip(timestamps, timestamps[1:])):
+    print("Error: burst frames were not consecutive")
+
+# Capture again into the same arrays, which should involve no new allocations.
+start = time.monotonic()
+arrays2, metadata2 = picam2.capture_burst(30, ["main", "lores"], out=arrays)
+print("Reused burst took", round(time.monotonic() - start, 2), "seconds")
+if arrays2[0] is not arrays[0] or arrays2[1] is not arrays[1]:
+    print("Error: burst did not reuse the supplied arrays")
+if metadata2[0]["SensorTimestamp"] <= metadata[-1]["SensorTimestamp"]:
+    print("Error: second burst did not follow the first")
+
+picam2.stop()
+picam2.close()
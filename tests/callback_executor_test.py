@@ -0,0 +1,35 @@
+#!/usr/bin/python3
+
+import time
+
+from picamera2_contrib import CallbackExecutor, MappedArray, Picamera2
+
+
+def slow_callback(request):
+    # Every few frames the "overlay" takes far longer than a frame time.
+    with MappedArray(request, "main") as m:
+        m.array[:10, :10] = 255
+    if request.get_metadata()["SensorTimestamp"] // 1000000 % 4 == 0:
+        time.sleep(0.2)
+
+
+picam2 = Picamera2()
+picam2.configure(picam2.create_preview_configuration())
+picam2.post_callback = slow_callback
+picam2.callback_executor = CallbackExecutor(num_threads=2, deadline=0.02)
+picam2.start()
+
+start = time.monotonic()
+for _ in range(60):
+    picam2.capture_metadata()
+elapsed = time.monotonic() - start
+
+picam2.stop()
+stats = picam2.callback_executor.stats()
+print("60 frames in", round(elapsed, 2), "seconds", stats)
+if elapsed > 4:
+    print("Error: slow callbacks stalled the event loop")
+if stats["frames_missed"] == 0:
+    print("Error: expected some frames to miss their deadline")
+picam2.callback_executor.shutdown()
+picam2.close()
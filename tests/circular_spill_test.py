@@ -0,0 +1,45 @@
+#!/usr/bin/python3
+
+# Run CircularOutput2 with most of its buffer spilled to segment files, and check that a recording
+# opened from it replays the buffered video, starting from a keyframe, into a file that decodes.
+
+import os
+import tempfile
+import time
+
+import av
+
+from picamera2_contrib import Picamera2
+from picamera2_contrib.encoders import LibavH264Encoder
+from picamera2_contrib.outputs import CircularOutput2, PyavOutput, SegmentRing
+
+picam2 = Picamera2()
+config = picam2.create_video_configuration({"size": (1280, 720), "format": "YUV420"}, controls={"FrameRate": 30})
+picam2.configure(config)
+
+encoder = LibavH264Encoder(bitrate=10000000)
+ring = SegmentRing(segment_bytes=4 * 1024 * 1024, num_segments=4)
+circular = CircularOutput2(buffer_duration_ms=4000, spill=ring, memory_duration_ms=500)
+picam2.start_recording(encoder, circular)
+time.sleep(5)
+
+print("frames in memory", len(circular._circular), "frames spilled", len(ring))
+if not len(ring):
+    print("Error: no frames were spilled")
+if len(circular._circular) > 30:
+    print("Error: too many frames held in memory")
+
+with tempfile.TemporaryDirectory() as directory:
+    filename = os.path.join(directory, "spill.mp4")
+    circular.open_output(PyavOutput(filename))
+    time.sleep(1)
+    circular.close_output()
+    picam2.stop_recording()
+    with av.open(filename) as container:
+        frames = sum(1 for _ in container.decode(video=0))
+    print("decoded", frames, "frames")
+    if frames < 3 * 30:
+        print("Error: the buffered frames were not replayed")
+
+ring.close()
+picam2.close()
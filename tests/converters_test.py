@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+
+# Check the fixed-point YUV converters against a floating point reference, and compare their
+# speed with YUV420_to_RGB. No camera is needed.
+
+import time
+
+import numpy as np
+
+from picamera2_contrib.converters import (YUV2RGB_JPEG, YUV2RGB_REC709,
+                                          YUV2RGB_SMPTE170M, YUV420_to_RGB,
+                                          YUVConverter)
+
+rng = np.random.default_rng(0)
+w, h, stride = 640, 480, 704
+Y = rng.integers(0, 256, (h, w), dtype=np.uint8)
+U = rng.integers(0, 256, (h // 2, w // 2), dtype=np.uint8)
+V = rng.integers(0, 256, (h // 2, w // 2), dtype=np.uint8)
+
+
+def pad(array, width):
+    padded = np.zeros((array.shape[0], width), dtype=np.uint8)
+    padded[:, :array.shape[1]] = array
+    return padded.ravel()
+
+
+def reference(y, u, v, matrix):
+    yuv = np.stack([y, u - 128.0, v - 128.0], axis=-1)
+    return np.clip(np.floor(yuv @ matrix[:, [2, 1, 0]] + 0.5), 0, 255)
+
+
+buffers = {
+    "YUV420": np.concatenate([pad(Y, stride), pad(U, stride // 2), pad(V, stride // 2)]),
+    "YVU420": np.concatenate([pad(Y, stride), pad(V, stride // 2), pad(U, stride // 2)]),
+    "NV12": np.concatenate([pad(Y, stride), pad(np.stack([U, V], axis=-1).reshape(h // 2, w), stride)]),
+    "NV21": np.concatenate([pad(Y, stride), pad(np.stack([V, U], axis=-1).reshape(h // 2, w), stride)]),
+}
+U2 = U.repeat(2, axis=0)
+V2 = V.repeat(2, axis=0)
+packed = {
+    "YUYV": (Y[:, 0::2], U2, Y[:, 1::2], V2),
+    "YVYU": (Y[:, 0::2], V2, Y[:, 1::2], U2),
+    "UYVY": (U2, Y[:, 0::2], V2, Y[:, 1::2]),
+    "VYUY": (V2, Y[:, 0::2], U2, Y[:, 1::2]),
+}
+for fmt, samples in packed.items():
+    buffers[fmt] = pad(np.stack(samples, axis=-1).reshape(h, 2 * w), 2 * stride)
+
+for matrix in (YUV2RGB_JPEG, YUV2RGB_SMPTE170M, YUV2RGB_REC709):
+    full = reference(Y, U.repeat(2, 0).repeat(2, 1), V.repeat(2, 0).repeat(2, 1), matrix)
+    half = reference(Y[0::2, 0::2], U, V, matrix)
+    for fmt, buffer in buffers.items():
+        line_stride = 2 * stride if fmt in packed else stride
+        out = np.empty((h, w, 3), dtype=np.uint8)
+        result = YUVConverter(fmt, (w, h), line_stride, matrix)(buffer, out=out)
+        if result is not out or np.abs(result - full).max() > 1:
+            print("Error: full resolution", fmt, "conversion is wrong")
+        result = YUVConverter(fmt, (w, h), line_stride, matrix, half=True)(buffer)
+        if np.abs(result - half).max() > 1:
+            print("Error: half resolution", fmt, "conversion is wrong")
+
+
+def benchmark(function, repeats=10):
+    function()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+w, h = 1920, 1080
+buffer = rng.integers(0, 256, w * h * 3 // 2, dtype=np.uint8)
+half_converter = YUVConverter("YUV420", (w, h), half=True)
+full_converter = YUVConverter("YUV420", (w, h))
+half_out = np.empty(half_converter.output_shape, dtype=np.uint8)
+full_out = np.empty(full_converter.output_shape, dtype=np.uint8)
+if np.abs(YUV420_to_RGB(buffer, (w, h)) - half_converter(buffer).astype(int)).max() > 1:
+    print("Error: YUVConverter disagrees with YUV420_to_RGB")
+print(f"1920x1080 YUV420: YUV420_to_RGB (half) {benchmark(lambda: YUV420_to_RGB(buffer, (w, h))):.1f}ms, "
+      f"YUVConverter half {benchmark(lambda: half_converter(buffer, out=half_out)):.1f}ms, "
+      f"full {benchmark(lambda: full_converter(buffer, out=full_out)):.1f}ms")
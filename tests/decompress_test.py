@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+
+# Check that the tiled PiSP decompression is bit-identical to the original whole-frame version, and
+# compare the time and peak memory that save_dng takes with each.
+
+import io
+import time
+import tracemalloc
+
+import numpy as np
+
+from picamera2_contrib import Picamera2, SensorFormat
+
+
+def reference_decompress(array):
+    # The original implementation, which makes many full-frame temporaries.
+    offset = 2048
+    words = array.view(np.int32)
+    words = words.reshape((words.shape[0], words.shape[1] // 2, 2))
+    qmode = words & 3
+    pix0 = (words >> 2) & 511
+    pix1 = ((words >> 11) & 127) - 64
+    pix2 = (words >> 18) & 127
+    pix3 = (words >> 25) & 127
+    q1 = np.copy(pix0)
+    q2 = pix1 + 448
+    np.maximum(pix0, pix0 - pix1, where=(qmode * pix0 < 768), out=q1)
+    np.maximum(pix0, pix0 + pix1, where=(qmode * pix0 < 768), out=q2)
+    q0 = np.minimum(1536 >> qmode, np.maximum(0, q1 - 64)) + pix2
+    q3 = np.minimum(1536 >> qmode, np.maximum(0, q2 - 64)) + pix3
+    np.maximum(np.maximum(16 * q0, 32 * (q0 - 160)), 64 * qmode * q0, out=pix0)
+    np.maximum(np.maximum(16 * q1, 32 * (q1 - 160)), 64 * qmode * q1, out=pix1)
+    np.maximum(np.maximum(16 * q2, 32 * (q2 - 160)), 64 * qmode * q2, out=pix2)
+    np.maximum(np.maximum(16 * q3, 32 * (q3 - 160)), 64 * qmode * q3, out=pix3)
+    q2 = (words >> 2) & 32767
+    q3 = (words >> 17) & 32767
+    q0 = (q2 & 15) + 16 * ((q2 >> 8) // 11)
+    q1 = (q2 >> 4) % 176
+    q2 = (q3 & 15) + 16 * ((q3 >> 8) // 11)
+    q3 = (q3 >> 4) % 176
+    np.maximum(256 * q0, 512 * (q0 - 47), out=pix0, where=(qmode == 3))
+    np.maximum(256 * q1, 512 * (q1 - 47), out=pix1, where=(qmode == 3))
+    np.maximum(256 * q2, 512 * (q2 - 47), out=pix2, where=(qmode == 3))
+    np.maximum(256 * q3, 512 * (q3 - 47), out=pix3, where=(qmode == 3))
+    res = np.stack((pix0, pix1, pix2, pix3), axis=2).reshape(array.shape)
+    res = np.clip(res + offset, 0, 65535).astype(np.uint16)
+    return res.view(np.uint8)
+
+
+def measure(function):
+    tracemalloc.start()
+    start = time.monotonic()
+    function()
+    elapsed = time.monotonic() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed * 1000, peak / 1e6
+
+
+# Random data exercises every quantisation mode.
+rng = np.random.default_rng(0)
+array = rng.integers(0, 256, (1000, 4064), dtype=np.uint8)
+
+picam2 = Picamera2()
+helpers = picam2.helpers
+if not np.array_equal(reference_decompress(array), helpers.decompress(array)):
+    print("Error: decompression of random data is not bit-identical")
+
+config = picam2.create_still_configuration(raw={})
+picam2.configure(config)
+if SensorFormat(picam2.camera_config["raw"]["format"]).packing != "PISP_COMP1":
+    print("Raw stream is not compressed on this platform, skipping save_dng comparison")
+else:
+    picam2.start()
+    request = picam2.capture_request()
+    raw = helpers._make_array_shared(request.make_buffer("raw"), request.config["raw"])
+    if not np.array_equal(reference_decompress(raw), helpers.decompress(raw)):
+        print("Error: decompression of camera image is not bit-identical")
+
+    tiled = measure(lambda: request.save_dng(io.BytesIO()))
+    helpers.decompress = reference_decompress
+    original = measure(lambda: request.save_dng(io.BytesIO()))
+    del helpers.decompress
+    request.release()
+    print(f"save_dng: original {original[0]:.0f}ms peak {original[1]:.0f}MB, "
+          f"tiled {tiled[0]:.0f}ms peak {tiled[1]:.0f}MB")
+    if tiled[1] > original[1]:
+        print("Error: tiled decompression used more memory")
+    picam2.stop()
+picam2.close()
@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+
+# Write low-latency HLS from the H.264 encoder, and check that the playlist lists only whole segments and
+# parts, with old segments deleted, and that the finished stream plays back through the playlist.
+
+import os
+import tempfile
+import time
+
+import av
+
+from picamera2_contrib import Picamera2
+from picamera2_contrib.encoders import H264Encoder
+from picamera2_contrib.outputs import HlsOutput
+
+picam2 = Picamera2()
+config = picam2.create_video_configuration({"size": (1280, 720)}, controls={"FrameRate": 30})
+picam2.configure(config)
+
+with tempfile.TemporaryDirectory() as directory:
+    output = HlsOutput(directory, segment_duration_ms=1000, part_duration_ms=200, list_size=3)
+    picam2.start_recording(H264Encoder(5000000, iperiod=15), output)
+    time.sleep(6)
+
+    with open(os.path.join(directory, "stream.m3u8")) as f:
+        playlist = f.read()
+    print(playlist)
+    if "#EXT-X-PART:" not in playlist or "#EXT-X-MAP:URI=\"init.mp4\"" not in playlist:
+        print("Error: playlist is missing parts or the initialisation segment")
+    for line in playlist.splitlines():
+        if 'URI="' in line:
+            name = line.split('URI="')[1].split('"')[0]
+        elif line and not line.startswith("#"):
+            name = line
+        else:
+            continue
+        if not os.path.isfile(os.path.join(directory, name)):
+            print("Error: playlist lists missing file", name)
+    segments = [name for name in os.listdir(directory) if name.endswith(".m4s") and name.count(".") == 1]
+    if len(segments) > 4:
+        print("Error: old segments were not deleted")
+
+    picam2.stop_recording()
+    with av.open(os.path.join(directory, "stream.m3u8")) as container:
+        frames = sum(1 for _ in container.decode(video=0))
+    print("decoded", frames, "frames")
+    if frames < 2 * 30:
+        print("Error: too few frames played back")
+    if any(name.endswith(".tmp") for name in os.listdir(directory)):
+        print("Error: temporary files left behind")
+
+picam2.close()
@@ -0,0 +1,39 @@
+#!/usr/bin/python3
+
+import time
+
+from picamera2_contrib import Picamera2
+from picamera2_contrib.utils import convert_from_libcamera_type
+
+picam2 = Picamera2()
+picam2.start()
+
+with picam2.captured_request() as request:
+    eager = {k.name: convert_from_libcamera_type(v) for k, v in request.request.metadata.items()}
+    lazy = request.metadata
+    if lazy["SensorTimestamp"] != eager["SensorTimestamp"]:
+        print("Error: SensorTimestamp differs")
+    if "NotAControl" in lazy or lazy.get("NotAControl") is not None:
+        print("Error: lookup of unknown key succeeded")
+    if dict(lazy) != eager or request.get_metadata() != eager:
+        print("Error: lazy metadata does not match eager conversion")
+    if request.metadata is not lazy:
+        print("Error: metadata view is not cached on the request")
+
+# Compare the cost of reading a couple of hot keys from each new request.
+eager_time = lazy_time = 0
+for _ in range(50):
+    with picam2.captured_request() as request:
+        start = time.perf_counter()
+        md = request.get_metadata()
+        _ = md["SensorTimestamp"], md["ExposureTime"]
+        eager_time += time.perf_counter() - start
+    with picam2.captured_request() as request:
+        start = time.perf_counter()
+        md = request.metadata
+        _ = md["SensorTimestamp"], md["ExposureTime"]
+        lazy_time += time.perf_counter() - start
+print(f"Per frame: get_metadata {eager_time * 20:.3f}ms, lazy {lazy_time * 20:.3f}ms")
+
+picam2.stop()
+picam2.close()
@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+
+# Record with LibavH264Encoder, first evenly and then with a region of interest in the middle of the
+# image and a lower quality background, set each frame from the post_callback. The second recording
+# must come out smaller.
+
+import io
+import time
+
+from picamera2_contrib import Picamera2
+from picamera2_contrib.encoders import LibavH264Encoder
+from picamera2_contrib.outputs import FileOutput
+
+picam2 = Picamera2()
+config = picam2.create_video_configuration({"size": (1280, 720), "format": "YUV420"}, controls={"FrameRate": 30})
+picam2.configure(config)
+picam2.start()
+
+sizes = []
+for use_roi in (False, True):
+    encoder = LibavH264Encoder()
+    encoder.enable_roi = True
+    buffer = io.BytesIO()
+
+    def set_roi(request, encoder=encoder, use_roi=use_roi):
+        if use_roi:
+            # A stand-in for a detection, in the coordinates IMX500.convert_inference_coords would give.
+            encoder.set_roi([(480, 240, 320, 240)], qp_offset=-6, background_qp_offset=12)
+
+    picam2.post_callback = set_roi
+    picam2.start_encoder(encoder, FileOutput(buffer), quality=None)
+    time.sleep(5)
+    picam2.stop_encoder(encoder)
+    picam2.post_callback = None
+    sizes.append(len(buffer.getvalue()))
+    print("with" if use_roi else "without", "regions of interest:", sizes[-1], "bytes")
+
+if not sizes[0] or sizes[1] >= sizes[0]:
+    print("Error: regions of interest did not reduce the bitrate")
+
+try:
+    LibavH264Encoder().set_roi([(0, 0, 100, 100)])
+    print("Error: set_roi allowed without enable_roi")
+except RuntimeError:
+    pass
+
+picam2.stop()
+picam2.close()
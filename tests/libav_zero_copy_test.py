@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+
+# Record 1080p30 YUV420 with the libav encoders, passing frames to libav both with and without copying
+# them, and report the frame rate and CPU time of each. The camera must keep running at full rate, and
+# no camera buffers may be left held once the encoder has stopped.
+
+import io
+import time
+
+from picamera2_contrib import Picamera2
+from picamera2_contrib.encoders import LibavH264Encoder, LibavMjpegEncoder
+from picamera2_contrib.outputs import FileOutput
+
+picam2 = Picamera2()
+config = picam2.create_video_configuration({"size": (1920, 1080), "format": "YUV420"}, controls={"FrameRate": 30})
+picam2.configure(config)
+picam2.start()
+
+for encoder_class in (LibavH264Encoder, LibavMjpegEncoder):
+    for zero_copy in (False, True):
+        encoder = encoder_class(bitrate=10000000)
+        encoder.zero_copy = zero_copy
+        output = FileOutput(io.BytesIO())
+        start_time, start_cpu = time.monotonic(), time.process_time()
+        picam2.start_encoder(encoder, output)
+        time.sleep(5)
+        picam2.stop_encoder(encoder)
+        elapsed, cpu = time.monotonic() - start_time, time.process_time() - start_cpu
+        stats = encoder.stats()
+        frames = stats["frames_wrapped"] + stats["frames_copied"]
+        print(encoder_class.__name__, "zero copy" if zero_copy else "copying", f"{frames / elapsed:.1f} fps",
+              f"CPU {100 * cpu / elapsed:.0f}%", stats)
+        if frames < 120:
+            print("Error: the encoder did not keep up with the camera")
+        if zero_copy and not stats["frames_wrapped"]:
+            print("Error: no frames were passed to libav without copying")
+        if not zero_copy and stats["frames_wrapped"]:
+            print("Error: frames were passed to libav without copying")
+        if encoder._frame_maker.held:
+            print("Error: camera buffers still held after stopping")
+
+picam2.stop()
+picam2.close()
@@ -0,0 +1,45 @@
+#!/usr/bin/python3
+
+import glob
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from picamera2_contrib import MetadataRecorder, Picamera2
+
+picam2 = Picamera2()
+picam2.configure(picam2.create_preview_configuration())
+
+with tempfile.TemporaryDirectory() as directory:
+    picam2.metadata_recorder = MetadataRecorder(chunk_size=30, directory=directory)
+    picam2.start()
+    time.sleep(3)
+    picam2.stop()
+    recorder = picam2.metadata_recorder
+    picam2.metadata_recorder = None
+    recorder.close()
+    print(recorder.stats())
+
+    files = sorted(glob.glob(os.path.join(directory, "metadata*.npz")))
+    if len(files) < 2:
+        print("Error: expected several chunk files, got", files)
+    timestamps = np.concatenate([np.load(file)["SensorTimestamp"] for file in files])
+    if len(timestamps) != recorder.frames_recorded:
+        print("Error: files hold", len(timestamps), "frames but", recorder.frames_recorded, "were recorded")
+    if np.any(np.diff(timestamps) <= 0):
+        print("Error: timestamps are not increasing")
+    exposures = np.load(files[0])["ExposureTime"]
+    if exposures.dtype != np.int32 or not np.all(exposures > 0):
+        print("Error: bad exposure times recorded", exposures)
+
+# In-memory ring of the most recent frames.
+picam2.metadata_recorder = MetadataRecorder(["SensorTimestamp", "AnalogueGain"], chunk_size=10)
+picam2.start()
+time.sleep(1)
+data = picam2.metadata_recorder.data()
+if len(data["SensorTimestamp"]) != 10 or np.any(np.diff(data["SensorTimestamp"]) <= 0):
+    print("Error: ring did not hold the 10 most recent frames in order", data["SensorTimestamp"])
+picam2.stop()
+picam2.close()
@@ -0,0 +1,46 @@
+#!/usr/bin/python3
+
+# Drive a deliberately slow JpegEncoder from a camera with few buffers, and check that bounding the
+# frames in flight keeps the camera running, with the dropped frames counted.
+
+import io
+import time
+
+from picamera2_contrib import BackpressurePolicy, Picamera2
+from picamera2_contrib.encoders import JpegEncoder
+from picamera2_contrib.outputs import FileOutput
+
+picam2 = Picamera2()
+config = picam2.create_video_configuration({"size": (1920, 1080), "format": "RGB888"}, buffer_count=4,
+                                           controls={"FrameRate": 30})
+picam2.configure(config)
+
+frames = 0
+
+
+def count_frames(request):
+    global frames
+    frames += 1
+
+
+picam2.post_callback = count_frames
+picam2.start()
+
+for policy in (BackpressurePolicy.DROP_NEWEST, BackpressurePolicy.DROP_OLDEST):
+    for copy_frames in (False, True):
+        encoder = JpegEncoder(num_threads=1, q=95, max_in_flight=2, drop_policy=policy, copy_frames=copy_frames)
+        frames = 0
+        picam2.start_encoder(encoder, FileOutput(io.BytesIO()))
+        time.sleep(3)
+        picam2.stop_encoder(encoder)
+        stats = encoder.stats()
+        print(policy, "copy_frames" if copy_frames else "", "camera frames", frames, stats)
+        if frames < 60:
+            print("Error: the camera stalled while encoding")
+        if stats["max_queue_depth"] > 2:
+            print("Error: more than max_in_flight frames were in flight")
+        if stats["queue_depth"] != 0:
+            print("Error: frames still in flight after stopping")
+
+picam2.stop()
+picam2.close()
@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+
+# Encode full size, reduced and thumbnail JPEGs from every frame, and check each rendition's outputs
+# receive JPEGs of the right size in frame order.
+
+import time
+
+import simplejpeg
+
+from picamera2_contrib import Picamera2
+from picamera2_contrib.encoders import MultiRenditionEncoder, Rendition
+from picamera2_contrib.outputs import Output
+
+
+class JpegCheckOutput(Output):
+    def __init__(self):
+        super().__init__()
+        self.sizes = set()
+        self.timestamps = []
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+        height, width = simplejpeg.decode_jpeg_header(frame)[:2]
+        self.sizes.add((width, height))
+        self.timestamps.append(timestamp)
+
+
+picam2 = Picamera2()
+config = picam2.create_video_configuration({"size": (1920, 1080), "format": "YUV420"},
+                                           lores={"size": (640, 360), "format": "YUV420"})
+picam2.configure(config)
+
+outputs = [JpegCheckOutput(), JpegCheckOutput(), JpegCheckOutput()]
+renditions = [Rendition(outputs[0], quality=85),
+              Rendition(outputs[1], (854, 480), quality=50),
+              Rendition(outputs[2], (320, 180), quality=50, name="lores")]
+encoder = MultiRenditionEncoder(renditions, max_in_flight=4)
+picam2.start()
+picam2.start_encoder(encoder)
+time.sleep(3)
+picam2.stop_encoder(encoder)
+picam2.stop()
+print("Encoder stats:", encoder.stats(), "renditions:", [r.frames_encoded for r in renditions])
+
+for output, size in zip(outputs, [(1920, 1080), (854, 480), (320, 180)]):
+    if output.sizes != {size}:
+        print("Error: expected JPEGs of size", size, "but got", output.sizes)
+    if output.timestamps != sorted(output.timestamps):
+        print("Error: JPEGs were not output in frame order")
+if len({len(output.timestamps) for output in outputs}) != 1:
+    print("Error: renditions received different numbers of frames")
+if not outputs[0].timestamps:
+    print("Error: no frames were encoded")
+
+picam2.close()
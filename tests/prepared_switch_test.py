@@ -0,0 +1,42 @@
+#!/usr/bin/python3
+
+import time
+
+from picamera2_contrib import Picamera2
+from picamera2_contrib.allocators import PersistentAllocator
+
+picam2 = Picamera2(allocator=PersistentAllocator())
+preview_config = picam2.create_preview_configuration()
+still_config = picam2.create_still_configuration()
+
+# First time the ordinary way, for comparison.
+picam2.start(preview_config)
+start = time.monotonic()
+for _ in range(3):
+    picam2.switch_mode_and_capture_array(still_config)
+normal = (time.monotonic() - start) / 3
+picam2.stop()
+
+preview = picam2.prepare_configuration(picam2.create_preview_configuration(use_case="prepared_preview"))
+still = picam2.prepare_configuration(picam2.create_still_configuration(use_case="prepared_still"))
+picam2.start(preview)
+start = time.monotonic()
+for _ in range(3):
+    array = picam2.switch_mode_and_capture_array(still)
+prepared = (time.monotonic() - start) / 3
+print(f"Capture with mode switches: normal {normal * 1000:.0f}ms, prepared {prepared * 1000:.0f}ms")
+print(f"Switch latency: still {still.switch_latency * 1000:.1f}ms, preview {preview.switch_latency * 1000:.1f}ms")
+
+if array.shape[:2] != still.camera_config["main"]["size"][::-1]:
+    print("Error: captured array has the wrong size", array.shape)
+if still.switch_count != 3 or preview.switch_count != 3:
+    print("Error: unexpected switch counts", still.switch_count, preview.switch_count)
+if picam2.camera_config["use_case"] != "prepared_preview":
+    print("Error: did not return to the prepared preview configuration")
+picam2.capture_metadata()
+
+picam2.stop()
+picam2.release_prepared_configuration(still)
+if picam2.prepared_configurations != [preview]:
+    print("Error: still configuration was not released")
+picam2.close()
@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+
+# Record to a fast output and a deliberately slow one, each behind a QueuedOutput, and check that the
+# slow one drops frames without holding up the fast one.
+
+import io
+import time
+
+from picamera2_contrib import Picamera2
+from picamera2_contrib.encoders import H264Encoder
+from picamera2_contrib.outputs import (FileOutput, Output, OverflowPolicy,
+                                       QueuedOutput)
+
+
+class SlowOutput(Output):
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+        self.keyframes = []
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+        time.sleep(self.delay)
+        self.keyframes.append(keyframe)
+
+
+picam2 = Picamera2()
+picam2.configure(picam2.create_video_configuration(controls={"FrameRate": 30}))
+
+for policy in OverflowPolicy:
+    encoder = H264Encoder(bitrate=5000000, iperiod=15)
+    fast = QueuedOutput(FileOutput(io.BytesIO()))
+    slow_output = SlowOutput(0.1)
+    slow = QueuedOutput(slow_output, max_frames=10, policy=policy)
+    picam2.start_recording(encoder, [fast, slow])
+    time.sleep(3)
+    picam2.stop_recording()
+    print(policy, "fast:", fast.stats())
+    print(policy, "slow:", slow.stats())
+    if fast.frames_dropped:
+        print("Error: the fast output dropped frames")
+    if policy == OverflowPolicy.BLOCK:
+        if slow.frames_dropped:
+            print("Error: the blocking output dropped frames")
+    elif not slow.frames_dropped:
+        print("Error: the slow output did not drop frames")
+    if policy == OverflowPolicy.DROP_TO_KEYFRAME:
+        if fast.frames_delivered < 80:
+            print("Error: the fast output was held up")
+        if slow_output.keyframes and not slow_output.keyframes[0]:
+            print("Error: the slow output did not start with a keyframe")
+    if policy == OverflowPolicy.DISCONNECT and not slow.disconnected:
+        print("Error: the slow output was not disconnected")
+
+picam2.close()
@@ -0,0 +1,35 @@
+#!/usr/bin/python3
+
+# Unpack raw frames in whatever format the sensor gives, and check them against the unpacked
+# raw format where the platform can produce one. Then time the binned debayer.
+
+import time
+
+import numpy as np
+
+from picamera2_contrib import Picamera2, SensorFormat
+
+picam2 = Picamera2()
+for mode in picam2.sensor_modes:
+    fmt = SensorFormat(str(mode["format"]))
+    config = picam2.create_preview_configuration(raw={"format": fmt.format, "size": mode["size"]})
+    picam2.configure(config)
+    picam2.start()
+    raw_format = picam2.camera_config["raw"]["format"]
+    with picam2.captured_request() as request:
+        start = time.monotonic()
+        raw = request.make_unpacked_array("raw")
+        unpack_time = time.monotonic() - start
+        w, h = request.config["raw"]["size"]
+        if raw.shape != (h, w) or raw.dtype != np.uint16:
+            print("Error: unpacked", raw_format, "array has shape", raw.shape, raw.dtype)
+        if raw.max() >= 1 << SensorFormat(raw_format).bit_depth:
+            print("Error: unpacked", raw_format, "values exceed the bit depth")
+
+        start = time.monotonic()
+        rgb = picam2.helpers.debayer_binned(raw, raw_format, out=np.empty((h // 2, w // 2, 3), dtype=np.uint8))
+        debayer_time = time.monotonic() - start
+    print(f"{raw_format} {w}x{h}: unpack {unpack_time * 1000:.1f}ms, debayer {debayer_time * 1000:.1f}ms, "
+          f"mean RGB {rgb.reshape(-1, 3).mean(axis=0).round(1)}")
+    picam2.stop()
+picam2.close()
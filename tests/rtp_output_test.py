@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+
+# Send the H.264 stream over RTP to ourselves, and check that large frames are fragmented to fit the
+# mtu, that the sequence numbers run on and that each frame ends with a marked packet, and that libav
+# can play the stream using the SDP description.
+
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+
+import av
+
+from picamera2_contrib import Picamera2
+from picamera2_contrib.encoders import H264Encoder
+from picamera2_contrib.outputs import RtpOutput
+
+picam2 = Picamera2()
+config = picam2.create_video_configuration({"size": (1280, 720)}, controls={"FrameRate": 30})
+picam2.configure(config)
+
+receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+receiver.bind(("127.0.0.1", 0))
+receiver.settimeout(1)
+packets = []
+
+
+def receive():
+    try:
+        while True:
+            packets.append(receiver.recv(2048))
+    except socket.timeout:
+        pass
+
+
+thread = threading.Thread(target=receive)
+thread.start()
+output = RtpOutput("127.0.0.1", receiver.getsockname()[1], mtu=1200, max_bitrate=50000000)
+picam2.start_recording(H264Encoder(5000000, iperiod=15), output)
+time.sleep(3)
+picam2.stop_recording()
+thread.join()
+receiver.close()
+
+print(output.stats(), "received", len(packets), "packets")
+if len(packets) != output.packets_sent:
+    print("Error: packets were lost")
+if max(len(packet) for packet in packets) > 1200:
+    print("Error: packet bigger than the mtu")
+sequences = [struct.unpack_from(">H", packet, 2)[0] for packet in packets]
+if any((b - a) & 0xFFFF != 1 for a, b in zip(sequences, sequences[1:])):
+    print("Error: sequence numbers are not consecutive")
+if not any(packet[12] & 0x1F == 28 for packet in packets):
+    print("Error: no FU-A fragments sent")
+markers = sum(1 for packet in packets if packet[1] & 0x80)
+if markers < 2.5 * 30:
+    print("Error: too few frames were marked", markers)
+
+with tempfile.TemporaryDirectory() as directory:
+    sdp_file = os.path.join(directory, "stream.sdp")
+    output = RtpOutput("127.0.0.1", 5006, sdp_file=sdp_file)
+    decoded = []
+
+    def play():
+        # Wait for the SDP description, which appears with the first keyframe.
+        while not os.path.exists(sdp_file):
+            time.sleep(0.01)
+        with av.open(sdp_file, options={"protocol_whitelist": "file,udp,rtp"}, timeout=2) as container:
+            try:
+                for frame in container.decode(video=0):
+                    decoded.append(frame)
+            except av.error.FFmpegError:
+                pass
+
+    thread = threading.Thread(target=play)
+    thread.start()
+    picam2.start_recording(H264Encoder(5000000, iperiod=15), output)
+    time.sleep(3)
+    picam2.stop_recording()
+    thread.join()
+    print(output.sdp())
+    print("decoded", len(decoded), "frames")
+    if len(decoded) < 30:
+        print("Error: too few frames played back")
+
+picam2.close()
@@ -0,0 +1,58 @@
+#!/usr/bin/python3
+
+# Save a fast timelapse through a SavePipeline and check that every frame arrives, then check
+# that the drop policies drop rather than stall when the queue is tiny.
+
+import os
+import tempfile
+import time
+
+from picamera2_contrib import BackpressurePolicy, Picamera2, SavePipeline
+
+picam2 = Picamera2()
+config = picam2.create_still_configuration({"size": (1920, 1080), "format": "RGB888"}, buffer_count=3)
+picam2.configure(config)
+picam2.start()
+
+with tempfile.TemporaryDirectory() as directory:
+    picam2.save_pipeline = SavePipeline(num_threads=2)
+    start = time.monotonic()
+    futures = [picam2.capture_file(os.path.join(directory, f"image{i:03d}.jpg")) for i in range(20)]
+    submitted = time.monotonic() - start
+    metadata = [future.result() for future in futures]
+    saved = time.monotonic() - start
+    print(f"Submitted 20 frames in {submitted:.2f}s, all saved after {saved:.2f}s")
+    stats = picam2.save_pipeline.stats()
+    if stats["saved"] != 20 or stats["dropped"] or stats["pending_bytes"]:
+        print("Error: unexpected save pipeline stats", stats)
+    if len(os.listdir(directory)) != 20:
+        print("Error: expected 20 files, found", len(os.listdir(directory)))
+    timestamps = [md["SensorTimestamp"] for md in metadata]
+    if timestamps != sorted(timestamps):
+        print("Error: frames were not captured in order")
+    picam2.save_pipeline.shutdown()
+
+    # Room for only one frame, so later frames must be dropped while the first one saves.
+    for policy in (BackpressurePolicy.DROP_NEWEST, BackpressurePolicy.DROP_OLDEST):
+        framesize = picam2.camera_config["main"]["framesize"]
+        picam2.save_pipeline = SavePipeline(num_threads=1, max_bytes=framesize, policy=policy)
+        futures = [picam2.capture_file(os.path.join(directory, f"drop{i:03d}.png")) for i in range(5)]
+        picam2.save_pipeline.shutdown()
+        stats = picam2.save_pipeline.stats()
+        if stats["saved"] + stats["dropped"] != 5 or not stats["dropped"]:
+            print("Error:", policy, "did not drop frames", stats)
+        if sum(future.cancelled() for future in futures) != stats["dropped"]:
+            print("Error: cancelled futures do not match the dropped count")
+
+    # A raw frame goes through the pipeline as a DNG.
+    picam2.stop()
+    picam2.configure(picam2.create_still_configuration(raw={}))
+    picam2.start()
+    picam2.save_pipeline = SavePipeline()
+    picam2.capture_file(os.path.join(directory, "raw.dng"), name="raw").result()
+    if os.path.getsize(os.path.join(directory, "raw.dng")) == 0:
+        print("Error: empty DNG file")
+    picam2.save_pipeline.shutdown()
+
+picam2.stop()
+picam2.close()
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+
+# Record with a SplittableOutput that starts a new file every 2 seconds, and check that the segment
+# index lists every file, that each starts with a keyframe, and that the segments leave no gaps.
+# Do it for segments named by number and by time.
+
+import os
+import tempfile
+import time
+
+from picamera2_contrib import Picamera2
+from picamera2_contrib.encoders import H264Encoder
+from picamera2_contrib.outputs import SplittableOutput
+
+picam2 = Picamera2()
+config = picam2.create_video_configuration({"size": (1280, 720)}, controls={"FrameRate": 30})
+picam2.configure(config)
+
+
+def check(pattern):
+    with tempfile.TemporaryDirectory() as directory:
+        index_path = os.path.join(directory, "segments.idx")
+        output = SplittableOutput(segment_duration_ms=2000, path_pattern=os.path.join(directory, pattern),
+                                  index_path=index_path)
+        encoder = H264Encoder(5000000, repeat=True, iperiod=15)
+        picam2.start_recording(encoder, output)
+        time.sleep(7)
+        picam2.stop_recording()
+
+        segments = SplittableOutput.read_index(index_path)
+        for segment in segments:
+            print(segment)
+        if len(segments) < 3:
+            print("Error: too few segments")
+        if len({segment["path"] for segment in segments}) != len(segments):
+            print("Error: segments share a path")
+        for segment in segments:
+            with open(segment["path"], "rb") as f:
+                data = f.read()
+            if len(data) != segment["size"]:
+                print("Error: index has the wrong size for", segment["path"])
+            if not data.startswith(b"\x00\x00\x00\x01") or data[4] & 0x1f != 7:
+                print("Error: segment does not start with a keyframe")
+        for previous, segment in zip(segments, segments[1:]):
+            if segment["start_pts"] - previous["end_pts"] > 50000:
+                print("Error: gap between segments")
+            if segment["end_pts"] - segment["start_pts"] > 3000000:
+                print("Error: segment too long")
+        middle = segments[1]["start_time"] / 1000000 + 0.5
+        if SplittableOutput.find_segment(index_path, middle) != segments[1]:
+            print("Error: find_segment did not find the right segment")
+        if sorted(os.listdir(directory)) != sorted([os.path.basename(segment["path"]) for segment in segments] +
+                                                   ["segments.idx"]):
+            print("Error: files left that are not in the index")
+
+
+check("{number:04d}.h264")
+# Segments named after their first frame's time (to the second) mustn't overwrite each other.
+check("{time:%Y%m%d-%H%M%S}.h264")
+
+picam2.close()
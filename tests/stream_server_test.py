@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+
+# Serve the H.264 stream on all addresses to a plain TCP client, a WebSocket client and a client that
+# never reads, and check that the stalled client falls behind without holding up the others, and that
+# the others start at a keyframe.
+
+import base64
+import os
+import socket
+import time
+
+from picamera2_contrib import Picamera2
+from picamera2_contrib.encoders import H264Encoder
+from picamera2_contrib.outputs import StreamServerOutput
+
+picam2 = Picamera2()
+config = picam2.create_video_configuration({"size": (1280, 720)}, controls={"FrameRate": 30})
+picam2.configure(config)
+
+# Listen on all addresses, which means both IPv4 and IPv6 (where there is IPv6) on the same free port.
+output = StreamServerOutput(port=0, max_queue_bytes=256 * 1024)
+picam2.start_recording(H264Encoder(5000000, iperiod=15), output)
+
+try:
+    socket.create_connection(("::1", output.port)).close()
+except ConnectionRefusedError:
+    print("Error: not listening for IPv6 on the same port")
+except OSError:
+    # There is no IPv6 here.
+    pass
+
+tcp = socket.create_connection(("127.0.0.1", output.port))
+stalled = socket.create_connection(("127.0.0.1", output.port))
+stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+ws = socket.create_connection(("127.0.0.1", output.port))
+key = base64.b64encode(os.urandom(16)).decode()
+ws.sendall(f"GET / HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+           f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n".encode())
+if not ws.recv(4096).startswith(b"HTTP/1.1 101"):
+    print("Error: WebSocket handshake failed")
+
+tcp.settimeout(1)
+start = time.monotonic()
+first = tcp.recv(65536)
+# The stream should start with a keyframe, which begins with the SPS.
+if first[:5] not in (b"\x00\x00\x00\x01\x67", b"\x00\x00\x00\x01\x27"):
+    print("Error: TCP client did not start at a keyframe")
+received = len(first)
+while time.monotonic() - start < 5:
+    received += len(tcp.recv(65536))
+    ws.recv(65536)
+stats = output.stats()
+print(stats, "TCP client received", received, "bytes")
+
+if stats["clients"] != 3:
+    print("Error: expected 3 clients")
+if stats["lag_events"] < 1 or stats["frames_dropped"] < 30:
+    print("Error: stalled client was not skipped")
+if received < 5000000 / 8:
+    print("Error: TCP client was held up")
+
+for sock in (tcp, stalled, ws):
+    sock.close()
+picam2.stop_recording()
+if output.num_clients:
+    print("Error: clients still connected after stopping")
+picam2.close()
@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+
+import time
+from threading import Thread
+
+from picamera2_contrib import BackpressurePolicy, Picamera2
+
+picam2 = Picamera2()
+config = picam2.create_preview_configuration(buffer_count=6)
+picam2.configure(config)
+
+fast = picam2.subscribe(max_queue=2, policy=BackpressurePolicy.DROP_OLDEST)
+slow = picam2.subscribe(max_queue=1, policy=BackpressurePolicy.DROP_NEWEST)
+counts = {"fast": 0, "slow": 0}
+
+
+def consumer(name, subscription, delay):
+    for request in subscription:
+        request.make_array("main")
+        counts[name] += 1
+        time.sleep(delay)
+
+
+threads = [Thread(target=consumer, args=("fast", fast, 0)),
+           Thread(target=consumer, args=("slow", slow, 0.5))]
+for thread in threads:
+    thread.start()
+
+picam2.start()
+time.sleep(5)
+frames = picam2.frames
+picam2.stop()
+
+picam2.unsubscribe(fast)
+picam2.unsubscribe(slow)
+for thread in threads:
+    thread.join()
+
+print("Frames", frames, "fast", fast.stats(), "slow", slow.stats())
+if counts["fast"] < frames * 0.8:
+    print("Error: fast subscriber was held up")
+if slow.dropped == 0:
+    print("Error: slow subscriber should have dropped frames")
+if fast.lag or slow.lag:
+    print("Error: subscriptions should be empty after stopping")
+
+picam2.close()
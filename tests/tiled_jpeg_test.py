@@ -0,0 +1,58 @@
+#!/usr/bin/python3
+
+# Check that tiled JPEGs decode to exactly the same image as ordinary ones, and show how encoding a
+# 64MP still scales with the number of threads. No camera is needed.
+
+import os
+import time
+
+import numpy as np
+import simplejpeg
+
+from picamera2_contrib.tiled_jpeg import (encode_jpeg_tiled,
+                                          encode_jpeg_yuv_planes_tiled)
+
+
+def test_image(height, width):
+    # Smooth gradients with some noise compress something like a real scene.
+    y, x = np.mgrid[0:height, 0:width]
+    image = 128 + 60 * np.sin(x / 37.0) + 50 * np.cos(y / 23.0)
+    image += np.random.default_rng(0).integers(-20, 20, (height, width))
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+# Awkward sizes check the partial MCUs at the bottom and right edges.
+for height, width, subsampling in [(1001, 1503, '420'), (999, 1500, '444'), (1080, 1920, '422')]:
+    grey = test_image(height, width)
+    image = np.stack([grey, grey[::-1], np.roll(grey, 7, axis=1)], axis=2)
+    whole = simplejpeg.encode_jpeg(image, 90, 'RGB', subsampling)
+    for threads in (2, 3, 4):
+        tiled = encode_jpeg_tiled(image, 90, 'RGB', subsampling, num_threads=threads)
+        if not np.array_equal(simplejpeg.decode_jpeg(whole), simplejpeg.decode_jpeg(tiled)):
+            print("Error: tiled", subsampling, "JPEG differs with", threads, "threads")
+
+height, width = 1088, 1920
+Y = test_image(height, width)
+U = test_image(height // 2, width // 2)
+V = U[::-1].copy()
+whole = simplejpeg.encode_jpeg_yuv_planes(Y, U, V, 90)
+tiled = encode_jpeg_yuv_planes_tiled(Y, U, V, 90, num_threads=4)
+if not np.array_equal(simplejpeg.decode_jpeg(whole), simplejpeg.decode_jpeg(tiled)):
+    print("Error: tiled YUV420 JPEG differs")
+
+# A 64MP still, which also needs more bands than threads to keep within the restart interval limit.
+height, width = 6944, 9152
+Y = test_image(height, width)
+U = test_image(height // 2, width // 2)
+V = U[::-1].copy()
+start = time.monotonic()
+whole = simplejpeg.encode_jpeg_yuv_planes(Y, U, V, 90)
+single = time.monotonic() - start
+print(f"64MP single-threaded: {single:.2f}s, {len(whole)} bytes")
+for threads in sorted({2, 4, os.cpu_count() or 1}):
+    start = time.monotonic()
+    tiled = encode_jpeg_yuv_planes_tiled(Y, U, V, 90, num_threads=threads)
+    elapsed = time.monotonic() - start
+    print(f"64MP with {threads} threads: {elapsed:.2f}s ({single / elapsed:.1f}x), {len(tiled)} bytes")
+if not np.array_equal(simplejpeg.decode_jpeg(whole), simplejpeg.decode_jpeg(tiled)):
+    print("Error: tiled 64MP JPEG differs")
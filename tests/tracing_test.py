@@ -0,0 +1,33 @@
+#!/usr/bin/python3
+
+import io
+import json
+import time
+
+from picamera2_contrib import FrameTracer, Picamera2
+from picamera2_contrib.encoders import H264Encoder
+from picamera2_contrib.outputs import FileOutput
+
+picam2 = Picamera2()
+picam2.configure(picam2.create_video_configuration())
+picam2.tracer = FrameTracer()
+picam2.pre_callback = lambda request: None
+encoder = H264Encoder(bitrate=5000000)
+picam2.start_recording(encoder, FileOutput(io.BytesIO()))
+time.sleep(3)
+picam2.stop_recording()
+
+stats = picam2.tracer.stats()
+for stage, values in stats.items():
+    print(stage, values)
+for stage in ("completed", "process", "pre_callback", "pre_callback_end", "encode", "encoded", "output_end"):
+    if stage not in stats:
+        print("Error:", stage, "stage was not traced")
+if picam2.tracer.stages[0] != "completed":
+    print("Error: stages are not in pipeline order", picam2.tracer.stages)
+
+trace = io.StringIO()
+picam2.tracer.export_chrome_trace(trace)
+if not json.loads(trace.getvalue())["traceEvents"]:
+    print("Error: Chrome trace has no events")
+picam2.close()